@@ -1,6 +1,6 @@
 import os
-from typing import List, Optional, Union
-from fastapi import FastAPI, File, UploadFile, Form, BackgroundTasks, WebSocket, WebSocketDisconnect
+from typing import List, Literal, Optional, Union
+from fastapi import FastAPI, File, UploadFile, Form, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -17,6 +17,13 @@ from tools.step040_tts import generate_all_wavs_under_folder
 from tools.step050_synthesize_video import synthesize_all_video_under_folder
 from tools.do_everything import do_everything
 from tools.utils import SUPPORT_VOICE
+from tools.profiler import get_aggregates, load_profile
+from tools.job_queue import JobQueue
+from tools.model_manager import model_manager
+from tools.model_warmup import readiness
+from tools.backends import list_backends
+from tools.translation_memory import get_translation_memory
+from tools.tts_cache import get_tts_cache
 
 app = FastAPI(title="Linly-Dubbing API", description="智能视频多语言AI配音/翻译工具 API")
 
@@ -29,8 +36,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 视频输出根目录，按文件夹读取结果的接口只允许访问其中的路径
+OUTPUT_ROOT = os.path.realpath(os.getenv('OUTPUT_ROOT', 'videos'))
+
 # 创建静态文件目录
-os.makedirs("videos", exist_ok=True)
+os.makedirs(OUTPUT_ROOT, exist_ok=True)
 os.makedirs("static", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -106,10 +116,95 @@ class DoEverythingRequest(BaseModel):
     target_resolution: str = "1080p"
     max_workers: int = 1
     max_retries: int = 3
+    subtitles_only: bool = False
+    subtitle_mode: Literal["soft", "burn"] = "soft"
+
+class JobRequest(BaseModel):
+    type: str
+    params: dict = {}
+
+# 任务队列：常驻工作线程，模型在任务之间复用；任务状态保存在 SQLite 中
+job_queue = JobQueue(os.getenv('JOB_DB_PATH', 'jobs.db'), max_workers=int(os.getenv('JOB_WORKERS', 1)))
+
+def run_do_everything(params, progress_callback):
+    request = DoEverythingRequest(**params)
+    return do_everything(
+        request.root_folder,
+        request.video_url,
+        request.num_videos,
+        request.resolution,
+        request.demucs_model,
+        request.device,
+        request.shifts,
+        request.asr_method,
+        request.whisper_model,
+        request.batch_size,
+        request.diarization,
+        request.whisper_min_speakers,
+        request.whisper_max_speakers,
+        request.translation_method,
+        request.translation_target_language,
+        request.tts_method,
+        request.tts_target_language,
+        request.voice,
+        request.subtitles,
+        request.speed_up,
+        request.fps,
+        None,  # background_music
+        request.bgm_volume,
+        request.video_volume,
+        request.target_resolution,
+        request.max_workers,
+        request.max_retries,
+        progress_callback,
+        subtitles_only=request.subtitles_only,
+        subtitle_mode=request.subtitle_mode
+    )
+
+def make_step_handler(request_model, func):
+    def handler(params, progress_callback):
+        progress_callback(0, '运行中')
+        return func(request_model(**params))
+    return handler
+
+def step_job(request_model, func):
+    """单步任务：没有中间进度，开始时报告一次运行中"""
+    return request_model, make_step_handler(request_model, func)
+
+# 任务类型 -> (请求模型, 任务处理函数)
+JOB_TYPES = {
+    'download': step_job(VideoDownloadRequest, lambda r: download_from_url(
+        r.video_url, r.output_folder, r.resolution, r.num_videos)),
+    'demucs': step_job(DemucsRequest, lambda r: separate_all_audio_under_folder(
+        r.folder, r.model, r.device, r.show_progress, r.shifts)),
+    'asr': step_job(ASRRequest, lambda r: transcribe_all_audio_under_folder(
+        r.folder, r.asr_method, r.whisper_model, r.device, r.batch_size, r.diarization, r.min_speakers, r.max_speakers)),
+    'translation': step_job(TranslationRequest, lambda r: translate_all_transcript_under_folder(
+        r.folder, r.method, r.target_language)),
+    'tts': step_job(TTSRequest, lambda r: generate_all_wavs_under_folder(
+        r.folder, r.method, r.target_language, r.voice)),
+    'synthesize': step_job(VideoSynthesisRequest, lambda r: synthesize_all_video_under_folder(
+        r.folder, r.subtitles, r.speed_up, r.fps, r.background_music, r.bgm_volume, r.video_volume, r.resolution)),
+    'do_everything': (DoEverythingRequest, run_do_everything),
+}
+
+for job_type, (_, handler) in JOB_TYPES.items():
+    job_queue.register(job_type, handler)
+
+def enqueue_job(job_type, request, message):
+    try:
+        job_id = job_queue.enqueue(job_type, request.dict())
+        return {"status": "success", "message": message, "job_id": job_id}
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
 
-# 后台任务处理
-async def process_task(task_func, *args, **kwargs):
-    return task_func(*args, **kwargs)
+@app.on_event("startup")
+async def start_job_queue():
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    job_queue.stop()
 
 # API 路由
 @app.get("/")
@@ -117,140 +212,60 @@ async def root():
     return {"message": "欢迎使用 Linly-Dubbing API"}
 
 @app.post("/api/download")
-async def api_download(request: VideoDownloadRequest, background_tasks: BackgroundTasks):
-    try:
-        background_tasks.add_task(
-            process_task, 
-            download_from_url, 
-            request.video_url, 
-            request.output_folder, 
-            request.resolution, 
-            request.num_videos
-        )
-        return {"status": "success", "message": "下载任务已启动"}
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+async def api_download(request: VideoDownloadRequest):
+    return enqueue_job('download', request, "下载任务已启动")
 
 @app.post("/api/demucs")
-async def api_demucs(request: DemucsRequest, background_tasks: BackgroundTasks):
-    try:
-        background_tasks.add_task(
-            process_task, 
-            separate_all_audio_under_folder, 
-            request.folder, 
-            request.model, 
-            request.device, 
-            request.show_progress, 
-            request.shifts
-        )
-        return {"status": "success", "message": "人声分离任务已启动"}
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+async def api_demucs(request: DemucsRequest):
+    return enqueue_job('demucs', request, "人声分离任务已启动")
 
 @app.post("/api/asr")
-async def api_asr(request: ASRRequest, background_tasks: BackgroundTasks):
-    try:
-        background_tasks.add_task(
-            process_task, 
-            transcribe_all_audio_under_folder, 
-            request.folder, 
-            request.asr_method, 
-            request.whisper_model, 
-            request.device, 
-            request.batch_size, 
-            request.diarization, 
-            request.min_speakers, 
-            request.max_speakers
-        )
-        return {"status": "success", "message": "语音识别任务已启动"}
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+async def api_asr(request: ASRRequest):
+    return enqueue_job('asr', request, "语音识别任务已启动")
 
 @app.post("/api/translation")
-async def api_translation(request: TranslationRequest, background_tasks: BackgroundTasks):
-    try:
-        background_tasks.add_task(
-            process_task, 
-            translate_all_transcript_under_folder, 
-            request.folder, 
-            request.method, 
-            request.target_language
-        )
-        return {"status": "success", "message": "翻译任务已启动"}
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+async def api_translation(request: TranslationRequest):
+    return enqueue_job('translation', request, "翻译任务已启动")
 
 @app.post("/api/tts")
-async def api_tts(request: TTSRequest, background_tasks: BackgroundTasks):
-    try:
-        background_tasks.add_task(
-            process_task, 
-            generate_all_wavs_under_folder, 
-            request.folder, 
-            request.method, 
-            request.target_language, 
-            request.voice
-        )
-        return {"status": "success", "message": "语音合成任务已启动"}
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+async def api_tts(request: TTSRequest):
+    return enqueue_job('tts', request, "语音合成任务已启动")
 
 @app.post("/api/synthesize")
-async def api_synthesize(request: VideoSynthesisRequest, background_tasks: BackgroundTasks):
-    try:
-        background_tasks.add_task(
-            process_task, 
-            synthesize_all_video_under_folder, 
-            request.folder, 
-            request.subtitles, 
-            request.speed_up, 
-            request.fps, 
-            request.background_music, 
-            request.bgm_volume, 
-            request.video_volume, 
-            request.resolution
-        )
-        return {"status": "success", "message": "视频合成任务已启动"}
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+async def api_synthesize(request: VideoSynthesisRequest):
+    return enqueue_job('synthesize', request, "视频合成任务已启动")
 
 @app.post("/api/do_everything")
-async def api_do_everything(request: DoEverythingRequest, background_tasks: BackgroundTasks):
+async def api_do_everything(request: DoEverythingRequest):
+    return enqueue_job('do_everything', request, "一键处理任务已启动")
+
+@app.post("/api/jobs")
+async def create_job(request: JobRequest):
+    """通用入队接口，params 与对应单步接口的请求体相同"""
+    if request.type not in JOB_TYPES:
+        return JSONResponse(status_code=400, content={"status": "error", "message": f"未知的任务类型: {request.type}"})
     try:
-        background_tasks.add_task(
-            process_task, 
-            do_everything, 
-            request.root_folder,
-            request.video_url,
-            request.num_videos,
-            request.resolution,
-            request.demucs_model,
-            request.device,
-            request.shifts,
-            request.asr_method,
-            request.whisper_model,
-            request.batch_size,
-            request.diarization,
-            request.whisper_min_speakers,
-            request.whisper_max_speakers,
-            request.translation_method,
-            request.translation_target_language,
-            request.tts_method,
-            request.tts_target_language,
-            request.voice,
-            request.subtitles,
-            request.speed_up,
-            request.fps,
-            None,  # background_music
-            request.bgm_volume,
-            request.video_volume,
-            request.target_resolution,
-            request.max_workers,
-            request.max_retries
-        )
-        return {"status": "success", "message": "一键处理任务已启动"}
+        params = JOB_TYPES[request.type][0](**request.params)
     except Exception as e:
-        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+        return JSONResponse(status_code=422, content={"status": "error", "message": str(e)})
+    return enqueue_job(request.type, params, "任务已加入队列")
+
+@app.get("/api/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = 100):
+    return {"status": "success", "jobs": job_queue.list(status, limit)}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "任务不存在"})
+    return {"status": "success", "job": job}
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if not job_queue.cancel(job_id):
+        return JSONResponse(status_code=400, content={"status": "error", "message": "任务不存在或已结束"})
+    return {"status": "success", "message": "已请求取消任务"}
 
 @app.post("/api/upload_background_music")
 async def upload_background_music(file: UploadFile = File(...)):
@@ -334,6 +349,59 @@ async def get_status(folder: str):
     except Exception as e:
         return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
 
+@app.get("/api/profile")
+async def get_profile_summary():
+    """进程启动以来各处理阶段的耗时、资源汇总"""
+    return {"status": "success", "stages": get_aggregates()}
+
+@app.get("/api/profile/{folder:path}")
+async def get_profile(folder: str):
+    """单个视频文件夹的 profile.json，只允许读取 OUTPUT_ROOT 下的文件夹"""
+    try:
+        folder = os.path.realpath(folder)
+        if os.path.commonpath([folder, OUTPUT_ROOT]) != OUTPUT_ROOT:
+            return JSONResponse(status_code=403, content={"status": "error", "message": "只能访问输出目录中的文件夹"})
+        profile_path = os.path.join(folder, "profile.json")
+        if not os.path.exists(profile_path):
+            return JSONResponse(status_code=404, content={"status": "error", "message": "性能记录不存在"})
+        return {"status": "success", "profile": load_profile(folder)}
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+
+@app.get("/api/backends")
+async def get_backends():
+    """ASR、翻译、语音合成各后端的元数据（支持语言、并发数、是否批量、采样率、是否已导入）"""
+    return {"status": "success",
+            "backends": {kind: [backend.metadata() for backend in list_backends(kind)]
+                         for kind in ['asr', 'translation', 'tts']}}
+
+@app.get("/api/models")
+async def get_models():
+    """已注册模型的加载状态、占用估计、加载/淘汰次数、显存/内存预算以及预热状态"""
+    return {"status": "success", **model_manager.stats(), "warmup": readiness()}
+
+@app.delete("/api/models/{name}")
+async def evict_model(name: str):
+    if not model_manager.evict(name):
+        return JSONResponse(status_code=400, content={"status": "error", "message": "模型未加载或正在使用中"})
+    return {"status": "success", "message": f"已卸载模型 {name}"}
+
+@app.get("/api/translation_memory")
+async def get_translation_memory_stats():
+    """翻译记忆的条目数、命中率（精确/归一化命中）和淘汰次数"""
+    memory = get_translation_memory()
+    if memory is None:
+        return {"status": "success", "enabled": False}
+    return {"status": "success", "enabled": True, **memory.stats()}
+
+@app.get("/api/tts_cache")
+async def get_tts_cache_stats():
+    """逐句语音合成缓存的条目数、占用空间和命中率"""
+    cache = get_tts_cache()
+    if cache is None:
+        return {"status": "success", "enabled": False}
+    return {"status": "success", "enabled": True, **cache.stats()}
+
 
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=6006)
\ No newline at end of file
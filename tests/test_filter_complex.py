@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from tools.step050_synthesize_video import build_filter_complex, escape_filter_path
+
+
+def get_token(text, terms):
+    """
+    按 ffmpeg av_get_token 的规则读取一个参数：反斜杠转义下一个字符，单引号内原样保留，遇到 terms 中的字符结束。
+    返回 (参数, 剩余部分)。
+    """
+    out, i = [], 0
+    while i < len(text) and text[i] not in terms:
+        c = text[i]
+        i += 1
+        if c == '\\' and i < len(text):
+            out.append(text[i])
+            i += 1
+        elif c == "'":
+            while i < len(text) and text[i] != "'":
+                out.append(text[i])
+                i += 1
+            i += 1
+        else:
+            out.append(c)
+    return ''.join(out), text[i:]
+
+
+def unescape_filter_argument(escaped):
+    """模拟 ffmpeg 对滤镜参数中路径的两次反转义：先按 filtergraph，再按滤镜选项（以 : 分隔）"""
+    argument, rest = get_token(escaped, '[],;')
+    assert rest == ''
+    value, rest = get_token(argument, ':')
+    assert rest == ''
+    return value
+
+
+@pytest.mark.parametrize('name', [
+    'subtitles.srt',
+    'with space.srt',
+    'C:colon.srt',
+    "it's.srt",
+    'back\\slash.srt',
+    'brackets[1],semi;colon.srt',
+    "all: of ' the [ ] , ; \\ things.srt",
+])
+def test_escape_filter_path_round_trips(tmp_path, name):
+    path = os.path.join(str(tmp_path), 'dir:with\'odd', name)
+    expected = os.path.abspath(path).replace('\\', '/')
+    assert unescape_filter_argument(escape_filter_path(path)) == expected
+
+
+def test_escape_filter_path_is_absolute():
+    escaped = escape_filter_path('relative/subtitles.srt')
+    assert unescape_filter_argument(escaped) == os.path.abspath('relative/subtitles.srt')
+
+
+def test_filter_complex_without_extras():
+    filter_complex, video_label, audio_label = build_filter_complex(1920, 1080, speed_up=1.0)
+    assert filter_complex == '[0:v]setpts=PTS/1.0[v0];[v0]scale=1920:1080[v];[1:a]atempo=1.0[a0]'
+    assert (video_label, audio_label) == ('v', 'a0')
+
+
+def test_filter_complex_with_watermark_subtitles_and_bgm():
+    filter_complex, video_label, audio_label = build_filter_complex(
+        1280, 720, speed_up=1.25, srt_path='sub:s.srt', watermark_input=2, bgm_input=3,
+        bgm_volume=0.3, video_volume=0.9)
+    chains = filter_complex.split(';')
+    assert chains[0] == '[0:v]setpts=PTS/1.25[v0]'
+    assert chains[1] == '[2:v]scale=iw*0.15:ih*0.15[wm]'
+    assert chains[2] == '[v0][wm]overlay=W-w-10:H-h-10[vwm]'
+    assert chains[3].startswith('[vwm]scale=1280:720,subtitles=')
+    assert chains[3].endswith('[v]')
+    assert f'FontSize={1280 // 128}' in chains[3]
+    assert chains[4:] == ['[1:a]atempo=1.25[a0]', '[a0]volume=0.9[a1]', '[3:a]volume=0.3[bgm]',
+                          '[a1][bgm]amix=inputs=2:duration=first[a]']
+    assert (video_label, audio_label) == ('v', 'a')
+
+
+def test_subtitle_path_is_escaped_in_filter_complex():
+    filter_complex, _, _ = build_filter_complex(1920, 1080, srt_path='a;b.srt')
+    assert escape_filter_path('a;b.srt') in filter_complex
+    # 按 ffmpeg 的规则拆分，路径中转义过的 ; 不会把 filtergraph 拆成多条链
+    chains, rest = [], filter_complex
+    while rest:
+        chain, rest = get_token(rest, ';')
+        chains.append(chain)
+        rest = rest[1:]
+    assert len(chains) == 3
+    assert chains[1].endswith(os.path.abspath('a;b.srt') + ":fontsdir=" + os.path.abspath('font')
+                              + ":force_style=FontName=SimHei,FontSize=15,PrimaryColour=&HFFFFFF,"
+                              "OutlineColour=&H000000,Outline=2,WrapStyle=2[v]")
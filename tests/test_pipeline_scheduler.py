@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from tools.pipeline_scheduler import PermanentStageError, run_pipeline, with_retries
+
+
+def test_results_follow_input_order():
+    stages = [
+        ('a', lambda x: x + 1),
+        # 让靠前的输入更慢，多线程时完成顺序与输入顺序不同
+        ('b', lambda x: time.sleep(0.01 * (5 - x)) or x * 10),
+    ]
+    results = run_pipeline(list(range(5)), stages, stage_workers={'b': 3})
+    assert results == [(True, (i + 1) * 10, '处理成功') for i in range(5)]
+
+
+def test_none_output_passes_input_through():
+    seen = []
+    stages = [('a', lambda x: None), ('b', lambda x: seen.append(x) or x)]
+    results = run_pipeline(['v1', 'v2'], stages)
+    assert sorted(seen) == ['v1', 'v2']
+    assert [output for _, output, _ in results] == ['v1', 'v2']
+
+
+def test_failure_stops_item_but_not_others():
+    later = []
+
+    def fail_on_two(x):
+        if x == 2:
+            raise RuntimeError('坏视频')
+        return x
+
+    stages = [('download', fail_on_two), ('video', lambda x: later.append(x) or x)]
+    results = run_pipeline([1, 2, 3], stages, stage_workers={'download': 2})
+    assert sorted(later) == [1, 3]
+    assert results[0] == (True, 1, '处理成功')
+    assert results[2] == (True, 3, '处理成功')
+    success, output, error = results[1]
+    assert not success and output is None
+    assert error.startswith('download失败: 坏视频')
+
+
+def test_on_stage_done_called_for_completed_stages_only():
+    calls = []
+    lock = threading.Lock()
+
+    def record(index, name):
+        with lock:
+            calls.append((index, name))
+
+    def fail_on_one(x):
+        if x == 1:
+            raise RuntimeError('失败')
+        return x
+
+    run_pipeline([0, 1], [('a', fail_on_one), ('b', lambda x: x)], on_stage_done=record)
+    assert sorted(calls) == [(0, 'a'), (0, 'b')]
+
+
+def test_empty_items():
+    assert run_pipeline([], [('a', lambda x: x), ('b', lambda x: x)], stage_workers={'a': 2, 'b': 2}) == []
+
+
+def test_with_retries_recovers_from_transient_failure():
+    attempts = []
+
+    def flaky(x):
+        attempts.append(x)
+        if len(attempts) < 3:
+            raise RuntimeError('暂时失败')
+        return x * 2
+
+    assert with_retries('asr', flaky, max_retries=3)(21) == 42
+    assert len(attempts) == 3
+
+
+def test_with_retries_raises_last_error():
+    attempts = []
+
+    def always_fail(x):
+        attempts.append(x)
+        raise ValueError(f'第 {len(attempts)} 次失败')
+
+    with pytest.raises(ValueError, match='第 2 次失败'):
+        with_retries('asr', always_fail, max_retries=2)(0)
+    assert len(attempts) == 2
+
+
+def test_with_retries_does_not_retry_permanent_errors():
+    attempts = []
+
+    def not_found(x):
+        attempts.append(x)
+        raise PermanentStageError('找不到视频')
+
+    with pytest.raises(PermanentStageError, match='找不到视频'):
+        with_retries('download', not_found, max_retries=5)(0)
+    assert len(attempts) == 1
+
+
+def test_retry_then_failure_propagates_through_pipeline():
+    attempts = {}
+
+    def tts(x):
+        attempts[x] = attempts.get(x, 0) + 1
+        if x == 'bad' or attempts[x] == 1:
+            raise RuntimeError(f'{x} 合成失败')
+        return f'{x}.wav'
+
+    stages = [('tts', with_retries('tts', tts, max_retries=2)), ('video', lambda x: x.replace('.wav', '.mp4'))]
+    results = run_pipeline(['good', 'bad'], stages)
+    assert results[0] == (True, 'good.mp4', '处理成功')
+    assert not results[1][0]
+    assert 'bad 合成失败' in results[1][2]
+    assert attempts == {'good': 2, 'bad': 2}
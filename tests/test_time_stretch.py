@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from tools.time_stretch import stretch_many, wsola
+
+SAMPLE_RATE = 24000
+
+
+def sine(seconds, frequency=220.0):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+@pytest.mark.parametrize('ratio', [0.6, 0.75, 0.999, 1.0, 1.05, 1.1, 1.7])
+@pytest.mark.parametrize('num_samples', [1, 7, 719, 720, 721, 24000, 24001])
+def test_wsola_output_length(ratio, num_samples):
+    wav = np.random.default_rng(0).standard_normal(num_samples).astype(np.float32)
+    out = wsola(wav, ratio, SAMPLE_RATE)
+    assert out.dtype == np.float32
+    assert len(out) == int(round(num_samples * ratio))
+
+
+def test_wsola_empty_input():
+    out = wsola(np.zeros(0, dtype=np.float32), 0.8, SAMPLE_RATE)
+    assert out.dtype == np.float32
+    assert len(out) == 0
+
+
+def test_wsola_ratio_one_returns_copy():
+    wav = sine(0.5)
+    out = wsola(wav, 1.0, SAMPLE_RATE)
+    np.testing.assert_array_equal(out, wav)
+    out[0] = 1
+    assert wav[0] != 1
+
+
+def test_wsola_keeps_level_and_pitch():
+    wav = sine(1.0)
+    out = wsola(wav, 0.8, SAMPLE_RATE)
+    # 去掉首尾半帧后幅度基本不变，频谱峰值仍在 220 Hz 附近（变速不变调）
+    body = out[SAMPLE_RATE // 20:-SAMPLE_RATE // 20]
+    assert np.max(np.abs(body)) == pytest.approx(0.5, abs=0.1)
+    spectrum = np.abs(np.fft.rfft(body))
+    peak = np.argmax(spectrum) * SAMPLE_RATE / len(body)
+    assert peak == pytest.approx(220, abs=5)
+
+
+def test_stretch_many_preserves_order():
+    wavs = [sine(0.2, 200), sine(0.3, 300), sine(0.1, 400)]
+    ratios = [0.7, 1.0, 1.1]
+    outs = stretch_many(list(zip(wavs, ratios)), SAMPLE_RATE, max_workers=1)
+    assert [len(out) for out in outs] == [int(round(len(wav) * ratio)) for wav, ratio in zip(wavs, ratios)]
+    for wav, ratio, out in zip(wavs, ratios, outs):
+        np.testing.assert_array_equal(out, wsola(wav, ratio, SAMPLE_RATE))
+
+
+def test_stretch_many_empty_jobs():
+    assert stretch_many([], SAMPLE_RATE) == []
@@ -0,0 +1,35 @@
+import json
+
+from tools.translation_journal import JOURNAL_NAME, TranslationJournal, prompt_hash
+
+
+def test_resume_after_restart(tmp_path):
+    texts = ['Hello', 'World']
+    hashes = [prompt_hash(text, 'p', '中文', 'LLM') for text in texts]
+    journal = TranslationJournal(str(tmp_path))
+    journal.record(0, 'Hello', '你好', hashes[0])
+    assert TranslationJournal(str(tmp_path)).resume(texts, hashes) == ['你好', None]
+
+
+def test_partial_last_line_is_truncated_before_appending(tmp_path):
+    texts = ['Hello', 'World']
+    hashes = [prompt_hash(text, 'p', '中文', 'LLM') for text in texts]
+    journal = TranslationJournal(str(tmp_path))
+    journal.record(0, 'Hello', '你好', hashes[0])
+    # 模拟写到一半时崩溃
+    path = tmp_path / JOURNAL_NAME
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"index": 1, "text": "Wor')
+
+    journal = TranslationJournal(str(tmp_path))
+    journal.record(1, 'World', '世界', hashes[1])
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['index'] for line in lines] == [0, 1]
+    assert TranslationJournal(str(tmp_path)).resume(texts, hashes) == ['你好', '世界']
+
+
+def test_partial_only_line_leaves_empty_journal(tmp_path):
+    (tmp_path / JOURNAL_NAME).write_text('{"index": 0', encoding='utf-8')
+    journal = TranslationJournal(str(tmp_path))
+    assert journal.entries == {}
+    assert (tmp_path / JOURNAL_NAME).read_text(encoding='utf-8') == ''
@@ -0,0 +1,44 @@
+from tools.step030_translation import parse_numbered_translations
+
+
+def test_parses_plain_json():
+    response = '{"1": "你好", "2": "世界"}'
+    assert parse_numbered_translations(response, [1, 2]) == {1: '你好', 2: '世界'}
+
+
+def test_ignores_text_and_code_fence_around_json():
+    response = '好的，以下是翻译：\n```json\n{"3": "第三句", "4": "第四句"}\n```\n希望有帮助。'
+    assert parse_numbered_translations(response, [3, 4]) == {3: '第三句', 4: '第四句'}
+
+
+def test_missing_numbers_are_left_out():
+    response = '{"1": "第一句", "3": "第三句"}'
+    assert parse_numbered_translations(response, [1, 2, 3]) == {1: '第一句', 3: '第三句'}
+
+
+def test_extra_numbers_are_ignored():
+    response = '{"1": "第一句", "2": "第二句", "9": "多出来的"}'
+    assert parse_numbered_translations(response, [1, 2]) == {1: '第一句', 2: '第二句'}
+
+
+def test_empty_and_non_string_values_are_left_out():
+    response = '{"1": "", "2": "   ", "3": null, "4": ["列表"], "5": 5, "6": "正常"}'
+    assert parse_numbered_translations(response, [1, 2, 3, 4, 5, 6]) == {6: '正常'}
+
+
+def test_values_are_stripped_and_newlines_removed():
+    response = '{"1": "  第一行\\n第二行  "}'
+    assert parse_numbered_translations(response, [1]) == {1: '第一行第二行'}
+
+
+def test_malformed_responses_return_empty():
+    assert parse_numbered_translations('', [1]) == {}
+    assert parse_numbered_translations('1. 你好\n2. 世界', [1, 2]) == {}
+    assert parse_numbered_translations('{"1": "你好", "2": }', [1, 2]) == {}
+    assert parse_numbered_translations('} 顺序颠倒 {', [1]) == {}
+
+
+def test_json_is_taken_from_first_to_last_brace():
+    # 外层包了一层列表也能取出其中的对象；两段独立的 JSON 拼在一起则无法解析
+    assert parse_numbered_translations('[{"1": "你好"}]', [1]) == {1: '你好'}
+    assert parse_numbered_translations('{"1": "a"} 和 {"2": "b"}', [1, 2]) == {}
@@ -0,0 +1,32 @@
+import wave
+
+import numpy as np
+
+from tools import utils
+from tools.utils import save_wav_norm
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as f:
+        frames = f.readframes(f.getnframes())
+        return f.getframerate(), f.getnchannels(), np.frombuffer(frames, dtype='<i2')
+
+
+def test_save_wav_norm_matches_whole_array_scaling(tmp_path, monkeypatch):
+    # 块大小不整除音频长度，检查分块边界
+    monkeypatch.setattr(utils, 'WAV_WRITE_CHUNK', 1000)
+    wav = np.random.default_rng(0).uniform(-0.4, 0.4, 4321).astype(np.float32)
+    path = str(tmp_path / 'out.wav')
+    save_wav_norm(wav, path, sample_rate=16000)
+    sample_rate, channels, data = read_wav(path)
+    assert (sample_rate, channels) == (16000, 1)
+    expected = (wav * (32767 / np.max(np.abs(wav)))).astype(np.int16)
+    np.testing.assert_array_equal(data, expected)
+
+
+def test_save_wav_norm_does_not_boost_quiet_audio(tmp_path):
+    quiet = np.full(10, 0.001, dtype=np.float32)
+    path = str(tmp_path / 'quiet.wav')
+    save_wav_norm(quiet, path)
+    # 峰值低于 0.01 时不放大到满幅
+    np.testing.assert_array_equal(read_wav(path)[2], (quiet * (32767 / 0.01)).astype(np.int16))
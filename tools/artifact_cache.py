@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+
+MANIFEST_NAME = 'manifest.json'
+_manifest_lock = threading.RLock()
+
+
+def load_manifest(folder):
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {'files': {}, 'stages': {}}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f'Manifest损坏，将重新生成: {manifest_path} ({e})')
+        return {'files': {}, 'stages': {}}
+    manifest.setdefault('files', {})
+    manifest.setdefault('stages', {})
+    return manifest
+
+
+def save_manifest(folder, manifest):
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def file_hash(folder, name, manifest=None):
+    """
+    计算 folder/name 的 sha256。
+    结果按 (size, mtime) 记在 manifest 中，文件未变化时不会重新读取大文件。
+    """
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    if manifest is not None:
+        entry = manifest['files'].get(name)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry['sha256']
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    digest = sha256.hexdigest()
+    if manifest is not None:
+        manifest['files'][name] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': digest}
+    return digest
+
+
+def stage_key(input_hashes, params):
+    payload = json.dumps({'inputs': input_hashes, 'params': params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_cached(folder, stage, inputs, params, outputs, adopt_existing=True):
+    """
+    判断 stage 的输出是否仍然有效：输入文件内容和参数的哈希与 manifest 记录一致，且输出文件都存在。
+    对于没有 manifest 记录但输出已存在的旧目录，adopt_existing 为 True 时直接按当前参数登记，沿用旧结果。
+    """
+    if not all(os.path.exists(os.path.join(folder, name)) for name in outputs):
+        return False
+    with _manifest_lock:
+        manifest = load_manifest(folder)
+        input_hashes = {name: file_hash(folder, name, manifest) for name in inputs}
+        key = stage_key(input_hashes, params)
+        entry = manifest['stages'].get(stage)
+        if entry is None:
+            if not adopt_existing:
+                return False
+            logger.info(f'{stage} 没有缓存记录，沿用已有输出: {folder}')
+            manifest['stages'][stage] = {'key': key, 'params': params, 'inputs': input_hashes,
+                                         'outputs': list(outputs), 'time': time.time()}
+            save_manifest(folder, manifest)
+            return True
+        save_manifest(folder, manifest)
+    if entry['key'] != key:
+        logger.info(f'{stage} 输入或参数已改变，需要重新计算: {folder}')
+        return False
+    logger.info(f'{stage} 命中缓存: {folder}')
+    return True
+
+
+def save_cache(folder, stage, inputs, params, outputs):
+    """stage 完成后登记输入哈希、参数和输出文件"""
+    with _manifest_lock:
+        manifest = load_manifest(folder)
+        input_hashes = {name: file_hash(folder, name, manifest) for name in inputs}
+        manifest['stages'][stage] = {'key': stage_key(input_hashes, params), 'params': params,
+                                     'inputs': input_hashes, 'outputs': list(outputs), 'time': time.time()}
+        save_manifest(folder, manifest)
+
+
+def invalidate(folder, stage):
+    with _manifest_lock:
+        manifest = load_manifest(folder)
+        if manifest['stages'].pop(stage, None) is not None:
+            save_manifest(folder, manifest)
+
+
+def load_record(folder, name, inputs=()):
+    """读取 manifest 中 name 下的附加记录；inputs 中任何文件的内容与记录时不同则返回 None"""
+    with _manifest_lock:
+        manifest = load_manifest(folder)
+        record = manifest.get('records', {}).get(name)
+        if record is None:
+            return None
+        input_hashes = {file: file_hash(folder, file, manifest) for file in inputs}
+        save_manifest(folder, manifest)
+    if record.get('inputs', {}) != input_hashes:
+        return None
+    return record
+
+
+def save_record(folder, name, record, inputs=()):
+    """在 manifest 的 records 下保存附加信息（例如分析结果），连同 inputs 的哈希"""
+    with _manifest_lock:
+        manifest = load_manifest(folder)
+        input_hashes = {file: file_hash(folder, file, manifest) for file in inputs}
+        manifest.setdefault('records', {})[name] = {**record, 'inputs': input_hashes, 'time': time.time()}
+        save_manifest(folder, manifest)
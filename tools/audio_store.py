@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import librosa
+import numpy as np
+from loguru import logger
+
+# 解码后的音频缓存：每个源文件只解码一次，按各阶段需要的采样率保存为 float32 内存映射文件，
+# 之后所有读取都直接映射同一份数据，不再重复解码和重采样
+AUDIO_STORE_FOLDER = '.audio_cache'
+
+# 源文件解码时一并生成的版本 (采样率, 是否单声道)：
+# 人声给 ASR（16k）、说话人参考和音量对齐（24k）使用，伴奏给混音（24k）使用
+DEFAULT_VARIANTS = {
+    'audio_vocals.wav': [(16000, True), (24000, True)],
+    'audio_instruments.wav': [(24000, True)],
+}
+
+# 已打开的内存映射，按最近使用顺序保留最多 AUDIO_STORE_OPEN_ARRAYS 个，
+# 避免常驻的 API 进程处理大量视频后一直持有所有映射
+_arrays = OrderedDict()
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _source_lock(path):
+    with _locks_lock:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def _variant_name(name, sample_rate, mono):
+    return f'{name}.{sample_rate}.{"mono" if mono else "multi"}.f32'
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _load_meta(meta_path):
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _open(path, shape):
+    # copy-on-write 映射：零拷贝，调用方就地修改也不会写回缓存文件
+    return np.memmap(path, dtype=np.float32, mode='c', shape=tuple(shape))
+
+
+def _decode(path, store_folder, name, variants, meta):
+    logger.info(f'解码音频: {path}')
+    wav, native_rate = librosa.load(path, sr=None, mono=False)
+    wav = np.atleast_2d(wav).astype(np.float32, copy=False)
+    mono_wav = None
+    for sample_rate, mono in variants:
+        key = _variant_name(name, sample_rate, mono)
+        if key in meta['variants']:
+            continue
+        if mono:
+            if mono_wav is None:
+                mono_wav = librosa.to_mono(wav)
+            data = mono_wav
+        else:
+            data = wav
+        if sample_rate != native_rate:
+            data = librosa.resample(data, orig_sr=native_rate, target_sr=sample_rate)
+        # 统一保存为 (采样点,) 或 (采样点, 声道)
+        data = data if mono else data.T
+        target = os.path.join(store_folder, key)
+        buffer = np.memmap(target + '.tmp', dtype=np.float32, mode='w+', shape=data.shape)
+        buffer[:] = data
+        buffer.flush()
+        del buffer
+        os.replace(target + '.tmp', target)
+        meta['variants'][key] = list(data.shape)
+
+
+def load_audio(path, sample_rate=24000, mono=True):
+    """
+    读取 path 在 sample_rate 下的 float32 数据，用法同 librosa.load，返回 (wav, sample_rate)。
+    结果缓存在同目录的 .audio_cache 中，源文件变化（大小或修改时间）后自动重新解码。
+    """
+    path = os.path.abspath(path)
+    folder, name = os.path.split(path)
+    store_folder = os.path.join(folder, AUDIO_STORE_FOLDER)
+    key = _variant_name(name, sample_rate, mono)
+    source = _source_stat(path)
+
+    with _source_lock(path):
+        cached = _arrays.get((path, key))
+        if cached is not None and cached[0] == source:
+            _remember((path, key), cached)
+            return cached[1], sample_rate
+
+        meta_path = os.path.join(store_folder, f'{name}.json')
+        meta = _load_meta(meta_path)
+        if meta is None or meta.get('source') != source:
+            if meta is not None:
+                logger.info(f'源音频已变化，重新解码: {path}')
+                for variant in meta.get('variants', {}):
+                    if os.path.exists(os.path.join(store_folder, variant)):
+                        os.remove(os.path.join(store_folder, variant))
+            meta = {'source': source, 'variants': {}}
+
+        if key not in meta['variants'] or not os.path.exists(os.path.join(store_folder, key)):
+            meta['variants'].pop(key, None)
+            os.makedirs(store_folder, exist_ok=True)
+            variants = list(dict.fromkeys(DEFAULT_VARIANTS.get(name, []) + [(sample_rate, mono)]))
+            _decode(path, store_folder, name, variants, meta)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, indent=2)
+
+        wav = _open(os.path.join(store_folder, key), meta['variants'][key])
+        _remember((path, key), (source, wav))
+        return wav, sample_rate
+
+
+def _remember(cache_key, entry):
+    with _locks_lock:
+        _arrays[cache_key] = entry
+        _arrays.move_to_end(cache_key)
+        while len(_arrays) > int(os.getenv('AUDIO_STORE_OPEN_ARRAYS', 16)):
+            _arrays.popitem(last=False)
+
+
+def clear_audio_store(folder):
+    """删除 folder 下的解码缓存并关闭对应的内存映射，视频合成完成后调用以释放磁盘空间"""
+    folder = os.path.abspath(folder)
+    with _locks_lock:
+        for cache_key in [k for k in _arrays if os.path.dirname(k[0]) == folder]:
+            del _arrays[cache_key]
+    shutil.rmtree(os.path.join(folder, AUDIO_STORE_FOLDER), ignore_errors=True)
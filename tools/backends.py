@@ -0,0 +1,126 @@
+import importlib
+import os
+import threading
+
+# 各步骤可选后端的注册表。后端模块只在第一次被选用时才导入，
+# 这样启动界面/服务时不会加载 whisperx、Coqui TTS、CosyVoice 等依赖，只用 EdgeTTS 的节点也不会导入它们
+_registry = {'asr': {}, 'translation': {}, 'tts': {}}
+_import_lock = threading.Lock()
+
+
+class Backend:
+    def __init__(self, kind, name, module, functions, languages=None, max_concurrency=1,
+                 batching=False, sample_rate=None, local_model=False, model_env=None, default_model=None):
+        self.kind = kind
+        self.name = name
+        self.module = module
+        self.functions = functions
+        self.languages = languages
+        self.max_concurrency = max_concurrency
+        # 是否支持一次请求处理多条（批量翻译、EdgeTTS 单事件循环并发等）
+        self.batching = batching
+        self.sample_rate = sample_rate
+        # 是否在本地加载模型（需要预热，受模型管理器的显存预算约束）
+        self.local_model = local_model
+        # 使用的模型名（从哪个环境变量读取及默认值），用于区分不同模型产生的缓存结果
+        self.model_env = model_env
+        self.default_model = default_model
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            with _import_lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.module, __package__)
+        return self._module
+
+    @property
+    def model_name(self):
+        if self.model_env:
+            return os.getenv(self.model_env, self.default_model)
+        return self.default_model
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def get(self, function):
+        """返回后端模块中的函数，第一次调用时才导入模块"""
+        if function not in self.functions:
+            raise ValueError(f'{self.kind} 后端 {self.name} 不支持 {function}')
+        return getattr(self.load(), self.functions[function])
+
+    def supports(self, language):
+        return self.languages is None or language in self.languages
+
+    def metadata(self):
+        return {
+            'name': self.name,
+            'languages': self.languages,
+            'max_concurrency': self.max_concurrency,
+            'batching': self.batching,
+            'sample_rate': self.sample_rate,
+            'local_model': self.local_model,
+            'model': self.model_name,
+            'functions': list(self.functions),
+            'loaded': self.loaded,
+        }
+
+
+def register_backend(kind, name, module, functions, **metadata):
+    """注册后端；module 可以是 tools 下的相对模块名（如 '.step044_tts_edge_tts'），也可以是绝对模块名"""
+    backend = Backend(kind, name, module, functions, **metadata)
+    _registry[kind][name] = backend
+    return backend
+
+
+def get_backend(kind, name):
+    if name not in _registry[kind]:
+        raise ValueError(f'Invalid {kind} method: {name}')
+    return _registry[kind][name]
+
+
+def list_backends(kind):
+    return list(_registry[kind].values())
+
+
+TTS_LANGUAGES = ['中文', 'English', 'Japanese', 'Korean', 'French', 'Polish', 'Spanish']
+
+# ASR
+register_backend('asr', 'WhisperX', '.step021_asr_whisperx',
+                 {'transcribe': 'whisperx_transcribe_audio', 'init': 'init_whisperx', 'init_diarize': 'init_diarize'},
+                 max_concurrency=1, batching=True, sample_rate=16000, local_model=True)
+register_backend('asr', 'FunASR', '.step022_asr_funasr',
+                 {'transcribe': 'funasr_transcribe_audio', 'init': 'init_funasr'},
+                 max_concurrency=1, batching=True, sample_rate=16000, local_model=True)
+
+# 翻译
+register_backend('translation', 'LLM', '.step032_translation_llm', {'chat': 'llm_response'},
+                 max_concurrency=1, local_model=True, model_env='MODEL_NAME', default_model='qwen/Qwen1.5-4B-Chat')
+register_backend('translation', 'OpenAI', '.step031_translation_openai', {'chat': 'openai_response'},
+                 max_concurrency=4, batching=True, model_env='MODEL_NAME', default_model='gpt-3.5-turbo')
+register_backend('translation', 'Ernie', '.step034_translation_ernie', {'chat': 'ernie_response'},
+                 max_concurrency=4, default_model='ernie-speed-128k')
+register_backend('translation', '阿里云-通义千问', '.step035_translation_qwen', {'chat': 'qwen_response'},
+                 max_concurrency=4, batching=True, model_env='QWEN_MODEL_ID', default_model='qwen-max-2025-01-25')
+register_backend('translation', 'Ollama', '.step036_translation_ollama', {'chat': 'ollama_response'},
+                 max_concurrency=4, batching=True, model_env='OLLAMA_MODEL', default_model='qwen2.5:14b')
+register_backend('translation', 'Google Translate', '.step033_translation_translator',
+                 {'translate': 'translator_response'}, max_concurrency=4)
+register_backend('translation', 'Bing Translate', '.step033_translation_translator',
+                 {'translate': 'translator_response'}, max_concurrency=4)
+
+# 语音合成
+# XTTS-v2 supports 17 languages, 这里只列出界面上提供的语言
+register_backend('tts', 'xtts', '.step042_tts_xtts', {'tts': 'tts', 'init': 'init_TTS'},
+                 languages=TTS_LANGUAGES, max_concurrency=1, sample_rate=24000, local_model=True)
+# zero_shot usage, <|zh|><|en|><|jp|><|yue|><|ko|> for Chinese/English/Japanese/Cantonese/Korean
+register_backend('tts', 'cosyvoice', '.step043_tts_cosyvoice', {'tts': 'tts', 'init': 'init_cosyvoice'},
+                 languages=['中文', '粤语', 'English', 'Japanese', 'Korean', 'French'],
+                 max_concurrency=1, sample_rate=22050, local_model=True)
+register_backend('tts', 'EdgeTTS', '.step044_tts_edge_tts', {'tts': 'tts', 'tts_many': 'tts_many'},
+                 languages=TTS_LANGUAGES, max_concurrency=8, batching=True, sample_rate=24000)
+register_backend('tts', 'F5-TTS', '.step045_tts_f5tts', {'tts': 'tts'},
+                 languages=TTS_LANGUAGES, max_concurrency=4, sample_rate=24000)
+register_backend('tts', 'bytedance', '.step041_tts_bytedance', {'tts': 'tts'},
+                 languages=[], max_concurrency=4, sample_rate=24000)
@@ -0,0 +1,137 @@
+import gc
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 语音识别的自动 batch size：按可用显存/内存估计能放下的最大 batch，从它开始尝试，
+# 显存或内存不足时减半重试，成功的值按 (模型, 设备, 计算类型) 记在本地缓存文件中，下次直接使用。
+# 同一份配置在 4 核的 CPU 机器和大显存的 GPU 机器上都能接近最优，不需要手动调整。
+
+# 每个 batch 单位的显存/内存占用估计（MB）：WhisperX 为每个 30 秒片段，FunASR 为每秒音频（只在 GPU 上调整）
+BATCH_ITEM_ESTIMATES_MB = {
+    'whisperx': 200,
+    'funasr': 8,
+}
+
+OOM_MESSAGES = ['out of memory', 'cuda_error_out_of_memory', "can't allocate memory", 'failed to allocate',
+                'bad_alloc', 'cublas_status_alloc_failed', 'cudnn_status_alloc_failed']
+
+_lock = threading.Lock()
+
+
+def _cache_path():
+    return os.getenv('BATCH_SIZE_CACHE_PATH', 'batch_sizes.json')
+
+
+def load_tuned():
+    path = _cache_path()
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_tuned(key, record):
+    path = _cache_path()
+    with _lock:
+        tuned = load_tuned()
+        tuned[key] = record
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(tuned, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def tuning_key(model, device, compute_type=None):
+    return f'{model}|{device}|{compute_type or "default"}'
+
+
+def is_oom_error(e):
+    if isinstance(e, MemoryError):
+        return True
+    try:
+        import torch
+        if isinstance(e, torch.cuda.OutOfMemoryError):
+            return True
+    except (ImportError, AttributeError):
+        pass
+    message = str(e).lower()
+    return any(text in message for text in OOM_MESSAGES)
+
+
+def available_memory_mb(device):
+    """当前可用的显存（cuda）或内存（cpu），无法获取时返回 None"""
+    if device == 'cuda':
+        import torch
+        if torch.cuda.is_available():
+            free, _ = torch.cuda.mem_get_info()
+            return free / 1024 ** 2
+        return None
+    if psutil is not None:
+        return psutil.virtual_memory().available / 1024 ** 2
+    return None
+
+
+def _release_memory(device):
+    gc.collect()
+    if device == 'cuda':
+        import torch
+        torch.cuda.empty_cache()
+
+
+def _needs_probe(record, limit):
+    # 没有记录，或者上次没有遇到内存不足而这次允许的上限更大
+    return record is None or not (record.get('oom') or limit <= record.get('limit', 0))
+
+
+def initial_batch_size(key, limit, item_mb, device, minimum=1):
+    """有缓存记录时使用记录的值，否则按当前可用内存的 80% 估计能放下的 batch"""
+    record = load_tuned().get(key)
+    if not _needs_probe(record, limit):
+        return max(minimum, min(record['batch_size'], limit))
+    free_mb = available_memory_mb(device)
+    if free_mb is None:
+        return limit
+    return max(minimum, min(limit, int(free_mb * 0.8 / item_mb)))
+
+
+def run_with_auto_batch(func, key, limit, item_mb, device, minimum=1):
+    """
+    调用 func(batch_size) 并返回其结果。batch_size 不超过 limit，显存或内存不足时减半重试，直到 minimum；
+    AUTO_BATCH_SIZE=0 时直接使用 limit。
+    """
+    if os.getenv('AUTO_BATCH_SIZE', '1') == '0':
+        return func(limit)
+    batch_size = initial_batch_size(key, limit, item_mb, device, minimum)
+    record = load_tuned().get(key)
+    oom = False
+    while True:
+        try:
+            t_start = time.time()
+            result = func(batch_size)
+            break
+        except Exception as e:
+            if not is_oom_error(e) or batch_size <= minimum:
+                raise
+            oom = True
+            smaller = max(minimum, batch_size // 2)
+            logger.warning(f'{key} batch_size={batch_size} 时内存不足，减小到 {smaller} 重试: {e}')
+            batch_size = smaller
+            _release_memory(device)
+    logger.info(f'{key} 使用 batch_size={batch_size}，用时 {time.time() - t_start:.2f} 秒')
+    if oom or _needs_probe(record, limit):
+        # 遇到过内存不足时记录的值视为上限，之后不再往上探测
+        _save_tuned(key, {'batch_size': batch_size, 'limit': limit, 'oom': oom, 'time': time.time()})
+    return result
+
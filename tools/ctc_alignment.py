@@ -0,0 +1,179 @@
+import os
+import time
+
+import numpy as np
+import torch
+from loguru import logger
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# WhisperX 强制对齐（CTC trellis + backtrack）的快速实现，替换 whisperx.alignment 中的同名函数。
+# 原实现按帧循环调用小的 torch 运算，回溯时每一帧都要 .item()，CPU 上长视频的对齐时间主要花在这里。
+# 这里用 numba（librosa 的依赖，通常已安装）编译同样的循环；没有 numba 时退回按帧向量化的 numpy 实现。
+# 两种实现的加法、比较顺序与原实现完全一致（float32），得到的 trellis 和对齐路径逐位相同。
+
+_reference = {}
+
+
+def _init_trellis(emission, num_tokens):
+    num_frame = emission.shape[0]
+    trellis = np.empty((num_frame + 1, num_tokens + 1), dtype=np.float32)
+    trellis[0, 0] = 0
+    # torch 在 CPU 上做 float32 的 cumsum 时用 double 累加，这里保持一致
+    trellis[1:, 0] = np.cumsum(emission[:, 0], dtype=np.float64).astype(np.float32)
+    trellis[0, -num_tokens:] = -np.inf
+    trellis[-num_tokens:, 0] = np.inf
+    return trellis
+
+
+def _fill_trellis_numpy(trellis, emission, tokens, blank_id):
+    emission_tokens = emission[:, tokens]
+    for t in range(emission.shape[0]):
+        np.maximum(trellis[t, 1:] + emission[t, blank_id], trellis[t, :-1] + emission_tokens[t],
+                   out=trellis[t + 1, 1:])
+
+
+def _backtrack_python(trellis, emission, tokens, blank_id):
+    j = trellis.shape[1] - 1
+    t_start = int(np.argmax(trellis[:, j]))
+    token_index, time_index, emitted = [], [], []
+    for t in range(t_start, 0, -1):
+        stayed = trellis[t - 1, j] + emission[t - 1, blank_id]
+        changed = trellis[t - 1, j - 1] + emission[t - 1, tokens[j - 1]]
+        token_index.append(j - 1)
+        time_index.append(t - 1)
+        # 与原实现相同，停留时取第 0 列的概率
+        emitted.append(tokens[j - 1] if changed > stayed else 0)
+        if changed > stayed:
+            j -= 1
+            if j == 0:
+                break
+    else:
+        return None
+    return np.array(token_index[::-1]), np.array(time_index[::-1]), np.array(emitted[::-1])
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _fill_trellis_numba(trellis, emission, tokens, blank_id):
+        for t in range(emission.shape[0]):
+            blank = emission[t, blank_id]
+            for j in range(1, tokens.shape[0] + 1):
+                stayed = trellis[t, j] + blank
+                changed = trellis[t, j - 1] + emission[t, tokens[j - 1]]
+                trellis[t + 1, j] = stayed if stayed >= changed else changed
+
+    @numba.njit(cache=True)
+    def _backtrack_numba(trellis, emission, tokens, blank_id):
+        j = trellis.shape[1] - 1
+        t_start = np.argmax(trellis[:, j])
+        token_index = np.empty(t_start, dtype=np.int64)
+        time_index = np.empty(t_start, dtype=np.int64)
+        emitted = np.empty(t_start, dtype=np.int64)
+        n = 0
+        for t in range(t_start, 0, -1):
+            stayed = trellis[t - 1, j] + emission[t - 1, blank_id]
+            changed = trellis[t - 1, j - 1] + emission[t - 1, tokens[j - 1]]
+            token_index[n] = j - 1
+            time_index[n] = t - 1
+            emitted[n] = tokens[j - 1] if changed > stayed else 0
+            n += 1
+            if changed > stayed:
+                j -= 1
+                if j == 0:
+                    return token_index[:n][::-1].copy(), time_index[:n][::-1].copy(), emitted[:n][::-1].copy()
+        return None
+
+
+def _as_numpy(emission):
+    if torch.is_tensor(emission):
+        emission = emission.detach().cpu().numpy()
+    return np.ascontiguousarray(emission, dtype=np.float32)
+
+
+def get_trellis(emission, tokens, blank_id=0):
+    """与 whisperx.alignment.get_trellis 相同的接口和结果"""
+    emission = _as_numpy(emission)
+    tokens = np.asarray(tokens, dtype=np.int64)
+    trellis = _init_trellis(emission, len(tokens))
+    if numba is not None:
+        _fill_trellis_numba(trellis, emission, tokens, blank_id)
+    else:
+        _fill_trellis_numpy(trellis, emission, tokens, blank_id)
+    return torch.from_numpy(trellis)
+
+
+def backtrack(trellis, emission, tokens, blank_id=0):
+    """与 whisperx.alignment.backtrack 相同的接口和结果，失败时返回 None"""
+    from whisperx.alignment import Point
+    trellis = _as_numpy(trellis)
+    emission = _as_numpy(emission)
+    tokens = np.asarray(tokens, dtype=np.int64)
+    if numba is not None:
+        result = _backtrack_numba(trellis, emission, tokens, blank_id)
+    else:
+        result = _backtrack_python(trellis, emission, tokens, blank_id)
+    if result is None:
+        return None
+    token_index, time_index, emitted = result
+    # 逐帧概率一次性计算，不再每帧调用 .item()
+    probs = torch.from_numpy(emission[time_index, emitted]).exp().tolist()
+    return [Point(int(j), int(t), prob) for j, t, prob in zip(token_index, time_index, probs)]
+
+
+def install_fast_alignment():
+    """用快速实现替换 whisperx.alignment 中的 get_trellis 和 backtrack（WHISPERX_FAST_ALIGN=0 时保持原实现）"""
+    if os.getenv('WHISPERX_FAST_ALIGN', '1') == '0':
+        return
+    import whisperx.alignment as alignment
+    if alignment.get_trellis is get_trellis:
+        return
+    _reference['get_trellis'] = alignment.get_trellis
+    _reference['backtrack'] = alignment.backtrack
+    alignment.get_trellis = get_trellis
+    alignment.backtrack = backtrack
+    logger.info(f'WhisperX 对齐使用快速实现（{"numba" if numba is not None else "numpy"}）')
+
+
+def benchmark(num_frame=3000, num_tokens=300, vocab_size=32, repeat=3, seed=0):
+    """
+    与 whisperx 原实现对比速度并检查结果是否逐位一致。
+    默认参数相当于一段 60 秒（50 帧/秒）、约 300 个字符的句子。
+    """
+    import whisperx.alignment as alignment
+    reference_trellis = _reference.get('get_trellis', alignment.get_trellis)
+    reference_backtrack = _reference.get('backtrack', alignment.backtrack)
+
+    rng = np.random.default_rng(seed)
+    emission = torch.log_softmax(torch.from_numpy(rng.standard_normal((num_frame, vocab_size), dtype=np.float32)) * 3, dim=-1)
+    tokens = rng.integers(1, vocab_size, num_tokens).tolist()
+
+    def timed(function, *args):
+        function(*args)  # 预热（numba 首次调用需要编译）
+        t_start = time.time()
+        for _ in range(repeat):
+            result = function(*args)
+        return result, (time.time() - t_start) / repeat
+
+    trellis_ref, t_ref = timed(reference_trellis, emission, tokens, 0)
+    trellis_fast, t_fast = timed(get_trellis, emission, tokens, 0)
+    path_ref, b_ref = timed(reference_backtrack, trellis_ref, emission, tokens, 0)
+    path_fast, b_fast = timed(backtrack, trellis_fast, emission, tokens, 0)
+
+    same_trellis = torch.equal(trellis_ref, trellis_fast)
+    same_path = [(p.token_index, p.time_index) for p in path_ref] == [(p.token_index, p.time_index) for p in path_fast]
+    max_score_diff = max(abs(a.score - b.score) for a, b in zip(path_ref, path_fast))
+    logger.info(f'{num_frame} 帧 x {num_tokens} 字符，后端 {"numba" if numba is not None else "numpy"}')
+    logger.info(f'get_trellis: 原实现 {t_ref * 1000:.1f} ms，快速实现 {t_fast * 1000:.1f} ms，加速 {t_ref / max(t_fast, 1e-9):.1f} 倍')
+    logger.info(f'backtrack: 原实现 {b_ref * 1000:.1f} ms，快速实现 {b_fast * 1000:.1f} ms，加速 {b_ref / max(b_fast, 1e-9):.1f} 倍')
+    logger.info(f'trellis 逐位一致: {same_trellis}，路径一致: {same_path}，逐帧概率最大差异: {max_score_diff:.3g}')
+    return same_trellis and same_path
+
+
+if __name__ == '__main__':
+    # python -m tools.ctc_alignment
+    benchmark()
+    benchmark(num_frame=500, num_tokens=60)
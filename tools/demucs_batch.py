@@ -0,0 +1,122 @@
+import os
+import random
+import time
+
+from loguru import logger
+
+from .demucs_parallel import load_mix
+
+# 短视频的跨视频批量分离：一个播放列表里常有很多 30~90 秒的短视频，逐个调用 apply_model 时
+# 每次只推理一个分段（batch=1），GPU 利用率很低，填充和分段的固定开销也占了大部分时间。
+# 这里把多个音频的分段放进同一个 batch 推理，再按原来的位置拼回各自的音轨。
+# 分段、填充、移位和交叉淡化的方式与 demucs.apply.apply_model(split=True) 完全相同。
+
+
+def _transition_weight(segment_length, transition_power=1.):
+    import torch
+    weight = torch.cat([torch.arange(1, segment_length // 2 + 1),
+                        torch.arange(segment_length - segment_length // 2, 0, -1)])
+    return (weight / weight.max()) ** transition_power
+
+
+def _apply_segments(model, chunks, overlap, batch_size, device, transition_power):
+    import torch
+    from demucs.apply import TensorChunk
+    from demucs.utils import center_trim
+    segment_length = int(model.samplerate * model.segment)
+    stride = int((1 - overlap) * segment_length)
+    weight = _transition_weight(segment_length, transition_power)
+
+    # 与 apply_model 一样按各分段自己的长度填充（HTDemucs 总是填充到训练时的长度），
+    # 填充后长度相同的分段才能放进同一个 batch
+    groups = {}
+    for index, chunk in enumerate(chunks):
+        for offset in range(0, chunk.length, stride):
+            piece = TensorChunk(chunk, offset, segment_length)
+            valid_length = model.valid_length(piece.length) if hasattr(model, 'valid_length') else piece.length
+            groups.setdefault(valid_length, []).append((index, offset, piece))
+
+    outs = [torch.zeros(len(model.sources), chunk.shape[-2], chunk.length) for chunk in chunks]
+    sum_weights = [torch.zeros(chunk.length) for chunk in chunks]
+    for valid_length, jobs in groups.items():
+        for start in range(0, len(jobs), batch_size):
+            batch_jobs = jobs[start:start + batch_size]
+            batch = torch.cat([piece.padded(valid_length) for _, _, piece in batch_jobs]).to(device)
+            with torch.no_grad():
+                batch_out = model(batch).cpu()
+            for (index, offset, piece), piece_out in zip(batch_jobs, batch_out):
+                piece_out = center_trim(piece_out, piece.length)
+                outs[index][..., offset:offset + piece.length] += weight[:piece.length] * piece_out
+                sum_weights[index][offset:offset + piece.length] += weight[:piece.length]
+    return [out / sum_weight for out, sum_weight in zip(outs, sum_weights)]
+
+
+def apply_model_batched(model, mixes, shifts=1, overlap=0.25, batch_size=8, device='cpu', transition_power=1.):
+    """
+    与 apply_model(split=True) 相同，但 mixes 是多段 (声道, 采样点) 的张量，
+    所有分段按 batch_size 一起推理，返回对应的 (音轨, 声道, 采样点) 张量列表。
+    """
+    from demucs.apply import BagOfModels, TensorChunk
+    if isinstance(model, BagOfModels):
+        # 与 apply_model 相同，每个子模型分别做随机移位，再按各音轨的权重平均
+        estimates = None
+        totals = [0.] * len(model.sources)
+        for sub_model, model_weights in zip(model.models, model.weights):
+            original_model_device = next(iter(sub_model.parameters())).device
+            outs = apply_model_batched(sub_model, mixes, shifts, overlap, batch_size, device, transition_power)
+            sub_model.to(original_model_device)
+            for k, inst_weight in enumerate(model_weights):
+                for out in outs:
+                    out[k] *= inst_weight
+                totals[k] += inst_weight
+            estimates = outs if estimates is None else [e + o for e, o in zip(estimates, outs)]
+        for estimate in estimates:
+            for k in range(len(totals)):
+                estimate[k] /= totals[k]
+        return estimates
+
+    model.to(device)
+    model.eval()
+    if not shifts:
+        return _apply_segments(model, [TensorChunk(mix[None]) for mix in mixes],
+                               overlap, batch_size, device, transition_power)
+    max_shift = int(0.5 * model.samplerate)
+    outs = [0.] * len(mixes)
+    for _ in range(shifts):
+        offset = random.randint(0, max_shift)
+        shifted = []
+        for mix in mixes:
+            length = mix.shape[-1]
+            padded_mix = TensorChunk(mix[None]).padded(length + 2 * max_shift)
+            shifted.append(TensorChunk(padded_mix, offset, length + max_shift - offset))
+        results = _apply_segments(model, shifted, overlap, batch_size, device, transition_power)
+        for index, result in enumerate(results):
+            outs[index] += result[..., max_shift - offset:]
+    return [out / shifts for out in outs]
+
+
+def separate_files(model, audio_paths, shifts=5, batch_size=None, device='cpu'):
+    """
+    批量分离多个音频文件，归一化方式与 demucs.api.Separator 相同，
+    返回与 audio_paths 对应的 {音轨名: (声道, 采样点) 的 float32 数组} 列表。
+    """
+    import torch
+    t_start = time.time()
+    batch_size = batch_size or int(os.getenv('DEMUCS_BATCH_SIZE', 8))
+    mixes, refs = [], []
+    for audio_path in audio_paths:
+        wav = torch.from_numpy(load_mix(audio_path))
+        ref = wav.mean(0)
+        mean, std = ref.mean(), ref.std() + 1e-8
+        mixes.append((wav - mean) / std)
+        refs.append((mean, std))
+    outs = apply_model_batched(model, mixes, shifts=shifts, batch_size=batch_size, device=device)
+    results = []
+    for out, (mean, std) in zip(outs, refs):
+        out *= std
+        out += mean
+        results.append({source: stem.numpy() for source, stem in zip(model.sources, out)})
+    seconds = sum(mix.shape[-1] for mix in mixes) / model.samplerate
+    logger.info(f'批量分离 {len(audio_paths)} 个音频（共 {seconds:.1f} 秒），batch_size={batch_size}，'
+                f'用时 {time.time() - t_start:.2f} 秒')
+    return results
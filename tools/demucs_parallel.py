@@ -0,0 +1,191 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from loguru import logger
+
+from .model_manager import model_manager
+
+# CPU 上的多进程分段人声分离：把整条音轨切成有重叠的长窗口，分给常驻进程池，
+# 每个工作进程各自加载一份 Demucs 模型，窗口结果按 apply_model 相同的三角权重交叉淡化拼接。
+# demucs 自带的并行只有 apply_model 里的线程池，受 GIL 限制，多核机器上基本只能用满一两个核。
+SAMPLE_RATE = 44100  # Demucs 预训练模型统一为 44.1k 双声道
+AUDIO_CHANNELS = 2
+# 每个工作进程的内存占用估计（htdemucs_ft 四个模型加上推理时的中间结果）
+POOL_WORKER_ESTIMATE_MB = 1500
+
+_pool = None
+_pool_config = {}
+_pool_lock = threading.Lock()
+
+# 工作进程中的模型
+_worker_model = None
+
+
+def parallel_workers(device='auto'):
+    """
+    分段并行的进程数：DEMUCS_WORKERS 未设置时，只在没有 GPU 的机器上启用，
+    按每个进程 DEMUCS_THREADS_PER_WORKER 个线程分配 CPU 核；结果不足 2 个进程时不启用（返回 1）。
+    """
+    import torch
+    workers = int(os.getenv('DEMUCS_WORKERS', 0))
+    if workers > 0:
+        return workers
+    if device == 'cuda' or (device == 'auto' and torch.cuda.is_available()):
+        return 1
+    threads = int(os.getenv('DEMUCS_THREADS_PER_WORKER', 4))
+    return max(1, (os.cpu_count() or 1) // max(1, threads))
+
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    import torch
+    from demucs.pretrained import get_model
+    torch.set_num_threads(threads)
+    _worker_model = get_model(model_name)
+    _worker_model.eval()
+
+
+def _separate_window(mix_path, shape, offset, length, shifts, overlap):
+    import torch
+    from demucs.apply import apply_model, TensorChunk
+    # 所有进程映射同一个共享内存文件，不复制整条音轨；
+    # 用整条音轨构造 TensorChunk，窗口边缘的 shifts 和内部分段可以取到窗口外的真实音频
+    mix = torch.from_numpy(np.memmap(mix_path, dtype=np.float32, mode='c', shape=shape))
+    chunk = TensorChunk(mix[None], offset, length)
+    with torch.no_grad():
+        out = apply_model(_worker_model, chunk, shifts=shifts, split=True, overlap=overlap, device='cpu')
+    return list(_worker_model.sources), out[0].numpy()
+
+
+def shutdown_pool():
+    global _pool, _pool_config
+    with _pool_lock:
+        if _pool is not None:
+            logger.info('关闭 Demucs 分段并行进程池')
+            _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+        _pool_config = {}
+
+
+def load_pool(model_name='htdemucs_ft', workers=None):
+    """启动（或复用）每个进程各加载一份模型的进程池，配置变化时重新启动"""
+    global _pool, _pool_config
+    workers = workers or parallel_workers('cpu')
+    threads = int(os.getenv('DEMUCS_THREADS_PER_WORKER', 4))
+    config = {'model_name': model_name, 'workers': workers, 'threads': threads}
+    if _pool is not None and _pool_config == config:
+        return _pool
+    shutdown_pool()
+    # 先在主进程中确认模型已下载，避免多个进程同时下载同一个文件
+    from demucs.pretrained import get_model
+    get_model(model_name)
+    logger.info(f'启动 Demucs 分段并行进程池: {workers} 个进程，每个 {threads} 个线程，模型 {model_name}')
+    # 主进程中已经初始化了 torch 的线程池，fork 出的子进程可能死锁，这里用 spawn
+    with _pool_lock:
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=_init_worker, initargs=(model_name, threads))
+        _pool_config = config
+    return _pool
+
+
+_pool_entry = model_manager.register('demucs_pool', shutdown_pool, device='cpu')
+
+
+def transition_weight(window_length, transition_power=1.):
+    """与 demucs.apply.apply_model 相同的三角形窗口权重"""
+    weight = np.concatenate([np.arange(1, window_length // 2 + 1),
+                             np.arange(window_length - window_length // 2, 0, -1)]).astype(np.float32)
+    return (weight / weight.max()) ** transition_power
+
+
+def _shared_path(prefix):
+    # /dev/shm 在内存中；没有时（非 Linux）退回系统临时目录
+    folder = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix='.f32', dir=folder)
+    os.close(fd)
+    return path
+
+
+def separate_windows(pool, mixes, shifts=5, window_seconds=None, overlap=0.1):
+    """
+    把若干段已归一化的混音（每段为 (声道, 采样点) 的 float32 数组）切成重叠窗口，在 load_pool 启动的进程池中并行分离，
+    返回与 mixes 对应的 {音轨名: (声道, 采样点)} 列表。
+    """
+    if window_seconds is None:
+        window_seconds = float(os.getenv('DEMUCS_WINDOW_SECONDS', 30))
+    window_length = int(window_seconds * SAMPLE_RATE)
+    stride = max(1, int((1 - overlap) * window_length))
+    weight = transition_weight(window_length)
+
+    mix_paths = []
+    try:
+        futures = []
+        for index, mix in enumerate(mixes):
+            mix_path = _shared_path('demucs_mix_')
+            mix_paths.append(mix_path)
+            buffer = np.memmap(mix_path, dtype=np.float32, mode='w+', shape=mix.shape)
+            buffer[:] = mix
+            buffer.flush()
+            del buffer
+            length = mix.shape[-1]
+            for offset in range(0, length, stride):
+                future = pool.submit(_separate_window, mix_path, mix.shape, offset, window_length, shifts, 0.25)
+                futures.append((index, offset, future))
+                if offset + window_length >= length:
+                    break
+
+        outputs = [None] * len(mixes)
+        sum_weights = [np.zeros(mix.shape[-1], dtype=np.float32) for mix in mixes]
+        sources = None
+        for done, (index, offset, future) in enumerate(futures, 1):
+            sources, chunk_out = future.result()
+            if outputs[index] is None:
+                outputs[index] = np.zeros((len(sources), ) + mixes[index].shape, dtype=np.float32)
+            chunk_length = chunk_out.shape[-1]
+            outputs[index][..., offset:offset + chunk_length] += weight[:chunk_length] * chunk_out
+            sum_weights[index][offset:offset + chunk_length] += weight[:chunk_length]
+            logger.info(f'Demucs 分段并行: {done}/{len(futures)} 个窗口完成')
+        results = []
+        for out, sum_weight in zip(outputs, sum_weights):
+            if out is None:
+                results.append({})
+                continue
+            out /= sum_weight
+            results.append(dict(zip(sources, out)))
+        return results
+    finally:
+        for mix_path in mix_paths:
+            os.remove(mix_path)
+
+
+def normalize_mix(wav):
+    """与 demucs.api.Separator.separate_tensor 相同的归一化，返回 (归一化后的数组, 均值, 标准差)"""
+    ref = wav.mean(0)
+    # torch 的 std 默认是无偏估计
+    mean, std = float(ref.mean()), float(ref.std(ddof=1)) + 1e-8
+    return ((wav - mean) / std).astype(np.float32), mean, std
+
+
+def load_mix(audio_path):
+    from demucs.audio import AudioFile
+    return AudioFile(audio_path).read(streams=0, samplerate=SAMPLE_RATE, channels=AUDIO_CHANNELS).numpy()
+
+
+def separate_file(audio_path, model_name='htdemucs_ft', shifts=5, workers=None):
+    """多进程分段分离一个音频文件，返回 {音轨名: (声道, 采样点) 的 float32 数组}"""
+    t_start = time.time()
+    workers = workers or parallel_workers('cpu')
+    _pool_entry.estimate_mb = workers * POOL_WORKER_ESTIMATE_MB
+    mix, mean, std = normalize_mix(load_mix(audio_path))
+    with model_manager.use('demucs_pool', lambda: load_pool(model_name, workers)):
+        separated = separate_windows(_pool, [mix], shifts)[0]
+    for stem in separated.values():
+        stem *= std
+        stem += mean
+    logger.info(f'Demucs 分段并行分离完成，用时 {time.time() - t_start:.2f} 秒')
+    return separated
@@ -3,34 +3,25 @@ import os
 import time
 import traceback
 import re
-import torch
 from loguru import logger
 from .step000_video_downloader import get_info_list_from_url, download_single_video, get_target_folder
-from .step010_demucs_vr import separate_all_audio_under_folder, init_demucs, release_model
+from .step010_demucs_vr import (separate_all_audio_under_folder, separate_short_audio_batched, init_demucs,
+                                extract_audio_from_video)
 from .step020_asr import transcribe_all_audio_under_folder
-from .step021_asr_whisperx import init_whisperx, init_diarize
-from .step022_asr_funasr import init_funasr
 from .step030_translation import translate_all_transcript_under_folder
 from .step040_tts import generate_all_wavs_under_folder
-from .step042_tts_xtts import init_TTS
-from .step043_tts_cosyvoice import init_cosyvoice
-from .step050_synthesize_video import synthesize_all_video_under_folder
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-# 跟踪模型初始化状态
-models_initialized = {
-    'demucs': False,
-    'xtts': False,
-    'cosyvoice': False,
-    'whisperx': False,
-    'diarize': False,
-    'funasr': False
-}
+from .step050_synthesize_video import SUBTITLE_MODES, synthesize_all_video_under_folder, synthesize_subtitled_video
+from .pipeline_scheduler import PermanentStageError, run_pipeline, with_retries
+from .profiler import profile_stage
+from .backends import get_backend
+from .model_warmup import warm_up, wait_for
+import threading
 
 
 def get_available_gpu_memory():
     """获取当前可用的GPU显存大小（GB）"""
     try:
+        import torch
         if torch.cuda.is_available():
             # 获取当前设备的可用显存
             free_memory = torch.cuda.get_device_properties(0).total_memory - torch.cuda.memory_allocated(0)
@@ -40,56 +31,157 @@ def get_available_gpu_memory():
         return 0  # 出错时返回0
 
 
-def initialize_models(tts_method, asr_method, diarization):
+def subtitle_separation_mode():
+    """只生成字幕时语音识别前的人声分离方式，默认 none（直接识别原音频）"""
+    return os.getenv('SUBTITLE_SEPARATION_MODE', 'none')
+
+
+def initialize_models(tts_method, asr_method, diarization, demucs_model='htdemucs_ft', device='auto', shifts=5,
+                      subtitles_only=False):
+    """
+    在后台并行预热所需的模型并立即返回，下载视频、提取音频可以与模型加载同时进行。
+    各阶段开始前只等待自己需要的模型（见 build_pipeline_stages），预热状态可通过 model_warmup.readiness() 查询。
+    只生成字幕时不加载语音合成模型，不做人声分离时也不加载 Demucs。
+    """
+    if not subtitles_only or subtitle_separation_mode() != 'none':
+        warm_up('demucs', lambda: init_demucs(demucs_model, device, shifts))
+
+    # 后端模块的导入也放在预热线程中进行
+    tts_backend = get_backend('tts', tts_method)
+    if not subtitles_only and tts_backend.local_model and 'init' in tts_backend.functions:
+        warm_up(tts_method, lambda: tts_backend.get('init')())
+
+    asr_backend = get_backend('asr', asr_method)
+    warm_up(asr_method, lambda: asr_backend.get('init')())
+    if diarization and 'init_diarize' in asr_backend.functions:
+        warm_up('diarize', lambda: asr_backend.get('init_diarize')())
+
+
+def build_pipeline_stages(root_folder, resolution,
+                          demucs_model, device, shifts,
+                          asr_method, whisper_model, batch_size, diarization, whisper_min_speakers, whisper_max_speakers,
+                          translation_method, translation_target_language,
+                          tts_method, tts_target_language, voice,
+                          subtitles, speed_up, fps, background_music, bgm_volume, video_volume,
+                          target_resolution, subtitles_only=False, subtitle_mode='soft'):
     """
-    初始化所需的模型。
-    只在第一次调用时初始化模型，避免重复加载。
+    按顺序返回处理单个视频的各个阶段 [(阶段名, 进度描述, 进度权重, 失败提示, 函数)]。
+    除下载阶段接收视频信息/本地路径外，其余阶段都接收并返回视频文件夹，最后的视频合成阶段返回输出视频路径。
     """
-    # 使用全局状态跟踪已初始化的模型
-    global models_initialized
+    # 已下载但还没有分离的视频文件夹。流水线中人声分离落后于下载时，排队的短视频在分离阶段一起批量推理
+    waiting_for_separation = []
+    waiting_lock = threading.Lock()
+
+    def downloaded(folder):
+        with waiting_lock:
+            waiting_for_separation.append(folder)
+        return folder
+
+    def download(info):
+        if isinstance(info, str) and info.endswith('.mp4'):
+            folder = os.path.dirname(info)
+            extract_audio_from_video(folder)
+            return downloaded(folder)
+        folder = get_target_folder(info, root_folder)
+        if folder is None:
+            raise PermanentStageError(f'无法获取视频目标文件夹: {info["title"]}')
+        with profile_stage(None, 'download') as record:
+            folder = download_single_video(info, root_folder, resolution)
+            record.folder = folder
+        if folder is None:
+            raise PermanentStageError(f'下载视频失败: {info["title"]}')
+        logger.info(f'处理视频: {folder}')
+        # 提取音频不依赖任何模型，在等待人声分离模型加载的同时完成
+        extract_audio_from_video(folder)
+        return downloaded(folder)
+
+    def separate(folder):
+        separation_mode = subtitle_separation_mode() if subtitles_only else None
+        if separation_mode != 'none':
+            wait_for('demucs')
+        with waiting_lock:
+            batch = list(dict.fromkeys([folder] + waiting_for_separation))
+            waiting_for_separation.clear()
+        if len(batch) > 1:
+            # 结果登记在各自的缓存中，这些视频到达分离阶段时直接命中缓存；批量失败时各自单独分离
+            try:
+                separate_short_audio_batched(batch, demucs_model, device, True, shifts, separation_mode)
+            except Exception as e:
+                logger.warning(f'批量人声分离失败，改为逐个分离: {e}')
+        status, vocals_path, _ = separate_all_audio_under_folder(
+            folder, model_name=demucs_model, device=device, progress=True, shifts=shifts,
+            separation_mode=separation_mode, vocals_only=subtitles_only)
+        logger.info(f'人声分离完成: {vocals_path}')
+        return folder
+
+    def transcribe(folder):
+        wait_for(asr_method)
+        if diarization:
+            wait_for('diarize')
+        status, result_json = transcribe_all_audio_under_folder(
+            folder, asr_method=asr_method, whisper_model_name=whisper_model, device=device,
+            batch_size=batch_size, diarization=diarization,
+            min_speakers=whisper_min_speakers,
+            max_speakers=whisper_max_speakers)
+        logger.info(f'语音识别完成: {status}')
+        return folder
+
+    def translate(folder):
+        status, summary, translation = translate_all_transcript_under_folder(
+            folder, method=translation_method, target_language=translation_target_language)
+        logger.info(f'翻译完成: {status}')
+        return folder
+
+    def synthesize_speech(folder):
+        wait_for(tts_method)
+        status, synth_path, _ = generate_all_wavs_under_folder(
+            folder, method=tts_method, target_language=tts_target_language, voice=voice)
+        logger.info(f'语音合成完成: {synth_path}')
+        return folder
+
+    def synthesize(folder):
+        status, output_video = synthesize_all_video_under_folder(
+            folder, subtitles=subtitles, speed_up=speed_up, fps=fps, resolution=target_resolution,
+            background_music=background_music, bgm_volume=bgm_volume, video_volume=video_volume)
+        logger.info(f'视频合成完成: {output_video}')
+        return output_video
+
+    def synthesize_subtitles(folder):
+        output_video = synthesize_subtitled_video(folder, subtitle_mode=subtitle_mode,
+                                                  resolution=target_resolution, fps=fps)
+        if output_video is None:
+            raise Exception(f'字幕视频合成失败: {folder}')
+        logger.info(f'字幕视频合成完成: {output_video}')
+        return output_video
+
+    if subtitles_only:
+        if subtitle_mode not in SUBTITLE_MODES:
+            raise ValueError(f'未知的 subtitle_mode: {subtitle_mode}，可选 {SUBTITLE_MODES}')
+        # 只生成字幕：不做语音合成，视频只封装字幕轨或烧录字幕
+        return [
+            ('download', "下载视频...", 10, '下载视频失败', download),
+            ('demucs', "准备识别音频...", 10, '人声分离失败', separate),
+            ('asr', "AI智能语音识别...", 35, '语音识别失败', transcribe),
+            ('translation', "字幕翻译...", 30, '翻译失败', translate),
+            ('video', "字幕合成...", 15, '字幕合成失败', synthesize_subtitles),
+        ]
+
+    return [
+        ('download', "下载视频...", 10, '下载视频失败', download),
+        ('demucs', "人声分离...", 15, '人声分离失败', separate),
+        ('asr', "AI智能语音识别...", 20, '语音识别失败', transcribe),
+        ('translation', "字幕翻译...", 25, '翻译失败', translate),
+        ('tts', "AI语音合成...", 20, '语音合成失败', synthesize_speech),
+        ('video', "视频合成...", 10, '视频合成失败', synthesize),
+    ]
 
-    with ThreadPoolExecutor() as executor:
-        try:
-            # Demucs模型初始化
-            if not models_initialized['demucs']:
-                executor.submit(init_demucs)
-                models_initialized['demucs'] = True
-                logger.info("Demucs模型初始化完成")
-            else:
-                logger.info("Demucs模型已初始化，跳过")
-
-            # TTS模型初始化
-            if tts_method == 'xtts' and not models_initialized['xtts']:
-                executor.submit(init_TTS)
-                models_initialized['xtts'] = True
-                logger.info("XTTS模型初始化完成")
-            elif tts_method == 'cosyvoice' and not models_initialized['cosyvoice']:
-                executor.submit(init_cosyvoice)
-                models_initialized['cosyvoice'] = True
-                logger.info("CosyVoice模型初始化完成")
-
-            # ASR模型初始化
-            if asr_method == 'WhisperX':
-                if not models_initialized['whisperx']:
-                    executor.submit(init_whisperx)
-                    models_initialized['whisperx'] = True
-                    logger.info("WhisperX模型初始化完成")
-                if diarization and not models_initialized['diarize']:
-                    executor.submit(init_diarize)
-                    models_initialized['diarize'] = True
-                    logger.info("Diarize模型初始化完成")
-            elif asr_method == 'FunASR' and not models_initialized['funasr']:
-                executor.submit(init_funasr)
-                models_initialized['funasr'] = True
-                logger.info("FunASR模型初始化完成")
 
-        except Exception as e:
-            stack_trace = traceback.format_exc()
-            logger.error(f"初始化模型失败: {str(e)}\n{stack_trace}")
-            # 出现错误时，重置初始化状态
-            models_initialized = {key: False for key in models_initialized}
-            release_model()  # 释放已加载的模型
-            raise
+# 只有下载（网络）失败时重试，其余阶段出错直接返回；串行和流水线两种方式使用同一策略
+RETRY_STAGES = ['download']
+
+
+def stage_with_retries(name, func, max_retries):
+    return with_retries(name, func, max_retries if name in RETRY_STAGES else 1)
 
 
 def process_video(info, root_folder, resolution,
@@ -98,161 +190,92 @@ def process_video(info, root_folder, resolution,
                   translation_method, translation_target_language,
                   tts_method, tts_target_language, voice,
                   subtitles, speed_up, fps, background_music, bgm_volume, video_volume,
-                  target_resolution, max_retries, progress_callback=None):
+                  target_resolution, max_retries, progress_callback=None, subtitles_only=False, subtitle_mode='soft'):
     """
     处理单个视频的完整流程，增加了进度回调函数
 
     Args:
         progress_callback: 回调函数，用于报告进度和状态，格式为 progress_callback(progress_percent, status_message)
+        subtitles_only: 只生成翻译字幕，不做语音合成；subtitle_mode 为 soft（封装字幕轨）或 burn（烧录进画面）
     """
-    local_time = time.localtime()
-
-    # 定义进度阶段和权重
-    stages = [
-        ("下载视频...", 10),  # 10%
-        ("人声分离...", 15),  # 15%
-        ("AI智能语音识别...", 20),  # 20%
-        ("字幕翻译...", 25),  # 25%
-        ("AI语音合成...", 20),  # 20%
-        ("视频合成...", 10)  # 10%
-    ]
-
-    current_stage = 0
-    progress_base = 0
+    stages = build_pipeline_stages(
+        root_folder, resolution,
+        demucs_model, device, shifts,
+        asr_method, whisper_model, batch_size, diarization, whisper_min_speakers, whisper_max_speakers,
+        translation_method, translation_target_language,
+        tts_method, tts_target_language, voice,
+        subtitles, speed_up, fps, background_music, bgm_volume, video_volume,
+        target_resolution, subtitles_only, subtitle_mode)
 
     # 报告初始进度
     if progress_callback:
         progress_callback(0, "准备处理...")
 
-    for retry in range(max_retries):
+    item = info
+    progress_base = 0
+    for name, stage_name, stage_weight, error_prefix, func in stages:
+        if progress_callback:
+            progress_callback(progress_base, stage_name)
         try:
-            # 报告进入下载阶段
-            stage_name, stage_weight = stages[current_stage]
-            if progress_callback:
-                progress_callback(progress_base, stage_name)
-
-            if isinstance(info, str) and info.endswith('.mp4'):
-                folder = os.path.dirname(info)
-                # os.rename(info, os.path.join(folder, 'download.mp4'))
-            else:
-                folder = get_target_folder(info, root_folder)
-                if folder is None:
-                    error_msg = f'无法获取视频目标文件夹: {info["title"]}'
-                    logger.warning(error_msg)
-                    return False, None, error_msg
-
-                folder = download_single_video(info, root_folder, resolution)
-                if folder is None:
-                    error_msg = f'下载视频失败: {info["title"]}'
-                    logger.warning(error_msg)
-                    return False, None, error_msg
-
-            logger.info(f'处理视频: {folder}')
-
-            # 完成下载阶段，进入人声分离阶段
-            current_stage += 1
-            progress_base += stage_weight
-            stage_name, stage_weight = stages[current_stage]
-            if progress_callback:
-                progress_callback(progress_base, stage_name)
-
-            try:
-                status, vocals_path, _ = separate_all_audio_under_folder(
-                    folder, model_name=demucs_model, device=device, progress=True, shifts=shifts)
-                logger.info(f'人声分离完成: {vocals_path}')
-            except Exception as e:
-                stack_trace = traceback.format_exc()
-                error_msg = f'人声分离失败: {str(e)}\n{stack_trace}'
-                logger.error(error_msg)
-                return False, None, error_msg
-
-            # 完成人声分离阶段，进入语音识别阶段
-            current_stage += 1
-            progress_base += stage_weight
-            stage_name, stage_weight = stages[current_stage]
-            if progress_callback:
-                progress_callback(progress_base, stage_name)
-
-            try:
-                status, result_json = transcribe_all_audio_under_folder(
-                    folder, asr_method=asr_method, whisper_model_name=whisper_model, device=device,
-                    batch_size=batch_size, diarization=diarization,
-                    min_speakers=whisper_min_speakers,
-                    max_speakers=whisper_max_speakers)
-                logger.info(f'语音识别完成: {status}')
-            except Exception as e:
-                stack_trace = traceback.format_exc()
-                error_msg = f'语音识别失败: {str(e)}\n{stack_trace}'
-                logger.error(error_msg)
-                return False, None, error_msg
-
-            # 完成语音识别阶段，进入翻译阶段
-            current_stage += 1
-            progress_base += stage_weight
-            stage_name, stage_weight = stages[current_stage]
-            if progress_callback:
-                progress_callback(progress_base, stage_name)
-
-            try:
-                status, summary, translation = translate_all_transcript_under_folder(
-                    folder, method=translation_method, target_language=translation_target_language)
-                logger.info(f'翻译完成: {status}')
-            except Exception as e:
-                stack_trace = traceback.format_exc()
-                error_msg = f'翻译失败: {str(e)}\n{stack_trace}'
-                logger.error(error_msg)
-                return False, None, error_msg
-
-            # 完成翻译阶段，进入语音合成阶段
-            current_stage += 1
-            progress_base += stage_weight
-            stage_name, stage_weight = stages[current_stage]
-            if progress_callback:
-                progress_callback(progress_base, stage_name)
-
-            try:
-                status, synth_path, _ = generate_all_wavs_under_folder(
-                    folder, method=tts_method, target_language=tts_target_language, voice=voice)
-                logger.info(f'语音合成完成: {synth_path}')
-            except Exception as e:
-                stack_trace = traceback.format_exc()
-                error_msg = f'语音合成失败: {str(e)}\n{stack_trace}'
-                logger.error(error_msg)
-                return False, None, error_msg
-
-            # 完成语音合成阶段，进入视频合成阶段
-            current_stage += 1
-            progress_base += stage_weight
-            stage_name, stage_weight = stages[current_stage]
-            if progress_callback:
-                progress_callback(progress_base, stage_name)
-
-            try:
-                status, output_video = synthesize_all_video_under_folder(
-                    folder, subtitles=subtitles, speed_up=speed_up, fps=fps, resolution=target_resolution,
-                    background_music=background_music, bgm_volume=bgm_volume, video_volume=video_volume)
-                logger.info(f'视频合成完成: {output_video}')
-            except Exception as e:
-                stack_trace = traceback.format_exc()
-                error_msg = f'视频合成失败: {str(e)}\n{stack_trace}'
-                logger.error(error_msg)
-                return False, None, error_msg
-
-            # 完成所有阶段，报告100%进度
-            if progress_callback:
-                progress_callback(100, "处理完成!")
-
-            return True, output_video, "处理成功"
+            item = stage_with_retries(name, func, max_retries)(item)
         except Exception as e:
             stack_trace = traceback.format_exc()
-            error_msg = f'处理视频时发生错误 {info["title"] if isinstance(info, dict) else info}: {str(e)}\n{stack_trace}'
+            error_msg = f'{error_prefix}: {str(e)}\n{stack_trace}'
             logger.error(error_msg)
-            if retry < max_retries - 1:
-                logger.info(f'尝试重试 {retry + 2}/{max_retries}...')
-            else:
-                return False, None, error_msg
+            return False, None, error_msg
+        progress_base += stage_weight
+
+    # 完成所有阶段，报告100%进度
+    if progress_callback:
+        progress_callback(100, "处理完成!")
+
+    return True, item, "处理成功"
 
-    return False, None, f"达到最大重试次数: {max_retries}"
+
+def process_videos_pipelined(videos_info, root_folder, resolution,
+                             demucs_model, device, shifts,
+                             asr_method, whisper_model, batch_size, diarization, whisper_min_speakers, whisper_max_speakers,
+                             translation_method, translation_target_language,
+                             tts_method, tts_target_language, voice,
+                             subtitles, speed_up, fps, background_music, bgm_volume, video_volume,
+                             target_resolution, max_workers, max_retries, progress_callback=None,
+                             subtitles_only=False, subtitle_mode='soft'):
+    """
+    多个视频按阶段流水线并行处理。
+    GPU 阶段（人声分离、语音识别、语音合成）各 1 个线程，下载和视频合成使用 max_workers 个线程，
+    翻译的线程数不超过所选后端的 max_concurrency（本地 LLM 为 1），这样不同视频可以同时处于不同阶段。
+    """
+    stages = build_pipeline_stages(
+        root_folder, resolution,
+        demucs_model, device, shifts,
+        asr_method, whisper_model, batch_size, diarization, whisper_min_speakers, whisper_max_speakers,
+        translation_method, translation_target_language,
+        tts_method, tts_target_language, voice,
+        subtitles, speed_up, fps, background_music, bgm_volume, video_volume,
+        target_resolution, subtitles_only, subtitle_mode)
+    stage_weights = {name: weight for name, _, weight, _, _ in stages}
+    # 使用后端的阶段不超过后端声明的并发数，避免多个线程同时调用同一个本地模型；
+    # 语音识别和语音合成本来就只有 1 个线程
+    stage_workers = {
+        'download': max_workers,
+        'translation': min(max_workers, get_backend('translation', translation_method).max_concurrency),
+        'video': max_workers,
+    }
+
+    progress_lock = threading.Lock()
+    done_weight = [0]
+
+    def on_stage_done(index, name):
+        if not progress_callback:
+            return
+        with progress_lock:
+            done_weight[0] += stage_weights[name]
+            percent = int(done_weight[0] / len(videos_info))
+        progress_callback(percent, f'视频 {index + 1}/{len(videos_info)}: {name} 完成')
+
+    return run_pipeline(videos_info,
+                        [(name, stage_with_retries(name, func, max_retries)) for name, _, _, _, func in stages],
+                        stage_workers=stage_workers, on_stage_done=on_stage_done)
 
 
 def do_everything(root_folder, url, num_videos=5, resolution='1080p',
@@ -263,12 +286,13 @@ def do_everything(root_folder, url, num_videos=5, resolution='1080p',
                   tts_method='xtts', tts_target_language='中文', voice='zh-CN-XiaoxiaoNeural',
                   subtitles=True, speed_up=1.00, fps=30,
                   background_music=None, bgm_volume=0.5, video_volume=1.0, target_resolution='1080p',
-                  max_workers=3, max_retries=5, progress_callback=None):
+                  max_workers=3, max_retries=5, progress_callback=None, subtitles_only=False, subtitle_mode='soft'):
     """
     处理整个视频处理流程，增加了进度回调函数
 
     Args:
         progress_callback: 回调函数，用于报告进度和状态，格式为 progress_callback(progress_percent, status_message)
+        subtitles_only: 只生成翻译字幕，跳过语音合成；subtitle_mode 为 soft（封装字幕轨，不重新编码）或 burn（烧录进画面）
     """
     try:
         success_list = []
@@ -284,6 +308,8 @@ def do_everything(root_folder, url, num_videos=5, resolution='1080p',
         logger.info(f"翻译: 方法={translation_method}, 目标语言={translation_target_language}")
         logger.info(f"语音合成: 方法={tts_method}, 目标语言={tts_target_language}, 声音={voice}")
         logger.info(f"视频合成: 字幕={subtitles}, 速度={speed_up}, FPS={fps}, 分辨率={target_resolution}")
+        if subtitles_only:
+            logger.info(f"只生成字幕: 方式={subtitle_mode}, 识别前人声分离={subtitle_separation_mode()}")
         logger.info("-" * 50)
 
         url = url.replace(' ', '').replace('，', '\n').replace(',', '\n')
@@ -293,7 +319,7 @@ def do_everything(root_folder, url, num_videos=5, resolution='1080p',
         try:
             if progress_callback:
                 progress_callback(5, "初始化模型中...")
-            initialize_models(tts_method, asr_method, diarization)
+            initialize_models(tts_method, asr_method, diarization, demucs_model, device, shifts, subtitles_only)
         except Exception as e:
             stack_trace = traceback.format_exc()
             logger.error(f"初始化模型失败: {str(e)}\n{stack_trace}")
@@ -331,7 +357,7 @@ def do_everything(root_folder, url, num_videos=5, resolution='1080p',
                     translation_method, translation_target_language,
                     tts_method, tts_target_language, voice,
                     subtitles, speed_up, fps, background_music, bgm_volume, video_volume,
-                    target_resolution, max_retries, progress_callback
+                    target_resolution, max_retries, progress_callback, subtitles_only, subtitle_mode
                 )
 
                 if success:
@@ -356,19 +382,20 @@ def do_everything(root_folder, url, num_videos=5, resolution='1080p',
                 if not videos_info:
                     return "获取视频信息失败，请检查URL是否正确", None
 
-                for info in videos_info:
-                    try:
-                        success, output_video, error_msg = process_video(
-                            info, root_folder, resolution,
-                            demucs_model, device, shifts,
-                            asr_method, whisper_model, batch_size, diarization, whisper_min_speakers,
-                            whisper_max_speakers,
-                            translation_method, translation_target_language,
-                            tts_method, tts_target_language, voice,
-                            subtitles, speed_up, fps, background_music, bgm_volume, video_volume,
-                            target_resolution, max_retries, progress_callback
-                        )
-
+                if max_workers > 1 and len(videos_info) > 1:
+                    logger.info(f'流水线并行处理 {len(videos_info)} 个视频, max_workers={max_workers}')
+                    results = process_videos_pipelined(
+                        videos_info, root_folder, resolution,
+                        demucs_model, device, shifts,
+                        asr_method, whisper_model, batch_size, diarization, whisper_min_speakers,
+                        whisper_max_speakers,
+                        translation_method, translation_target_language,
+                        tts_method, tts_target_language, voice,
+                        subtitles, speed_up, fps, background_music, bgm_volume, video_volume,
+                        target_resolution, max_workers, max_retries, progress_callback,
+                        subtitles_only, subtitle_mode
+                    )
+                    for info, (success, output_video, error_msg) in zip(videos_info, results):
                         if success:
                             success_list.append(info)
                             out_video = output_video
@@ -378,12 +405,35 @@ def do_everything(root_folder, url, num_videos=5, resolution='1080p',
                             error_details.append(f"{info['title'] if isinstance(info, dict) else info}: {error_msg}")
                             logger.error(
                                 f"处理视频失败: {info['title'] if isinstance(info, dict) else info}, 错误: {error_msg}")
-                    except Exception as e:
-                        stack_trace = traceback.format_exc()
-                        fail_list.append(info)
-                        error_details.append(f"{info['title'] if isinstance(info, dict) else info}: {str(e)}")
-                        logger.error(
-                            f"处理视频出错: {info['title'] if isinstance(info, dict) else info}, 错误: {str(e)}\n{stack_trace}")
+                else:
+                    for info in videos_info:
+                        try:
+                            success, output_video, error_msg = process_video(
+                                info, root_folder, resolution,
+                                demucs_model, device, shifts,
+                                asr_method, whisper_model, batch_size, diarization, whisper_min_speakers,
+                                whisper_max_speakers,
+                                translation_method, translation_target_language,
+                                tts_method, tts_target_language, voice,
+                                subtitles, speed_up, fps, background_music, bgm_volume, video_volume,
+                                target_resolution, max_retries, progress_callback, subtitles_only, subtitle_mode
+                            )
+
+                            if success:
+                                success_list.append(info)
+                                out_video = output_video
+                                logger.info(f"成功处理视频: {info['title'] if isinstance(info, dict) else info}")
+                            else:
+                                fail_list.append(info)
+                                error_details.append(f"{info['title'] if isinstance(info, dict) else info}: {error_msg}")
+                                logger.error(
+                                    f"处理视频失败: {info['title'] if isinstance(info, dict) else info}, 错误: {error_msg}")
+                        except Exception as e:
+                            stack_trace = traceback.format_exc()
+                            fail_list.append(info)
+                            error_details.append(f"{info['title'] if isinstance(info, dict) else info}: {str(e)}")
+                            logger.error(
+                                f"处理视频出错: {info['title'] if isinstance(info, dict) else info}, 错误: {str(e)}\n{stack_trace}")
             except Exception as e:
                 stack_trace = traceback.format_exc()
                 logger.error(f"获取视频列表失败: {str(e)}\n{stack_trace}")
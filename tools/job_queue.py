@@ -0,0 +1,175 @@
+import json
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+from loguru import logger
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    持久化任务队列：任务状态保存在 SQLite 中，服务重启后未完成的任务会重新排队。
+    固定数量的工作线程常驻在同一进程内，模型加载一次后在各任务之间复用。
+    取消是协作式的：排队中的任务直接取消，运行中的任务在下一次上报进度时中止。
+    """
+
+    def __init__(self, db_path='jobs.db', max_workers=1):
+        self.db_path = db_path
+        self.max_workers = max(1, max_workers)
+        self.handlers = {}
+        self.workers = []
+        self.condition = threading.Condition()
+        self.stopping = False
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress INTEGER DEFAULT 0,
+                    message TEXT DEFAULT '',
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    created REAL,
+                    started REAL,
+                    finished REAL
+                )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created)')
+
+    def register(self, job_type, handler):
+        """handler(params, progress_callback) -> result，result 需要可以 JSON 序列化"""
+        self.handlers[job_type] = handler
+
+    def start(self):
+        with self._connect() as conn:
+            # 上次退出时仍在运行的任务重新排队
+            restored = conn.execute('UPDATE jobs SET status=?, progress=0, message=? WHERE status=?',
+                                    (QUEUED, '服务重启，重新排队', RUNNING)).rowcount
+        if restored:
+            logger.info(f'恢复 {restored} 个未完成的任务')
+        self.stopping = False
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+
+    def enqueue(self, job_type, params):
+        if job_type not in self.handlers:
+            raise ValueError(f'未知的任务类型: {job_type}')
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute('INSERT INTO jobs (id, type, params, status, message, created) VALUES (?, ?, ?, ?, ?, ?)',
+                         (job_id, job_type, json.dumps(params, ensure_ascii=False), QUEUED, '排队中', time.time()))
+        with self.condition:
+            self.condition.notify()
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id=?', (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status=None, limit=100):
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute('SELECT * FROM jobs WHERE status=? ORDER BY created DESC LIMIT ?',
+                                    (status, limit)).fetchall()
+            else:
+                rows = conn.execute('SELECT * FROM jobs ORDER BY created DESC LIMIT ?', (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        with self._connect() as conn:
+            cancelled = conn.execute('UPDATE jobs SET status=?, message=?, finished=? WHERE id=? AND status=?',
+                                     (CANCELLED, '已取消', time.time(), job_id, QUEUED)).rowcount
+            if cancelled:
+                return True
+            return conn.execute('UPDATE jobs SET cancel_requested=1, message=? WHERE id=? AND status=?',
+                                ('正在取消...', job_id, RUNNING)).rowcount > 0
+
+    def _to_dict(self, row):
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def _claim(self):
+        with self._connect() as conn:
+            row = conn.execute('SELECT id FROM jobs WHERE status=? ORDER BY created LIMIT 1', (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            claimed = conn.execute('UPDATE jobs SET status=?, started=?, message=? WHERE id=? AND status=?',
+                                   (RUNNING, time.time(), '运行中', row['id'], QUEUED)).rowcount
+        return self.get(row['id']) if claimed else None
+
+    def _update(self, job_id, **fields):
+        columns = ', '.join(f'{key}=?' for key in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id=?', (*fields.values(), job_id))
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                if self.stopping:
+                    return
+            job = self._claim()
+            if job is None:
+                with self.condition:
+                    if not self.stopping:
+                        self.condition.wait(timeout=5)
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job['id']
+
+        def progress_callback(progress, message):
+            current = self.get(job_id)
+            if current and current['cancel_requested']:
+                raise JobCancelled(job_id)
+            self._update(job_id, progress=int(progress), message=message)
+
+        logger.info(f'开始任务 {job_id}: {job["type"]}')
+        try:
+            result = self.handlers[job['type']](job['params'], progress_callback)
+            # 处理函数内部可能吞掉了 JobCancelled，这里再确认一次
+            if self.get(job_id)['cancel_requested']:
+                raise JobCancelled(job_id)
+            self._update(job_id, status=SUCCEEDED, progress=100, message='完成',
+                         result=json.dumps(result, ensure_ascii=False, default=str), finished=time.time())
+            logger.info(f'任务完成 {job_id}')
+        except JobCancelled:
+            self._update(job_id, status=CANCELLED, message='已取消', finished=time.time())
+            logger.info(f'任务已取消 {job_id}')
+        except Exception as e:
+            self._update(job_id, status=FAILED, message='失败', error=f'{str(e)}\n{traceback.format_exc()}',
+                         finished=time.time())
+            logger.error(f'任务失败 {job_id}: {str(e)}')
@@ -0,0 +1,207 @@
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from loguru import logger
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 各模型的显存/内存占用估计（MB），加载后以实测值为准
+DEFAULT_ESTIMATES_MB = {
+    'demucs': 1500,
+    'whisperx': 4500,
+    'whisperx_align': 1300,
+    'whisperx_diarize': 600,
+    'funasr': 2000,
+    'xtts': 3500,
+    'cosyvoice': 4000,
+    'llm': 9000,
+}
+
+
+class ModelEntry:
+    def __init__(self, name, unload, estimate_mb, device):
+        self.name = name
+        self.unload = unload
+        self.estimate_mb = estimate_mb
+        self._device = device
+        self.size_mb = None
+        self.loaded = False
+        self.refcount = 0
+        self.lock = threading.RLock()
+        self.stats = {'loads': 0, 'hits': 0, 'evictions': 0, 'load_time': 0.0, 'last_used': None}
+
+    @property
+    def device(self):
+        if self._device == 'auto':
+            import torch
+            self._device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        return self._device
+
+    @property
+    def pool(self):
+        return 'vram' if self.device == 'cuda' else 'ram'
+
+    @property
+    def memory_mb(self):
+        return self.size_mb if self.size_mb else self.estimate_mb
+
+
+class ModelManager:
+    """
+    统一管理各步骤的模型：按显存/内存预算做 LRU 淘汰，正在使用（引用计数 > 0）的模型不会被淘汰。
+    各模块仍然在自己的全局变量中保存模型，加载函数保持幂等；这里只负责决定何时加载、何时卸载。
+    预算通过 MODEL_VRAM_BUDGET_GB / MODEL_RAM_BUDGET_GB 配置，默认是总显存的 90% 和总内存的 70%。
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lru = OrderedDict()
+        self.lock = threading.RLock()
+        self._budgets_mb = None
+        self.active_loads = 0
+
+    @property
+    def budgets_mb(self):
+        # 第一次需要时才计算，导入本模块不需要导入 torch
+        if self._budgets_mb is None:
+            self._budgets_mb = {'vram': self._default_budget('vram'), 'ram': self._default_budget('ram')}
+        return self._budgets_mb
+
+    def _default_budget(self, pool):
+        import torch
+        if pool == 'vram':
+            if os.getenv('MODEL_VRAM_BUDGET_GB'):
+                return float(os.getenv('MODEL_VRAM_BUDGET_GB')) * 1024
+            if torch.cuda.is_available():
+                return torch.cuda.get_device_properties(0).total_memory / (1024 ** 2) * 0.9
+            return 0
+        if os.getenv('MODEL_RAM_BUDGET_GB'):
+            return float(os.getenv('MODEL_RAM_BUDGET_GB')) * 1024
+        if psutil is not None:
+            return psutil.virtual_memory().total / (1024 ** 2) * 0.7
+        return float('inf')
+
+    def register(self, name, unload, estimate_mb=None, device='auto'):
+        """unload() 负责把模块全局变量中的模型置空，显存回收由管理器统一完成"""
+        with self.lock:
+            if name not in self.entries:
+                self.entries[name] = ModelEntry(name, unload, estimate_mb or DEFAULT_ESTIMATES_MB.get(name, 1000), device)
+            return self.entries[name]
+
+    def _used_mb(self, pool, exclude=None):
+        return sum(entry.memory_mb for entry in self.entries.values()
+                   if entry.loaded and entry.pool == pool and entry.name != exclude)
+
+    def _make_room(self, entry):
+        budget = self.budgets_mb[entry.pool]
+        while True:
+            # 只在挑选时持有全局锁，卸载时不持有，避免与正在加载/使用的线程互相等待
+            with self.lock:
+                if self._used_mb(entry.pool, entry.name) + entry.memory_mb <= budget:
+                    return
+                victim = next((self.entries[name] for name in self.lru
+                               if name != entry.name and self.entries[name].loaded
+                               and self.entries[name].refcount == 0 and self.entries[name].pool == entry.pool), None)
+            if victim is None:
+                logger.warning(f'{entry.pool} 预算不足以加载 {entry.name}，且没有可以淘汰的空闲模型')
+                return
+            logger.info(f'为加载 {entry.name} 淘汰模型 {victim.name}')
+            if self._unload(victim):
+                victim.stats['evictions'] += 1
+
+    def _unload(self, entry):
+        with entry.lock:
+            with self.lock:
+                if not entry.loaded or entry.refcount > 0:
+                    return False
+                entry.loaded = False
+                self.lru.pop(entry.name, None)
+            try:
+                entry.unload()
+            except Exception as e:
+                logger.warning(f'卸载模型 {entry.name} 出错: {e}')
+        gc.collect()
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return True
+
+    @contextmanager
+    def use(self, name, load):
+        """
+        在使用模型期间持有引用。load() 是模块自己的加载函数：
+        模型未加载或配置变化时由它（重新）加载，已加载时应直接返回。
+        """
+        import torch
+        entry = self.entries[name]
+        with entry.lock:
+            if entry.loaded:
+                entry.stats['hits'] += 1
+            else:
+                self._make_room(entry)
+            measure = entry.device == 'cuda' and torch.cuda.is_available()
+            with self.lock:
+                self.active_loads += 1
+                exclusive = self.active_loads == 1
+            before = torch.cuda.memory_allocated() if measure else 0
+            t_start = time.time()
+            try:
+                load()
+            finally:
+                with self.lock:
+                    self.active_loads -= 1
+            if not entry.loaded:
+                entry.stats['loads'] += 1
+                entry.stats['load_time'] = round(entry.stats['load_time'] + time.time() - t_start, 2)
+                # 只有没有其它模型同时加载时，显存增量才能算作这个模型的占用
+                if measure and exclusive:
+                    delta_mb = (torch.cuda.memory_allocated() - before) / (1024 ** 2)
+                    entry.size_mb = delta_mb if delta_mb > 16 else None
+                entry.loaded = True
+            with self.lock:
+                entry.refcount += 1
+                entry.stats['last_used'] = time.time()
+                self.lru[name] = True
+                self.lru.move_to_end(name)
+        try:
+            yield
+        finally:
+            with self.lock:
+                entry.refcount -= 1
+
+    def mark_unloaded(self, name):
+        """模块自行释放了模型（例如出错后重新加载）时调用"""
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None:
+                entry.loaded = False
+                self.lru.pop(name, None)
+
+    def evict(self, name):
+        entry = self.entries.get(name)
+        return entry is not None and self._unload(entry)
+
+    def evict_all(self):
+        for name in list(self.lru):
+            self.evict(name)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'budgets_mb': {pool: round(budget, 1) for pool, budget in self.budgets_mb.items()},
+                'used_mb': {pool: round(self._used_mb(pool), 1) for pool in self.budgets_mb},
+                'models': {name: {'loaded': entry.loaded, 'device': entry.device, 'refcount': entry.refcount,
+                                  'memory_mb': round(entry.memory_mb, 1), 'measured': entry.size_mb is not None,
+                                  **entry.stats}
+                           for name, entry in self.entries.items()},
+            }
+
+
+model_manager = ModelManager()
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+PENDING = 'pending'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+_tasks = {}
+_lock = threading.Lock()
+_executor = None
+
+
+class WarmupTask:
+    def __init__(self, name):
+        self.name = name
+        self.state = PENDING
+        self.error = None
+        self.future = None
+        self.started = None
+        self.finished = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=int(os.getenv('WARMUP_WORKERS', 4)),
+                                       thread_name_prefix='warmup')
+    return _executor
+
+
+def _run(task, loader):
+    task.state = LOADING
+    task.started = time.time()
+    try:
+        loader()
+    except Exception as e:
+        task.state = FAILED
+        task.error = str(e)
+        logger.error(f'模型 {task.name} 预热失败: {e}')
+        raise
+    finally:
+        task.finished = time.time()
+    task.state = READY
+    logger.info(f'模型 {task.name} 预热完成，用时 {task.finished - task.started:.2f} 秒')
+
+
+def warm_up(name, loader):
+    """
+    在后台线程中执行 loader() 预热模型并立即返回对应的 future。
+    同名任务正在进行时直接复用；已结束的任务会重新提交（loader 是幂等的，模型仍在内存中时很快返回，
+    被模型管理器淘汰过的则会重新加载）。
+    """
+    with _lock:
+        task = _tasks.get(name)
+        if task is not None and task.state in (PENDING, LOADING):
+            return task.future
+        task = WarmupTask(name)
+        _tasks[name] = task
+        task.future = _get_executor().submit(_run, task, loader)
+        return task.future
+
+
+def wait_for(name, timeout=None):
+    """
+    阶段开始前等待所需模型预热完成，没有对应的预热任务时立即返回。
+    预热失败时不抛出异常，返回 False，由阶段自己按需加载并报告真正的错误。
+    """
+    with _lock:
+        task = _tasks.get(name)
+    if task is None:
+        return True
+    if task.state in (PENDING, LOADING):
+        logger.info(f'等待模型 {name} 预热完成...')
+    try:
+        task.future.result(timeout)
+        return True
+    except Exception as e:
+        logger.warning(f'模型 {name} 预热未成功，将在使用时重新加载: {e}')
+        return False
+
+
+def readiness():
+    """各模型的预热状态：pending / loading / ready / failed"""
+    with _lock:
+        return {name: {'state': task.state, 'error': task.error,
+                       'load_time': round(task.finished - task.started, 2) if task.finished and task.started else None}
+                for name, task in _tasks.items()}
@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+
+import numpy as np
+from loguru import logger
+
+# 人声分离前的快速音乐检测：播客、讲座、口播这类没有背景音乐的视频不需要完整的 htdemucs_ft 分离。
+# 只看“停顿”里有什么：纯语音的停顿是安静的底噪（能量低、频谱平坦、没有周期性），
+# 有背景音乐时停顿里仍然是持续的、有音高的声音；再加上整体的低能量帧比例和低频能量占比。
+ANALYSIS_SAMPLE_RATE = 16000
+FRAME = 1024  # 64 ms，不重叠
+BLOCK_FRAMES = 4096  # 每次向量化处理的帧数，限制长音频的内存占用
+# 周期性搜索的基频范围 50~500 Hz
+MIN_LAG = ANALYSIS_SAMPLE_RATE // 500
+MAX_LAG = ANALYSIS_SAMPLE_RATE // 50
+BASS_HZ = 150
+
+# 各项特征映射到 [0, 1] 的区间 (纯语音, 明显有音乐) 和权重
+SCORE_RANGES = {
+    'pause_harmonicity': ((0.3, 0.55), 0.3),
+    'pause_flatness_db': ((-10.0, -25.0), 0.3),
+    'pause_level_db': ((-45.0, -15.0), 0.15),
+    'low_energy_ratio': ((0.45, 0.15), 0.15),
+    'bass_ratio': ((0.01, 0.15), 0.1),
+}
+
+SEPARATION_MODES = ['auto', 'full', 'fast', 'none']
+
+
+def frame_features(wav):
+    """
+    逐帧计算能量、频谱平坦度、周期性（功率谱自相关的最大值）和低频能量占比。
+    wav 为 ANALYSIS_SAMPLE_RATE 下的单声道音频，返回每项一个 (帧数,) 数组。
+    """
+    num_frames = len(wav) // FRAME
+    window = np.hanning(FRAME).astype(np.float32)
+    bass_bins = int(BASS_HZ * FRAME / ANALYSIS_SAMPLE_RATE) + 1
+    features = {name: np.empty(num_frames, dtype=np.float32)
+                for name in ['energy', 'flatness', 'harmonicity', 'bass']}
+    for start in range(0, num_frames, BLOCK_FRAMES):
+        stop = min(start + BLOCK_FRAMES, num_frames)
+        frames = np.asarray(wav[start * FRAME:stop * FRAME], dtype=np.float32).reshape(-1, FRAME)
+        power = np.square(np.abs(np.fft.rfft(frames * window, axis=1))) + 1e-10
+        total = power.sum(axis=1)
+        features['energy'][start:stop] = total
+        features['flatness'][start:stop] = np.exp(np.log(power).mean(axis=1)) / power.mean(axis=1)
+        # 功率谱的逆变换就是自相关
+        autocorr = np.fft.irfft(power, axis=1)
+        features['harmonicity'][start:stop] = autocorr[:, MIN_LAG:MAX_LAG].max(axis=1) / autocorr[:, 0]
+        features['bass'][start:stop] = power[:, :bass_bins].sum(axis=1) / total
+    return features
+
+
+def _scale(value, low, high):
+    return float(np.clip((value - low) / (high - low), 0, 1))
+
+
+def analyze_music(wav):
+    """返回各项统计量和综合的 music_score（0 表示纯语音，1 表示明显有背景音乐）"""
+    features = frame_features(wav)
+    energy = features['energy']
+    if len(energy) < 16:
+        return {'music_score': 1.0, 'seconds': round(len(wav) / ANALYSIS_SAMPLE_RATE, 1)}
+    energy_db = 10 * np.log10(energy)
+    loud_db = np.percentile(energy_db, 90)
+    # 能量最低的 20% 帧视为停顿
+    pause = energy_db <= np.percentile(energy_db, 20)
+    loud = energy_db >= np.percentile(energy_db, 50)
+    rms = np.sqrt(energy)
+    scores = {
+        'pause_level_db': float(np.median(energy_db[pause]) - loud_db),
+        'pause_harmonicity': float(np.median(features['harmonicity'][pause])),
+        'pause_flatness_db': float(10 * np.log10(np.median(features['flatness'][pause]) + 1e-10)),
+        'low_energy_ratio': float(np.mean(rms < 0.5 * rms.mean())),
+        'bass_ratio': float(np.median(features['bass'][loud])),
+    }
+    music_score = sum(weight * _scale(scores[name], low, high)
+                      for name, ((low, high), weight) in SCORE_RANGES.items())
+    scores = {name: round(value, 4) for name, value in scores.items()}
+    scores['music_score'] = round(music_score / sum(weight for _, weight in SCORE_RANGES.values()), 4)
+    scores['seconds'] = round(len(wav) / ANALYSIS_SAMPLE_RATE, 1)
+    return scores
+
+
+def analyze_audio_file(audio_path):
+    import librosa
+    t_start = time.time()
+    # audio.wav 只在这里读一次，直接解码，不写入解码缓存
+    wav, _ = librosa.load(audio_path, sr=ANALYSIS_SAMPLE_RATE, mono=True)
+    scores = analyze_music(wav)
+    logger.info(f'音乐检测完成，用时 {time.time() - t_start:.2f} 秒: {scores}')
+    return scores
+
+
+def choose_separation(scores):
+    """
+    根据 music_score 选择分离方式：
+    full 按配置的模型完整分离，fast 用单个 htdemucs 模型且不做 shifts，none 不分离。
+    阈值由 SEPARATION_FULL_THRESHOLD 和 SEPARATION_NONE_THRESHOLD 调整。
+    """
+    full_threshold = float(os.getenv('SEPARATION_FULL_THRESHOLD', 0.5))
+    none_threshold = float(os.getenv('SEPARATION_NONE_THRESHOLD', 0.3))
+    music_score = scores['music_score']
+    if music_score >= full_threshold:
+        return 'full'
+    if music_score >= none_threshold:
+        return 'fast'
+    return 'none'
+
+
+if __name__ == '__main__':
+    # python -m tools.music_detection videos/xxx/audio.wav
+    for path in sys.argv[1:]:
+        result = analyze_audio_file(path)
+        print(path, choose_separation(result), result)
@@ -0,0 +1,96 @@
+import queue
+import threading
+import traceback
+
+from loguru import logger
+
+_STOP = object()
+
+
+class PermanentStageError(Exception):
+    """重试也不会成功的失败（例如找不到视频、下载结果为空），with_retries 遇到时直接抛出"""
+
+
+def with_retries(name, func, max_retries):
+    """包装阶段函数：失败后重试，最多执行 max_retries 次，最后一次的异常或 PermanentStageError 原样抛出"""
+    def run(item):
+        for retry in range(max_retries):
+            try:
+                return func(item)
+            except PermanentStageError:
+                raise
+            except Exception as e:
+                if retry == max_retries - 1:
+                    raise
+                logger.warning(f'{name} 失败，尝试重试 {retry + 2}/{max_retries}: {str(e)}')
+    return run
+
+
+def run_pipeline(items, stages, stage_workers=None, queue_size=2, on_stage_done=None):
+    """
+    以流水线方式处理多个视频：每个阶段有独立的工作线程和有界队列，
+    使第 N+1 个视频的人声分离可以和第 N 个视频的翻译、第 N-1 个视频的合成同时进行。
+
+    Args:
+        items: 待处理的输入列表（视频信息或视频路径）
+        stages: [(阶段名, 函数)]，函数接收上一阶段的输出并返回本阶段的输出，失败时抛出异常
+        stage_workers: {阶段名: 线程数}，未指定的阶段为 1
+        queue_size: 阶段之间队列的容量，限制积压在内存/磁盘上的中间结果
+        on_stage_done: 回调 on_stage_done(index, stage_name)，每完成一个阶段调用一次
+
+    Returns:
+        按输入顺序排列的 [(success, output, error_msg)]
+    """
+    stage_workers = stage_workers or {}
+    queues = [queue.Queue()] + [queue.Queue(maxsize=max(1, queue_size)) for _ in stages[1:]] + [queue.Queue()]
+    results = [(False, None, '未处理')] * len(items)
+    results_lock = threading.Lock()
+    threads = []
+
+    def worker(stage_index, name, func, remaining):
+        in_queue, out_queue = queues[stage_index], queues[stage_index + 1]
+        while True:
+            task = in_queue.get()
+            if task is _STOP:
+                break
+            index, payload = task
+            try:
+                output = func(payload)
+                if on_stage_done:
+                    on_stage_done(index, name)
+            except Exception as e:
+                error_msg = f'{name}失败: {str(e)}\n{traceback.format_exc()}'
+                logger.error(error_msg)
+                with results_lock:
+                    results[index] = (False, None, error_msg)
+                continue
+            if stage_index == len(stages) - 1:
+                with results_lock:
+                    results[index] = (True, output, '处理成功')
+            else:
+                out_queue.put((index, payload if output is None else output))
+        # 本阶段最后一个退出的线程负责通知下一阶段结束
+        with remaining['lock']:
+            remaining['count'] -= 1
+            last = remaining['count'] == 0
+        if last and stage_index < len(stages) - 1:
+            for _ in range(max(1, stage_workers.get(stages[stage_index + 1][0], 1))):
+                out_queue.put(_STOP)
+
+    for stage_index, (name, func) in enumerate(stages):
+        count = max(1, stage_workers.get(name, 1))
+        remaining = {'count': count, 'lock': threading.Lock()}
+        for _ in range(count):
+            thread = threading.Thread(target=worker, args=(stage_index, name, func, remaining),
+                                      name=f'pipeline-{name}', daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    for index, item in enumerate(items):
+        queues[0].put((index, item))
+    for _ in range(max(1, stage_workers.get(stages[0][0], 1))):
+        queues[0].put(_STOP)
+
+    for thread in threads:
+        thread.join()
+    return results
@@ -0,0 +1,234 @@
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from loguru import logger
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROFILE_NAME = 'profile.json'
+_lock = threading.Lock()
+_local = threading.local()
+# 进程内各阶段的汇总统计，供 api.py 查询
+_aggregates = {}
+# 正在运行的阶段。torch 的显存峰值统计是整个进程共用的，流水线并行时各阶段会互相重置和读取，
+# 所以只有从开始到结束都没有其它阶段同时运行的阶段才记录 gpu_peak_mb，其余记为 None
+_active = set()
+_sampler = None
+RSS_SAMPLE_INTERVAL = 0.2
+
+
+def _rss_mb():
+    """当前进程的 RSS（MB），没有 psutil 时返回 None"""
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss / (1024 ** 2)
+
+
+def _sample_loop():
+    # 有阶段在运行时定期采样 RSS，记录每个阶段运行期间的峰值（ru_maxrss 是整个进程生命周期的峰值，不能按阶段区分）
+    global _sampler
+    while True:
+        with _lock:
+            if not _active:
+                _sampler = None
+                return
+            records = list(_active)
+        rss = _rss_mb()
+        for record in records:
+            record.observe_rss(rss)
+        time.sleep(RSS_SAMPLE_INTERVAL)
+
+
+def _io_bytes():
+    """返回进程累计 (读字节数, 写字节数)"""
+    if psutil is not None:
+        try:
+            counters = psutil.Process().io_counters()
+            return counters.read_bytes, counters.write_bytes
+        except (AttributeError, psutil.Error):
+            pass
+    try:
+        with open('/proc/self/io', 'r') as f:
+            values = dict(line.split(': ') for line in f.read().splitlines())
+        return int(values['read_bytes']), int(values['write_bytes'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _gpu_available():
+    torch = sys.modules.get('torch')
+    return torch is not None and torch.cuda.is_available()
+
+
+class StageRecord:
+    def __init__(self, folder, stage):
+        self.folder = folder
+        self.stage = stage
+        self.items = None
+        self.unit = None
+        self.exclusive = False
+        self.cached = False
+        self.peak_rss = None
+
+    def set_items(self, items, unit='items'):
+        self.items = items
+        self.unit = unit
+
+    def observe_rss(self, rss):
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+
+
+def record_items(items, unit='items'):
+    """在被 profiled 包装的阶段函数内部调用，记录处理的条目数（句子、片段、块等）"""
+    record = getattr(_local, 'record', None)
+    if record is not None:
+        record.set_items(items, unit)
+
+
+def record_cached():
+    """在被 profiled 包装的阶段函数内部调用，表示本次直接使用了缓存结果，不覆盖之前实际运行的性能记录"""
+    record = getattr(_local, 'record', None)
+    if record is not None:
+        record.cached = True
+
+
+@contextmanager
+def profile_stage(folder, stage):
+    """
+    记录一个阶段的墙钟时间、CPU 时间、内存、显存峰值、读写字节数和处理条目数，
+    追加到 folder/profile.json，并累加到进程内汇总。
+    folder 可以为 None，在阶段内部确定目录后再赋值给 record.folder。
+    peak_rss_mb 是阶段运行期间采样到的 RSS 峰值；RSS、CPU 时间和读写字节数都按整个进程统计，
+    overlapped 为 True 时说明期间有其它阶段同时运行，这些值包含了其它阶段的部分。
+    显存峰值只在该阶段独占运行时记录（见 _active）。
+    """
+    global _sampler
+    record = StageRecord(folder, stage)
+    previous, _local.record = getattr(_local, 'record', None), record
+    gpu = _gpu_available()
+    with _lock:
+        for other in _active:
+            other.exclusive = False
+        record.exclusive = not _active
+        _active.add(record)
+        if gpu and record.exclusive:
+            import torch
+            torch.cuda.reset_peak_memory_stats()
+        if _sampler is None and psutil is not None:
+            _sampler = threading.Thread(target=_sample_loop, name='profile-rss', daemon=True)
+            _sampler.start()
+    record.observe_rss(_rss_mb())
+    read_start, write_start = _io_bytes()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    error = None
+    try:
+        yield record
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        _local.record = previous
+        rss = _rss_mb()
+        record.observe_rss(rss)
+        read_end, write_end = _io_bytes()
+        result = {
+            'wall_time': round(time.perf_counter() - wall_start, 3),
+            # CPU 时间是整个进程的，流水线并行时包含其它线程
+            'cpu_time': round(time.process_time() - cpu_start, 3),
+            'rss_mb': round(rss, 1) if rss is not None else None,
+            'peak_rss_mb': round(record.peak_rss, 1) if record.peak_rss is not None else None,
+            'gpu_peak_mb': None,
+            'bytes_read': read_end - read_start if read_start is not None else None,
+            'bytes_written': write_end - write_start if write_start is not None else None,
+            'items': record.items,
+            'unit': record.unit,
+            'error': error,
+            'cached': record.cached,
+            'time': time.time(),
+        }
+        with _lock:
+            _active.discard(record)
+            result['overlapped'] = not record.exclusive
+            if gpu and record.exclusive:
+                import torch
+                result['gpu_peak_mb'] = round(torch.cuda.max_memory_allocated() / (1024 ** 2), 1)
+        _save(record.folder, stage, result)
+
+
+def profiled(stage, folder_arg='folder'):
+    """装饰器：用 profile_stage 包装一个以视频文件夹为参数的阶段入口函数"""
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind_partial(*args, **kwargs)
+            folder = bound.arguments.get(folder_arg)
+            with profile_stage(folder, stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _save(folder, stage, result):
+    with _lock:
+        aggregate = _aggregates.setdefault(stage, {'count': 0, 'cached': 0, 'errors': 0, 'wall_time': 0.0,
+                                                   'cpu_time': 0.0, 'items': 0, 'gpu_peak_mb': 0.0})
+        if result['cached']:
+            # 命中缓存的运行不计入耗时统计，也不覆盖 profile.json 中之前实际运行的记录
+            aggregate['cached'] += 1
+        else:
+            aggregate['count'] += 1
+            aggregate['errors'] += 1 if result['error'] else 0
+            aggregate['wall_time'] = round(aggregate['wall_time'] + result['wall_time'], 3)
+            aggregate['cpu_time'] = round(aggregate['cpu_time'] + result['cpu_time'], 3)
+            aggregate['items'] += result['items'] or 0
+            aggregate['gpu_peak_mb'] = max(aggregate['gpu_peak_mb'], result['gpu_peak_mb'] or 0)
+        if folder is None or not os.path.isdir(folder):
+            return
+        try:
+            profile = load_profile(folder)
+            if result['cached'] and stage in profile['stages']:
+                return
+            profile['stages'][stage] = result
+            profile['total_wall_time'] = round(sum(r['wall_time'] for r in profile['stages'].values()), 3)
+            profile_path = os.path.join(folder, PROFILE_NAME)
+            tmp_path = profile_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(profile, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, profile_path)
+        except Exception as e:
+            logger.warning(f'写入性能记录失败: {folder} ({e})')
+    logger.info(f'[profile] {stage}: {result["wall_time"]:.2f}s wall, {result["cpu_time"]:.2f}s cpu, '
+                f'items={result["items"]}{", cached" if result["cached"] else ""}')
+
+
+def load_profile(folder):
+    path = os.path.join(folder, PROFILE_NAME)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+        profile.setdefault('stages', {})
+        return profile
+    return {'stages': {}}
+
+
+def get_aggregates():
+    """返回进程启动以来各阶段的汇总统计（包含平均耗时）"""
+    with _lock:
+        summary = {}
+        for stage, aggregate in _aggregates.items():
+            summary[stage] = dict(aggregate)
+            summary[stage]['avg_wall_time'] = (round(aggregate['wall_time'] / aggregate['count'], 3)
+                                               if aggregate['count'] else None)
+        return summary
@@ -0,0 +1,79 @@
+import os
+import threading
+from collections import OrderedDict
+
+from loguru import logger
+
+from .artifact_cache import file_hash
+
+# 说话人条件（speaker embedding、prompt speech token/feature 等）缓存，
+# 以参考音频的 sha256 为键，持久化到视频目录下的 SPEAKER_CACHE 文件夹。
+# 内存中按最近使用顺序保留最多 SPEAKER_CACHE_MEMORY_ENTRIES 份 CPU 副本，使用时才复制到模型所在设备，
+# 模型被模型管理器卸载时一并清空对应后端的条目，不占用显存
+SPEAKER_CACHE_FOLDER = 'SPEAKER_CACHE'
+_memory_cache = OrderedDict()
+_hash_cache = {}
+_lock = threading.Lock()
+
+
+def reference_hash(speaker_wav):
+    stat = os.stat(speaker_wav)
+    key = (os.path.abspath(speaker_wav), stat.st_size, stat.st_mtime_ns)
+    if key not in _hash_cache:
+        _hash_cache[key] = file_hash(os.path.dirname(speaker_wav), os.path.basename(speaker_wav))
+    return _hash_cache[key]
+
+
+def cache_path(speaker_wav, backend, digest):
+    speaker_folder = os.path.dirname(os.path.abspath(speaker_wav))
+    cache_folder = os.path.join(os.path.dirname(speaker_folder), SPEAKER_CACHE_FOLDER)
+    return os.path.join(cache_folder, f'{backend}_{digest}.pt')
+
+
+def _to_device(conditioning, device):
+    """把条件中的张量（可以嵌套在 dict/list/tuple 中）移到 device"""
+    if hasattr(conditioning, 'to'):
+        return conditioning.to(device)
+    if isinstance(conditioning, dict):
+        return {k: _to_device(v, device) for k, v in conditioning.items()}
+    if isinstance(conditioning, (list, tuple)):
+        return type(conditioning)(_to_device(v, device) for v in conditioning)
+    return conditioning
+
+
+def get_speaker_conditioning(speaker_wav, backend, compute, device=None):
+    """
+    获取 speaker_wav 在 backend 下的说话人条件，返回位于 device 上的副本。
+    依次查找内存缓存、磁盘缓存，都没有时调用 compute(speaker_wav) 计算并保存。
+    """
+    import torch
+    digest = reference_hash(speaker_wav)
+    key = (backend, digest)
+    with _lock:
+        conditioning = _memory_cache.get(key)
+        if conditioning is not None:
+            _memory_cache.move_to_end(key)
+        else:
+            path = cache_path(speaker_wav, backend, digest)
+            if os.path.exists(path):
+                try:
+                    conditioning = torch.load(path, map_location='cpu')
+                    logger.info(f'加载说话人条件缓存: {path}')
+                except Exception as e:
+                    logger.warning(f'说话人条件缓存损坏，重新计算: {path} ({e})')
+            if conditioning is None:
+                conditioning = _to_device(compute(speaker_wav), 'cpu')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                torch.save(conditioning, path)
+                logger.info(f'已保存说话人条件缓存: {path}')
+            _memory_cache[key] = conditioning
+            while len(_memory_cache) > int(os.getenv('SPEAKER_CACHE_MEMORY_ENTRIES', 32)):
+                _memory_cache.popitem(last=False)
+    return _to_device(conditioning, device or 'cpu')
+
+
+def clear_speaker_cache(backend=None):
+    """清空内存中的说话人条件（backend 为 None 时清空全部），磁盘缓存保留"""
+    with _lock:
+        for key in [key for key in _memory_cache if backend is None or key[0] == backend]:
+            del _memory_cache[key]
@@ -1,34 +1,39 @@
 import shutil
-from demucs.api import Separator
 import os
 from loguru import logger
 import time
 from .utils import save_wav, normalize_wav
-import torch
+from .artifact_cache import is_cached, save_cache, load_record, save_record
+from .profiler import profiled, profile_stage, record_cached, record_items
+from .model_manager import model_manager
+from . import demucs_batch, demucs_parallel
+from .music_detection import SEPARATION_MODES, analyze_audio_file, choose_separation
 import gc
+import numpy as np
 
-# 全局变量
-auto_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+# 全局变量（torch 和 demucs 在第一次加载模型时才导入）
 separator = None
 model_loaded = False  # 新增标志，跟踪模型是否已加载
 current_model_config = {}  # 新增变量，存储当前加载模型的配置
 
 
-def init_demucs():
+def init_demucs(model_name: str = "htdemucs_ft", device: str = 'auto', shifts: int = 5):
     """
     初始化Demucs模型。
-    如果模型已经初始化，直接返回而不重新加载。
+    如果相同配置的模型已经加载，直接返回而不重新加载。
     """
-    global separator, model_loaded
-    if not model_loaded:
-        separator = load_model()
-        model_loaded = True
-    else:
-        logger.info("Demucs模型已经加载，跳过初始化")
+    workers = demucs_parallel.parallel_workers(device)
+    if workers > 1:
+        # CPU 上分段并行分离，预热进程池而不是单个 Separator
+        with model_manager.use('demucs_pool', lambda: demucs_parallel.load_pool(model_name, workers)):
+            pass
+        return
+    with model_manager.use('demucs', lambda: load_model(model_name, device, True, shifts)):
+        pass
 
 
 def load_model(model_name: str = "htdemucs_ft", device: str = 'auto', progress: bool = True,
-               shifts: int = 5) -> Separator:
+               shifts: int = 5):
     """
     加载Demucs模型。
     如果相同配置的模型已加载，直接返回现有模型而不重新加载。
@@ -54,6 +59,9 @@ def load_model(model_name: str = "htdemucs_ft", device: str = 'auto', progress:
     logger.info(f'加载Demucs模型: {model_name}')
     t_start = time.time()
 
+    import torch
+    from demucs.api import Separator
+    auto_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     device_to_use = auto_device if device == 'auto' else device
     separator = Separator(model_name, device=device_to_use, progress=progress, shifts=shifts)
 
@@ -83,18 +91,133 @@ def release_model():
         separator = None
         # 强制垃圾回收
         gc.collect()
+        import torch
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
 
         model_loaded = False
         current_model_config = {}
+        model_manager.mark_unloaded('demucs')
         logger.info('Demucs模型资源已释放')
 
 
+model_manager.register('demucs', release_model)
+
+
+def plan_separation(folder: str, model_name: str = "htdemucs_ft", shifts: int = 5, mode=None):
+    """
+    决定分离方式，返回 (分离方式, 模型, shifts)：
+    mode（默认取 SEPARATION_MODE）为 auto 时先做音乐检测，没有背景音乐的音频降级为快速分离或不分离；
+    full/fast/none 则直接使用指定的方式。检测结果和选择记录在 manifest 中，audio.wav 不变时不会重新检测。
+    """
+    mode = mode or os.getenv('SEPARATION_MODE', 'auto')
+    if mode not in SEPARATION_MODES:
+        logger.warning(f'未知的 SEPARATION_MODE: {mode}，使用 auto')
+        mode = 'auto'
+    scores = None
+    if mode == 'auto':
+        record = load_record(folder, 'separation', ['audio.wav'])
+        if record is not None and record.get('scores'):
+            scores = record['scores']
+        else:
+            scores = analyze_audio_file(os.path.join(folder, 'audio.wav'))
+        separation = choose_separation(scores)
+    else:
+        separation = mode
+    if separation == 'fast':
+        model_name, shifts = os.getenv('SEPARATION_FAST_MODEL', 'htdemucs'), 0
+    save_record(folder, 'separation', {'mode': mode, 'separation': separation, 'scores': scores,
+                                       'model_name': model_name, 'shifts': shifts}, ['audio.wav'])
+    if scores is not None:
+        logger.info(f'分离方式: {separation}（music_score={scores["music_score"]}）: {folder}')
+    return separation, model_name, shifts
+
+
+def passthrough_audio(audio_path: str, instruments: str = 'silence'):
+    """
+    不分离时的人声和伴奏，均为 (采样点, 声道)：人声直接使用原音频，伴奏为静音；
+    instruments 为 lowpass 时伴奏取原音频的低频部分，人声为其余部分，两者相加仍等于原音频。
+    """
+    import librosa
+    wav, _ = librosa.load(audio_path, sr=44100, mono=False)
+    wav = np.atleast_2d(wav).T.astype(np.float32)
+    if instruments == 'lowpass':
+        from scipy.signal import butter, sosfiltfilt
+        cutoff = float(os.getenv('SEPARATION_NONE_LOWPASS_HZ', 120))
+        sos = butter(4, cutoff, btype='lowpass', fs=44100, output='sos')
+        low = sosfiltfilt(sos, wav, axis=0).astype(np.float32)
+        return wav - low, low
+    return wav, np.zeros_like(wav)
+
+
+def mix_stems(separated):
+    """把 {音轨名: (声道, 采样点)} 合成 (人声, 伴奏)，均为 (采样点, 声道)"""
+    vocals = separated['vocals'].T
+    instruments = None
+    for k, v in separated.items():
+        if k == 'vocals':
+            continue
+        if instruments is None:
+            instruments = v
+        else:
+            instruments += v
+    instruments = instruments.T
+    return vocals, instruments
+
+
+def separation_cache_params(separation, model_name, shifts):
+    cache_params = {'model_name': model_name, 'shifts': shifts}
+    if separation == 'fast':
+        cache_params['separation'] = separation
+    elif separation == 'none':
+        cache_params = {'separation': separation,
+                        'instruments': os.getenv('SEPARATION_NONE_INSTRUMENTS', 'silence')}
+    return cache_params
+
+
+def save_separation(folder, vocals, instruments, cache_params):
+    vocal_output_path = os.path.join(folder, 'audio_vocals.wav')
+    instruments_output_path = os.path.join(folder, 'audio_instruments.wav')
+    save_wav(vocals, vocal_output_path, sample_rate=44100)
+    logger.info(f'已保存人声: {vocal_output_path}')
+
+    save_wav(instruments, instruments_output_path, sample_rate=44100)
+    logger.info(f'已保存伴奏: {instruments_output_path}')
+    save_cache(folder, 'demucs', ['audio.wav'], cache_params, ['audio_vocals.wav', 'audio_instruments.wav'])
+    return vocal_output_path, instruments_output_path
+
+
+def _separate_with_demucs(audio_path, model_name, device, progress, shifts):
+    """用 Demucs 分离，返回 (人声, 伴奏)，均为 (采样点, 声道)"""
+    workers = demucs_parallel.parallel_workers(device)
+    if workers > 1:
+        # 没有 GPU 时按长窗口切分，在多个进程中并行分离
+        separated = demucs_parallel.separate_file(audio_path, model_name, shifts, workers)
+    else:
+        def separate_with_separator():
+            # 由模型管理器确保模型已加载并且配置正确，分离期间不会被淘汰
+            with model_manager.use('demucs', lambda: load_model(model_name, device, progress, shifts)):
+                return separator.separate_audio_file(audio_path)
+
+        try:
+            origin, separated = separate_with_separator()
+        except Exception as e:
+            logger.error(f'音频分离出错: {e}')
+            # 在发生错误时重新加载模型一次：释放后再经模型管理器加载，保证管理器记录的加载状态与实际一致
+            release_model()
+            logger.info(f'重新加载模型，重试分离...')
+            origin, separated = separate_with_separator()
+        separated = {k: v.numpy() for k, v in separated.items()}
+
+    return mix_stems(separated)
+
+
+@profiled('demucs')
 def separate_audio(folder: str, model_name: str = "htdemucs_ft", device: str = 'auto', progress: bool = True,
-                   shifts: int = 5) -> None:
+                   shifts: int = 5, separation_mode=None, vocals_only=False) -> None:
     """
-    分离音频文件
+    分离音频文件，separation_mode 见 plan_separation。
+    vocals_only 用于只生成字幕：不分离时直接把 audio.wav 复制为 audio_vocals.wav，不生成伴奏。
     """
     global separator
     audio_path = os.path.join(folder, 'audio.wav')
@@ -103,60 +226,93 @@ def separate_audio(folder: str, model_name: str = "htdemucs_ft", device: str = '
     vocal_output_path = os.path.join(folder, 'audio_vocals.wav')
     instruments_output_path = os.path.join(folder, 'audio_instruments.wav')
 
-    if os.path.exists(vocal_output_path) and os.path.exists(instruments_output_path):
+    separation, model_name, shifts = plan_separation(folder, model_name, shifts, separation_mode)
+    cache_inputs = ['audio.wav']
+    cache_params = separation_cache_params(separation, model_name, shifts)
+    if vocals_only and separation == 'none':
+        cache_params = {'separation': separation, 'vocals_only': True}
+        if is_cached(folder, 'demucs', cache_inputs, cache_params, ['audio_vocals.wav']):
+            record_cached()
+        else:
+            shutil.copyfile(audio_path, vocal_output_path)
+            save_cache(folder, 'demucs', cache_inputs, cache_params, ['audio_vocals.wav'])
+            logger.info(f'不分离，直接使用原音频识别: {vocal_output_path}')
+        return vocal_output_path, None
+    cache_outputs = ['audio_vocals.wav', 'audio_instruments.wav']
+    if is_cached(folder, 'demucs', cache_inputs, cache_params, cache_outputs):
         logger.info(f'音频已分离: {folder}')
+        record_cached()
         return vocal_output_path, instruments_output_path
 
     logger.info(f'正在分离音频: {folder}')
 
     try:
-        # 确保模型已加载并且配置正确
-        if not model_loaded or current_model_config.get('model_name') != model_name or \
-                (current_model_config.get('device') == 'auto') != (device == 'auto') or \
-                current_model_config.get('shifts') != shifts:
-            load_model(model_name, device, progress, shifts)
-
         t_start = time.time()
 
-        try:
-            origin, separated = separator.separate_audio_file(audio_path)
-        except Exception as e:
-            logger.error(f'音频分离出错: {e}')
-            # 在发生错误时尝试重新加载模型一次
-            release_model()
-            load_model(model_name, device, progress, shifts)
-            logger.info(f'已重新加载模型，重试分离...')
-            origin, separated = separator.separate_audio_file(audio_path)
+        if separation == 'none':
+            vocals, instruments = passthrough_audio(audio_path, cache_params['instruments'])
+        else:
+            vocals, instruments = _separate_with_demucs(audio_path, model_name, device, progress, shifts)
 
         t_end = time.time()
-        logger.info(f'音频分离完成，用时 {t_end - t_start:.2f} 秒')
-
-        vocals = separated['vocals'].numpy().T
-        instruments = None
-        for k, v in separated.items():
-            if k == 'vocals':
-                continue
-            if instruments is None:
-                instruments = v
-            else:
-                instruments += v
-        instruments = instruments.numpy().T
-
-        save_wav(vocals, vocal_output_path, sample_rate=44100)
-        logger.info(f'已保存人声: {vocal_output_path}')
-
-        save_wav(instruments, instruments_output_path, sample_rate=44100)
-        logger.info(f'已保存伴奏: {instruments_output_path}')
-
-        return vocal_output_path, instruments_output_path
+        logger.info(f'音频分离完成（{separation}），用时 {t_end - t_start:.2f} 秒')
+        record_items(round(len(vocals) / 44100, 1), 'seconds')
+        return save_separation(folder, vocals, instruments, cache_params)
 
     except Exception as e:
         logger.error(f'分离音频失败: {str(e)}')
         # 出现错误，释放模型资源并重新抛出异常
         release_model()
+        demucs_parallel.shutdown_pool()
         raise
 
 
+def separate_short_audio_batched(folders, model_name: str = "htdemucs_ft", device: str = 'auto',
+                                 progress: bool = True, shifts: int = 5, separation_mode=None) -> None:
+    """
+    跨视频批量分离短音频（不超过 DEMUCS_BATCH_MAX_SECONDS 秒）：模型和 shifts 相同的音频每 DEMUCS_BATCH_CLIPS 个一组，
+    所有分段放进同一个 batch 推理，结果写回各自的文件夹并登记缓存，之后的 separate_audio 直接命中缓存。
+    """
+    max_seconds = float(os.getenv('DEMUCS_BATCH_MAX_SECONDS', 120))
+    max_clips = int(os.getenv('DEMUCS_BATCH_CLIPS', 8))
+    # CPU 上的分段并行已经用满了所有核，不再批量
+    if max_clips < 2 or demucs_parallel.parallel_workers(device) > 1:
+        return
+    import librosa
+    groups = {}
+    for folder in folders:
+        audio_path = os.path.join(folder, 'audio.wav')
+        if not os.path.exists(audio_path):
+            continue
+        separation, folder_model, folder_shifts = plan_separation(folder, model_name, shifts, separation_mode)
+        if separation == 'none':
+            continue
+        cache_params = separation_cache_params(separation, folder_model, folder_shifts)
+        if is_cached(folder, 'demucs', ['audio.wav'], cache_params, ['audio_vocals.wav', 'audio_instruments.wav']):
+            continue
+        if librosa.get_duration(path=audio_path) > max_seconds:
+            continue
+        groups.setdefault((folder_model, folder_shifts), []).append((folder, cache_params))
+
+    for (folder_model, folder_shifts), items in groups.items():
+        if len(items) < 2:
+            continue
+        for start in range(0, len(items), max_clips):
+            batch = items[start:start + max_clips]
+            logger.info(f'批量分离 {len(batch)} 个短音频: {", ".join(folder for folder, _ in batch)}')
+            with profile_stage(None, 'demucs_batch'):
+                with model_manager.use('demucs', lambda: load_model(folder_model, device, progress, folder_shifts)):
+                    import torch
+                    device_to_use = ('cuda' if torch.cuda.is_available() else 'cpu') if device == 'auto' else device
+                    results = demucs_batch.separate_files(
+                        separator.model, [os.path.join(folder, 'audio.wav') for folder, _ in batch],
+                        folder_shifts, device=device_to_use)
+                for (folder, cache_params), separated in zip(batch, results):
+                    vocals, instruments = mix_stems(separated)
+                    save_separation(folder, vocals, instruments, cache_params)
+
+
+@profiled('extract_audio')
 def extract_audio_from_video(folder: str) -> bool:
     """
     从视频中提取音频
@@ -167,6 +323,7 @@ def extract_audio_from_video(folder: str) -> bool:
     audio_path = os.path.join(folder, 'audio.wav')
     if os.path.exists(audio_path):
         logger.info(f'音频已提取: {folder}')
+        record_cached()
         return True
     logger.info(f'正在从视频提取音频: {folder}')
 
@@ -179,26 +336,29 @@ def extract_audio_from_video(folder: str) -> bool:
 
 
 def separate_all_audio_under_folder(root_folder: str, model_name: str = "htdemucs_ft", device: str = 'auto',
-                                    progress: bool = True, shifts: int = 5) -> None:
+                                    progress: bool = True, shifts: int = 5, separation_mode=None,
+                                    vocals_only=False) -> None:
     """
-    分离文件夹下所有音频
+    分离文件夹下所有音频，separation_mode 和 vocals_only 见 separate_audio
     """
     global separator
     vocal_output_path, instruments_output_path = None, None
 
     try:
+        folders = []
         for subdir, dirs, files in os.walk(root_folder):
             if 'download.mp4' not in files:
                 continue
             if 'audio.wav' not in files:
                 extract_audio_from_video(subdir)
-            if 'audio_vocals.wav' not in files:
-                vocal_output_path, instruments_output_path = separate_audio(subdir, model_name, device, progress,
-                                                                            shifts)
-            elif 'audio_vocals.wav' in files and 'audio_instruments.wav' in files:
-                vocal_output_path = os.path.join(subdir, 'audio_vocals.wav')
-                instruments_output_path = os.path.join(subdir, 'audio_instruments.wav')
-                logger.info(f'音频已分离: {subdir}')
+            folders.append(subdir)
+        # 多个短视频先一起批量分离
+        if len(folders) > 1:
+            separate_short_audio_batched(folders, model_name, device, progress, shifts, separation_mode)
+        for subdir in folders:
+            # 是否需要重新分离由 separate_audio 根据缓存记录判断
+            vocal_output_path, instruments_output_path = separate_audio(subdir, model_name, device, progress,
+                                                                        shifts, separation_mode, vocals_only)
 
         logger.info(f'已完成所有音频分离: {root_folder}')
         return f'所有音频分离完成: {root_folder}', vocal_output_path, instruments_output_path
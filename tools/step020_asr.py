@@ -1,13 +1,13 @@
 
 import os
-import torch
 import numpy as np
 from dotenv import load_dotenv
-from .step021_asr_whisperx import whisperx_transcribe_audio
-from .step022_asr_funasr import funasr_transcribe_audio
+from .backends import get_backend
 from .utils import save_wav
+from .audio_store import load_audio
+from .artifact_cache import is_cached, save_cache
+from .profiler import profiled, record_cached, record_items
 import json
-import librosa
 from loguru import logger
 load_dotenv()
 
@@ -26,6 +26,11 @@ def merge_segments(transcript, ending='!"\').:;?]}~！“”’）。：；？
                 buffer_segment = segment
             else:
                 # If it's not, merge this segment with the buffered segment
+                if 'score' in buffer_segment and 'score' in segment:
+                    # 置信度按时长加权合并
+                    d1 = buffer_segment['end'] - buffer_segment['start']
+                    d2 = segment['end'] - segment['start']
+                    buffer_segment['score'] = (buffer_segment['score'] * d1 + segment['score'] * d2) / max(d1 + d2, 1e-6)
                 buffer_segment['text'] += ' ' + segment['text']
                 buffer_segment['end'] = segment['end']
 
@@ -35,61 +40,152 @@ def merge_segments(transcript, ending='!"\').:;?]}~！“”’）。：；？
 
     return merged_transcription
 
+# 说话人参考音频：从该说话人的所有片段中挑选质量最好的若干段，拼成 6~15 秒的提示音频，
+# 这样 XTTS/CosyVoice 等提取说话人特征的耗时与视频长度无关
+REFERENCE_MIN_SECONDS = 6
+REFERENCE_MAX_SECONDS = 15
+# 完整拼接版本的时长上限，放在 SPEAKER/full/ 下，挑选不出足够长的提示音频时用它代替
+REFERENCE_FULL_MAX_SECONDS = int(os.getenv('SPEAKER_FULL_MAX_SECONDS', 60))
+
+def frame_energy(audio, frame=480):
+    num_frames = len(audio) // frame
+    return np.mean(np.square(audio[:num_frames * frame].reshape(num_frames, frame)), axis=1)
+
+def score_segment(audio, energy, noise_floor, confidence=1.0):
+    """
+    根据信噪比给一个片段打分：片段帧能量的高分位视为语音，全部片段帧能量的低分位视为底噪，
+    削波的片段降权，最后乘以识别置信度。
+    """
+    if len(energy) < 4:
+        return 0.0
+    speech = np.percentile(energy, 90)
+    if speech < 1e-6:
+        return 0.0
+    snr = 10 * np.log10(speech / max(noise_floor, 1e-10))
+    clipped = np.mean(np.abs(audio) > 0.99)
+    return float(min(max(snr, 0), 40) / 40 * confidence * max(0.0, 1 - clipped * 20))
+
+def select_reference_segments(spans, scores, samplerate, min_seconds=REFERENCE_MIN_SECONDS, max_seconds=REFERENCE_MAX_SECONDS):
+    """
+    按得分从高到低挑选片段：先凑够 min_seconds，之后只补充得分不低于中位数的片段，总长不超过 max_seconds。
+    返回按时间顺序排列的 [(start, end)]，没有足够的有效音频时返回 None。
+    """
+    max_samples = int(max_seconds * samplerate)
+    min_samples = int(min_seconds * samplerate)
+    median = float(np.median(scores)) if scores else 0.0
+    selected, total = [], 0
+    for index in sorted(range(len(spans)), key=lambda i: -scores[i]):
+        if scores[index] <= 0 or total >= max_samples:
+            break
+        if total >= min_samples and scores[index] < median:
+            break
+        start, end = spans[index]
+        end = min(end, start + max_samples - total)
+        selected.append((start, end))
+        total += end - start
+    if total < min_samples:
+        return None
+    return sorted(selected)
+
+def concatenate_spans(audio_data, spans, max_samples=None):
+    """在预分配的缓冲区中按顺序拼接片段，超过 max_samples 的部分丢弃"""
+    total = sum(end - start for start, end in spans)
+    if max_samples is not None:
+        total = min(total, max_samples)
+    buffer = np.zeros((total, ), dtype=np.float32)
+    cursor = 0
+    for start, end in spans:
+        length = min(end - start, total - cursor)
+        if length <= 0:
+            break
+        buffer[cursor:cursor + length] = audio_data[start:start + length]
+        cursor += length
+    return buffer
+
 def generate_speaker_audio(folder, transcript):
     wav_path = os.path.join(folder, 'audio_vocals.wav')
-    audio_data, samplerate = librosa.load(wav_path, sr=24000)
-    speaker_dict = dict()
+    audio_data, samplerate = load_audio(wav_path, 24000)
     length = len(audio_data)
     delay = 0.05
+    speaker_spans = dict()
+    speaker_scores = dict()
+    energies = []
     for segment in transcript:
         start = max(0, int((segment['start'] - delay) * samplerate))
         end = min(int((segment['end']+delay) * samplerate), length)
-        speaker_segment_audio = audio_data[start:end]
-        speaker_dict[segment['speaker']] = np.concatenate((speaker_dict.get(
-            segment['speaker'], np.zeros((0, ))), speaker_segment_audio))
+        if end <= start:
+            continue
+        speaker_spans.setdefault(segment['speaker'], []).append((start, end))
+        energies.append((segment['speaker'], start, end, segment.get('score', 1.0),
+                         frame_energy(audio_data[start:end])))
+    noise_floor = np.percentile(np.concatenate([e[-1] for e in energies]), 10) if energies else 0
+    for speaker, start, end, confidence, energy in energies:
+        speaker_scores.setdefault(speaker, []).append(
+            score_segment(audio_data[start:end], energy, noise_floor, confidence))
 
     speaker_folder = os.path.join(folder, 'SPEAKER')
-    if not os.path.exists(speaker_folder):
-        os.makedirs(speaker_folder)
-    
-    for speaker, audio in speaker_dict.items():
-        speaker_file_path = os.path.join(
-            speaker_folder, f"{speaker}.wav")
-        save_wav(audio, speaker_file_path)
+    full_folder = os.path.join(speaker_folder, 'full')
+    os.makedirs(full_folder, exist_ok=True)
 
+    for speaker, spans in speaker_spans.items():
+        full_audio = concatenate_spans(audio_data, spans, int(REFERENCE_FULL_MAX_SECONDS * samplerate))
+        save_wav(full_audio, os.path.join(full_folder, f"{speaker}.wav"))
 
+        selected = select_reference_segments(spans, speaker_scores[speaker], samplerate)
+        if selected is None:
+            logger.info(f'{speaker} 的有效语音不足 {REFERENCE_MIN_SECONDS} 秒，使用完整拼接的参考音频')
+            reference_audio = full_audio
+        else:
+            reference_audio = concatenate_spans(audio_data, selected)
+        logger.info(f'{speaker} 参考音频 {len(reference_audio) / samplerate:.1f} 秒')
+        save_wav(reference_audio, os.path.join(speaker_folder, f"{speaker}.wav"))
+
+
+@profiled('asr')
 def transcribe_audio(method, folder, model_name: str = 'large', download_root='models/ASR/whisper', device='auto', batch_size=32, diarization=True,min_speakers=None, max_speakers=None):
-    if os.path.exists(os.path.join(folder, 'transcript.json')):
-        logger.info(f'Transcript already exists in {folder}')
-        return True
-    
     wav_path = os.path.join(folder, 'audio_vocals.wav')
     if not os.path.exists(wav_path):
         return False
+
+    cache_inputs = ['audio_vocals.wav']
+    cache_params = {'method': method, 'model_name': model_name if method == 'WhisperX' else None,
+                    'diarization': diarization, 'min_speakers': min_speakers, 'max_speakers': max_speakers}
+    cache_outputs = ['transcript.json']
+    if is_cached(folder, 'asr', cache_inputs, cache_params, cache_outputs):
+        logger.info(f'Transcript already exists in {folder}')
+        record_cached()
+        with open(os.path.join(folder, 'transcript.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
     
     logger.info(f'Transcribing {wav_path}')
     if device == 'auto':
+        import torch
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
     
+    # whisperx / funasr 只在选用时才导入
     if method == 'WhisperX':
-        transcript = whisperx_transcribe_audio(wav_path, model_name, download_root, device, batch_size, diarization, min_speakers, max_speakers)
+        transcribe = get_backend('asr', method).get('transcribe')
+        transcript = transcribe(wav_path, model_name, download_root, device, batch_size, diarization, min_speakers, max_speakers)
     elif method == 'FunASR':
-        transcript = funasr_transcribe_audio(wav_path, device, batch_size, diarization)
+        transcribe = get_backend('asr', method).get('transcribe')
+        transcript = transcribe(wav_path, device, batch_size, diarization)
     else:
         logger.error('Invalid ASR method')
         raise ValueError('Invalid ASR method')
 
     transcript = merge_segments(transcript)
+    record_items(len(transcript), 'segments')
     with open(os.path.join(folder, 'transcript.json'), 'w', encoding='utf-8') as f:
         json.dump(transcript, f, indent=4, ensure_ascii=False)
     logger.info(f'Transcribed {wav_path} successfully, and saved to {os.path.join(folder, "transcript.json")}')
     generate_speaker_audio(folder, transcript)
+    save_cache(folder, 'asr', cache_inputs, cache_params, cache_outputs)
     return transcript
 
 def transcribe_all_audio_under_folder(folder, asr_method, whisper_model_name: str = 'large', device='auto', batch_size=32, diarization=False, min_speakers=None, max_speakers=None):
     transcribe_json = None
     for root, dirs, files in os.walk(folder):
-        if 'audio_vocals.wav' in files and 'transcript.json' not in files:
+        if 'audio_vocals.wav' in files:
             transcribe_json = transcribe_audio(asr_method, root, whisper_model_name, 'models/ASR/whisper', device, batch_size, diarization, min_speakers, max_speakers)
         elif 'transcript.json' in files:
             transcribe_json = json.load(open(os.path.join(root, 'transcript.json'), 'r', encoding='utf-8'))
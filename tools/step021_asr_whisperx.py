@@ -7,7 +7,13 @@ import os
 from loguru import logger
 import torch
 from dotenv import load_dotenv
+from .audio_store import load_audio
+from .model_manager import model_manager
+from .ctc_alignment import install_fast_alignment
+from .batch_tuner import BATCH_ITEM_ESTIMATES_MB, run_with_auto_batch, tuning_key
 load_dotenv()
+# 对齐时用编译过的 trellis/backtrack 替换 whisperx 中逐帧调用 torch 的实现
+install_fast_alignment()
 
 whisper_model = None
 diarize_model = None
@@ -57,11 +63,30 @@ DEFAULT_ALIGN_MODELS_HF = {
     "ka": "xsway/wav2vec2-large-xlsr-georgian",
 }
 def init_whisperx():
-    load_whisper_model()
-    load_align_model()
+    with model_manager.use('whisperx', load_whisper_model):
+        pass
+    with model_manager.use('whisperx_align', load_align_model):
+        pass
 
 def init_diarize():
-    load_diarize_model()
+    with model_manager.use('whisperx_diarize', load_diarize_model):
+        pass
+
+def unload_whisper_model():
+    global whisper_model
+    whisper_model = None
+
+def unload_align_model():
+    global align_model, language_code, align_metadata
+    align_model, language_code, align_metadata = None, None, None
+
+def unload_diarize_model():
+    global diarize_model
+    diarize_model = None
+
+model_manager.register('whisperx', unload_whisper_model)
+model_manager.register('whisperx_align', unload_align_model)
+model_manager.register('whisperx_diarize', unload_diarize_model)
     
 def load_whisper_model(model_name='large', download_root = 'models/ASR/whisper', device='auto'):
     if model_name == 'large':
@@ -125,26 +150,40 @@ def load_diarize_model(device='auto'):
 def whisperx_transcribe_audio(wav_path, model_name: str = 'large', download_root='models/ASR/whisper', device='auto', batch_size=32, diarization=True,min_speakers=None, max_speakers=None):
     if device == 'auto':
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    load_whisper_model(model_name, download_root, device)
-    rec_result = whisper_model.transcribe(wav_path, batch_size=batch_size)
+    # 识别、对齐和说话人分离共用同一份 16k 音频，不再各自调用 ffmpeg 解码
+    audio, _ = load_audio(wav_path, 16000)
+    # batch_size 作为上限，实际值按可用显存/内存自动调整；batch_size <= 0 时上限为 ASR_MAX_BATCH_SIZE
+    limit = batch_size if batch_size and batch_size > 0 else int(os.getenv('ASR_MAX_BATCH_SIZE', 64))
+    with model_manager.use('whisperx', lambda: load_whisper_model(model_name, download_root, device)):
+        key = tuning_key(f'whisperx:{model_type}', device, 'int8' if device == 'cpu' else 'float16')
+        rec_result = run_with_auto_batch(lambda size: whisper_model.transcribe(audio, batch_size=size),
+                                         key, limit, BATCH_ITEM_ESTIMATES_MB['whisperx'], device)
     
     if rec_result['language'] == 'nn':
         logger.warning(f'No language detected in {wav_path}')
         return False
     
-    load_align_model(rec_result['language'],device='auto', model_dir=download_root)
-    rec_result = whisperx.align(rec_result['segments'], align_model, align_metadata,
-                                wav_path, device, return_char_alignments=False)
+    language = rec_result['language']
+    with model_manager.use('whisperx_align', lambda: load_align_model(language, device='auto', model_dir=download_root)):
+        rec_result = whisperx.align(rec_result['segments'], align_model, align_metadata,
+                                    audio, device, return_char_alignments=False)
     
     if diarization:
-        load_diarize_model(device)
-        if diarize_model:
-            diarize_segments = diarize_model(wav_path,min_speakers=min_speakers, max_speakers=max_speakers)
-            rec_result = whisperx.assign_word_speakers(diarize_segments, rec_result)
-        else:
-            logger.warning("Diarization model is not loaded, skipping speaker diarization")
+        with model_manager.use('whisperx_diarize', lambda: load_diarize_model(device)):
+            if diarize_model:
+                diarize_segments = diarize_model(audio,min_speakers=min_speakers, max_speakers=max_speakers)
+                rec_result = whisperx.assign_word_speakers(diarize_segments, rec_result)
+            else:
+                logger.warning("Diarization model is not loaded, skipping speaker diarization")
         
-    transcript = [{'start': segement['start'], 'end': segement['end'], 'text': segement['text'].strip(), 'speaker': segement.get('speaker', 'SPEAKER_00')} for segement in rec_result['segments']]
+    transcript = []
+    for segement in rec_result['segments']:
+        line = {'start': segement['start'], 'end': segement['end'], 'text': segement['text'].strip(), 'speaker': segement.get('speaker', 'SPEAKER_00')}
+        # 对齐得到的逐词置信度取平均，作为句子置信度（用于挑选说话人参考音频）
+        word_scores = [word['score'] for word in segement.get('words', []) if 'score' in word]
+        if word_scores:
+            line['score'] = round(float(np.mean(word_scores)), 3)
+        transcript.append(line)
     return transcript
 
 
@@ -5,12 +5,22 @@ import os
 from loguru import logger
 import torch
 from dotenv import load_dotenv
+from .audio_store import load_audio
+from .model_manager import model_manager
+from .batch_tuner import BATCH_ITEM_ESTIMATES_MB, run_with_auto_batch, tuning_key
 load_dotenv()
 
 funasr_model = None
 
 def init_funasr():
-    load_funasr_model()
+    with model_manager.use('funasr', load_funasr_model):
+        pass
+
+def unload_funasr_model():
+    global funasr_model
+    funasr_model = None
+
+model_manager.register('funasr', unload_funasr_model)
  
 def load_funasr_model(device='auto'):
     global funasr_model
@@ -47,17 +57,28 @@ def load_funasr_model(device='auto'):
 def funasr_transcribe_audio(wav_path, device='auto', batch_size=1, diarization=True):
     if device == 'auto':
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    load_funasr_model(device)
-    rec_result = funasr_model.generate(
-        wav_path,
-        device=device, 
-        # batch_size=batch_size,
-        return_spk_res=True if diarization else False,
-        sentence_timestamp=True,
-        return_raw_text=True,
-        is_final=True,
-        batch_size_s=300
-        )[0]
+    audio, _ = load_audio(wav_path, 16000)
+    # FunASR 按每批的音频总时长（秒）组 batch，上限 FUNASR_BATCH_SIZE_S，实际值按可用显存自动调整
+    limit = int(os.getenv('FUNASR_BATCH_SIZE_S', 300))
+    def generate(batch_size_s):
+        return funasr_model.generate(
+            audio,
+            device=device, 
+            # batch_size=batch_size,
+            return_spk_res=True if diarization else False,
+            sentence_timestamp=True,
+            return_raw_text=True,
+            is_final=True,
+            batch_size_s=batch_size_s
+            )[0]
+
+    with model_manager.use('funasr', lambda: load_funasr_model(device)):
+        if device == 'cpu':
+            # FunASR 在 CPU 上逐个 VAD 片段识别，不使用 batch_size_s，自动调整没有意义
+            rec_result = generate(limit)
+        else:
+            rec_result = run_with_auto_batch(generate, tuning_key('funasr:paraformer-zh', device), limit,
+                                             BATCH_ITEM_ESTIMATES_MB['funasr'], device, minimum=10)
     # print(rec_result)
     transcript = [{'start': sentence['timestamp'][0][0]/1000, 'end': sentence['timestamp'][-1][-1]/1000, 'text': sentence['text'].strip(), 'speaker': f"SPEAKER_{sentence.get('spk', 0):02d}"} for sentence in rec_result['sentence_info']] 
     return transcript
@@ -6,15 +6,61 @@ import re
 from dotenv import load_dotenv
 import time
 from loguru import logger
-from tools.step031_translation_openai import openai_response
-from tools.step032_translation_llm import llm_response
-from tools.step033_translation_translator import translator_response
-from tools.step034_translation_ernie import ernie_response
-from tools.step035_translation_qwen import qwen_response
-from tools.step036_translation_ollama import ollama_response
+from tools.backends import get_backend, list_backends
+from tools.artifact_cache import is_cached, save_cache
+from tools.profiler import profiled, record_cached, record_items
+from tools.translation_memory import get_translation_memory
+from tools.translation_journal import TranslationJournal, prompt_hash
 
 load_dotenv()
 import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 支持批量翻译的在线后端，以及每个后端的全局并发上限
+BATCH_TRANSLATION_METHODS = [backend.name for backend in list_backends('translation') if backend.batching]
+_backend_semaphores = {}
+_backend_semaphores_lock = threading.Lock()
+
+
+def get_backend_semaphore(method):
+    with _backend_semaphores_lock:
+        if method not in _backend_semaphores:
+            limit = int(os.getenv('TRANSLATION_CONCURRENCY', get_backend('translation', method).max_concurrency))
+            _backend_semaphores[method] = threading.BoundedSemaphore(max(1, limit))
+        return _backend_semaphores[method]
+
+
+def chat_response(messages, method='LLM'):
+    backend = get_backend('translation', method)
+    if 'chat' not in backend.functions:
+        raise Exception('Invalid method')
+    if method == 'Ernie':
+        system_content = messages[0]['content']
+        user_messages = messages[1:]
+        return backend.get('chat')(user_messages, system=system_content)
+    return backend.get('chat')(messages)
+
+def translator_response(messages, to_language='zh-CN', translator_server='bing'):
+    # 机器翻译后端同样按需导入
+    translate = get_backend('translation', 'Bing Translate').get('translate')
+    return translate(messages, to_language=to_language, translator_server=translator_server)
+
+def lookup_memory(texts, target_language, method, kind='line'):
+    """在翻译记忆中查找 texts 的译文，未命中或未启用时对应位置为 None"""
+    memory = get_translation_memory()
+    if memory is None:
+        return [None] * len(texts)
+    model = get_backend('translation', method).model_name or ''
+    # 总结只做精确匹配
+    return memory.lookup_many(texts, target_language, f'{method}/{kind}', model, normalized=None if kind == 'line' else False)
+
+def remember(text, translation, target_language, method, kind='line'):
+    memory = get_translation_memory()
+    if memory is None:
+        return
+    model = get_backend('translation', method).model_name or ''
+    memory.store(text, translation, target_language, f'{method}/{kind}', model)
 
 def get_necessary_info(info: dict):
     return {
@@ -147,6 +193,20 @@ def split_sentences(translation, use_char_based_end=True):
 def summarize(info, transcript, target_language='简体中文', method = 'LLM'):
     transcript = ' '.join(line['text'] for line in transcript)
     transcript = ensure_transcript_length(transcript, max_length=2000)
+    # 同一视频（相同标题、作者和内容）重新处理时直接复用之前的总结
+    memory_source = f'Title: "{info["title"]}" Author: "{info["uploader"]}".\n{transcript}'
+    cached = lookup_memory([memory_source], target_language, method, kind='summary')[0]
+    if cached is not None:
+        logger.info('总结命中翻译记忆')
+        result = json.loads(cached)
+        if 'tags' in result:
+            result['tags'] = info['tags']
+        return result
+    result = _summarize(info, transcript, target_language, method)
+    remember(memory_source, json.dumps(result, ensure_ascii=False), target_language, method, kind='summary')
+    return result
+
+def _summarize(info, transcript, target_language='简体中文', method = 'LLM'):
     info_message = f'Title: "{info["title"]}" Author: "{info["uploader"]}". ' 
     
     if method in ['Google Translate', 'Bing Translate']:
@@ -174,20 +234,7 @@ def summarize(info, transcript, target_language='简体中文', method = 'LLM'):
                 {'role': 'system', 'content': f'You are a expert in the field of this video. Please summarize the video in JSON format.\n```json\n{{"title": "the title of the video", "summary", "the summary of the video"}}\n```'},
                 {'role': 'user', 'content': full_description+retry_message},
             ]
-            if method == 'LLM':
-                response = llm_response(messages)
-            elif method == 'OpenAI':
-                response = openai_response(messages)
-            elif method == 'Ernie':
-                system_content = messages[0]['content']
-                user_messages = messages[1:]
-                response = ernie_response(user_messages, system=system_content)
-            elif method == '阿里云-通义千问':
-                response = qwen_response(messages)
-            elif method == 'Ollama':  # 添加对Ollama的支持
-                response = ollama_response(messages)
-            else:
-                raise Exception('Invalid method')
+            response = chat_response(messages, method)
             summary = response.replace('\n', '')
             if '视频标题' in summary:
                 raise Exception("包含“视频标题”")
@@ -220,30 +267,145 @@ def summarize(info, transcript, target_language='简体中文', method = 'LLM'):
         {'role': 'user',
             'content': f'The title of the video is "{summary["title"]}". The summary of the video is "{summary["summary"]}". Tags: {info["tags"]}.\nPlease translate the above title and summary and tags into {target_language} in JSON format. ```json\n{{"title": "", "summary", ""， "tags": []}}\n```. Remember to tranlate the title and the summary and tags into {target_language} in JSON.'},
     ]
-    while True:
-        try: 
-            logger.info(summary)
-            if target_language in summary['title'] or target_language in summary['summary']:
+    # 最多重试 5 次；仍然失败时保留未翻译的总结（它只作为逐句翻译的上下文），不再无限重试
+    for retry in range(5):
+        try:
+            response = chat_response(messages, method).replace('\n', '')
+            logger.info(response)
+            translated = json.loads(re.findall(r'\{.*?\}', response)[0])
+            if not translated.get('title') or not translated.get('summary'):
                 raise Exception('Invalid translation')
-            title = summary['title'].strip()
-            if (title.startswith('"') and title.endswith('"')) or (title.startswith('“') and title.endswith('”')) or (title.startswith('‘') and title.endswith('’')) or (title.startswith("'") and title.endswith("'")) or (title.startswith('《') and title.endswith('》')):
-                title = title[1:-1]
-            result = {
-                'title': title,
-                'author': info['uploader'],
-                'summary': summary['summary'],
-                'tags': info['tags'],
-                'language': target_language
-            }
-            return result
+            if target_language in translated['title'] or target_language in translated['summary']:
+                raise Exception('Invalid translation')
+            summary = {'title': translated['title'], 'summary': translated['summary']}
+            break
         except Exception as e:
             logger.warning(f'总结翻译失败\n{e}')
             time.sleep(1)
+    else:
+        logger.warning('总结翻译多次失败，使用未翻译的总结')
+
+    title = summary['title'].strip()
+    if (title.startswith('"') and title.endswith('"')) or (title.startswith('“') and title.endswith('”')) or (title.startswith('‘') and title.endswith('’')) or (title.startswith("'") and title.endswith("'")) or (title.startswith('《') and title.endswith('》')):
+        title = title[1:-1]
+    return {
+        'title': title,
+        'author': info['uploader'],
+        'summary': summary['summary'],
+        'tags': info['tags'],
+        'language': target_language
+    }
+
+def _translate_line(text, fixed_message, history, target_language='简体中文', method='LLM', on_accept=None):
+    """on_accept(translation) 在译文通过校验后立即调用（写入翻译日志）"""
+    if method in ['Google Translate', 'Bing Translate']:
+        translator_server = 'google' if method == 'Google Translate' else 'bing'
+        translation = translator_response(text, to_language = target_language, translator_server=translator_server)
+        if translation:
+            remember(text, translation, target_language, method)
+            if on_accept is not None:
+                on_accept(translation)
+        return translation
+
+    retry_message = 'Only translate the quoted sentence and give me the final translation.'
+    translation = text
+    for retry in range(10):
+        messages = fixed_message + \
+            history[-30:] + [{'role': 'user',
+                            'content': f'Translate:"{text}"'}]
+        # print(messages)
+        try:
+            response = chat_response(messages, method)
+            translation = response.replace('\n', '')
+            logger.info(f'原文：{text}')
+            logger.info(f'译文：{translation}')
+            success, translation = valid_translation(text, translation)
+            if not success:
+                retry_message += translation
+                raise Exception('Invalid translation')
+            remember(text, translation, target_language, method)
+            if on_accept is not None:
+                on_accept(translation)
+            break
+        except Exception as e:
+            logger.error(e)
+            logger.warning('翻译失败')
+            time.sleep(1)
+    return translation
+
+
+def parse_numbered_translations(response, numbers):
+    """从模型回复中解析 {"1": "...", "2": "..."} 形式的编号 JSON，返回 {编号: 译文}"""
+    response = response.strip()
+    if '{' not in response or '}' not in response:
+        return {}
+    try:
+        result = json.loads(response[response.index('{'):response.rindex('}') + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(result, dict):
+        return {}
+    translations = {}
+    for number in numbers:
+        value = result.get(str(number))
+        if isinstance(value, str) and value.strip():
+            translations[number] = value.replace('\n', '').strip()
+    return translations
+
+
+def _translate_batch(texts, fixed_message, history, target_language='简体中文', method='LLM', max_retries=3):
+    """
+    一次请求翻译多句：把编号后的句子以 JSON 发送，要求模型按相同编号返回 JSON。
+    解析失败或未通过 valid_translation 的句子返回 None，由调用方逐句重试。
+    """
+    numbers = list(range(1, len(texts) + 1))
+    source = json.dumps({str(n): text for n, text in zip(numbers, texts)}, ensure_ascii=False)
+    system_message = {
+        'role': 'system',
+        'content': fixed_message[0]['content'] + f'\nYou will receive a JSON object of numbered sentences. Translate every sentence into {target_language} and reply ONLY with a JSON object that maps the same numbers to the translations, e.g. {{"1": "...", "2": "..."}}.'}
+    context = []
+    if history:
+        context_numbers = range(1, len(history) + 1)
+        context = [
+            {'role': 'user', 'content': json.dumps({str(n): src for n, (src, _) in zip(context_numbers, history)}, ensure_ascii=False)},
+            {'role': 'assistant', 'content': json.dumps({str(n): dst for n, (_, dst) in zip(context_numbers, history)}, ensure_ascii=False)},
+        ]
+    messages = [system_message] + context + [{'role': 'user', 'content': source}]
+
+    results = [None] * len(texts)
+    semaphore = get_backend_semaphore(method)
+    for retry in range(max_retries):
+        try:
+            with semaphore:
+                response = chat_response(messages, method)
+            translations = parse_numbered_translations(response, numbers)
+            for n, text in zip(numbers, texts):
+                if results[n - 1] is not None or n not in translations:
+                    continue
+                success, translation = valid_translation(text, translations[n])
+                if success:
+                    results[n - 1] = translation
+                    remember(text, translation, target_language, method)
+                    logger.info(f'原文：{text}')
+                    logger.info(f'译文：{translation}')
+            if all(result is not None for result in results):
+                break
+            logger.warning(f'批量翻译有 {results.count(None)}/{len(texts)} 句未通过校验')
+        except Exception as e:
+            logger.error(e)
+            logger.warning('批量翻译失败')
+            time.sleep(1)
+    return results
 
-def _translate(summary, transcript, target_language='简体中文', method='LLM'):
 
+def _translate(summary, transcript, target_language='简体中文', method='LLM', batch_size=None, max_concurrency=None,
+               journal=None):
+    """
+    batch_size > 1 且为支持的在线后端时，按批打包句子，并发发送 max_concurrency 个批次；
+    同一轮并发的批次共享该轮开始前已完成的翻译作为上下文。
+    传入 journal 时先从翻译日志恢复已完成的句子（上下文 history 也由日志中的译文重建），新译文逐句写入日志。
+    """
     info = f'This is a video called "{summary["title"]}". {summary["summary"]}.'
-    full_translation = []
     if target_language == '简体中文':
         fixed_message = [
             {'role': 'system', 'content': f'You are an expert in the field of this video.\n{info}\nTranslate the sentence into {target_language}. 下面我让你来充当翻译家，你的目标是把任何语言翻译成{target_language}，请翻译时不要带翻译腔，而是要翻译得自然、流畅和地道，使用优美和高雅的表达方式。请将人工智能的“agent”翻译为“智能体”，强化学习中是`Q-Learning`而不是`Queue Learning`。数学公式写成plain text，不要使用latex。确保翻译正确和简洁。注意信达雅。'},
@@ -262,61 +424,105 @@ def _translate(summary, transcript, target_language='简体中文', method='LLM'
             {'role': 'assistant', 'content': 'Translated text: "Another Translated Text"'},
         ]
 
+    if batch_size is None:
+        batch_size = int(os.getenv('TRANSLATION_BATCH_SIZE', 1))
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv('TRANSLATION_CONCURRENCY', 4))
+
+    texts = [line['text'] for line in transcript]
+    model = get_backend('translation', method).model_name or ''
+    hashes = [prompt_hash(text, fixed_message[0]['content'], target_language, method, model) for text in texts]
+    full_translation = journal.resume(texts, hashes) if journal is not None else [None] * len(texts)
+
+    def accept(i, translation):
+        if journal is not None:
+            journal.record(i, texts[i], translation, hashes[i])
+
+    # 再查翻译记忆，只有未命中的句子才请求翻译后端
+    pending = [i for i in range(len(texts)) if full_translation[i] is None]
+    for i, translation in zip(pending, lookup_memory([texts[i] for i in pending], target_language, method)):
+        full_translation[i] = translation
+    hits = sum(full_translation[i] is not None for i in pending)
+    if hits:
+        logger.info(f'翻译记忆命中 {hits}/{len(texts)} 句')
+    if batch_size > 1 and method in BATCH_TRANSLATION_METHODS:
+        return _translate_batched(texts, fixed_message, target_language, method, batch_size, max_concurrency,
+                                  full_translation=full_translation, on_accept=accept)
+
     history = []
-    
-    for line in transcript:
-        text = line['text']
-
-        retry_message = 'Only translate the quoted sentence and give me the final translation.'
-        if method == 'Google Translate':
-            translation = translator_response(text, to_language = target_language, translator_server='google')
-        elif method == 'Bing Translate':
-            translation = translator_response(text, to_language = target_language, translator_server='bing')
-        else:
-            for retry in range(10):
-                messages = fixed_message + \
-                    history[-30:] + [{'role': 'user',
-                                    'content': f'Translate:"{text}"'}]
-                # print(messages)
-                try:
-                    if method == 'LLM':
-                        response = llm_response(messages)
-                    elif method == 'OpenAI':
-                        response = openai_response(messages)
-                    elif method == 'Ernie':
-                        system_content = messages[0]['content']
-                        user_messages = messages[1:]
-                        response = ernie_response(user_messages, system=system_content)
-                    elif method == '阿里云-通义千问':
-                        response = qwen_response(messages)
-                    elif method == 'Ollama':  # 添加对Ollama的支持
-                        response = ollama_response(messages)
-                    else:
-                        raise Exception('Invalid method')
-                    translation = response.replace('\n', '')
-                    logger.info(f'原文：{text}')
-                    logger.info(f'译文：{translation}')
-                    success, translation = valid_translation(text, translation)
-                    if not success:
-                        retry_message += translation
-                        raise Exception('Invalid translation')
-                    break
-                except Exception as e:
-                    logger.error(e)
-                    logger.warning('翻译失败')
-                    time.sleep(1)
-        full_translation.append(translation)
+    for i, text in enumerate(texts):
+        translation = full_translation[i]
+        if translation is None:
+            translation = _translate_line(text, fixed_message, history, target_language, method,
+                                          on_accept=lambda translation, i=i: accept(i, translation))
+            full_translation[i] = translation
+            time.sleep(0.1)
         history.append({'role': 'user', 'content': f'Translate:"{text}"'})
         history.append({'role': 'assistant', 'content': f'翻译：“{translation}”'})
-        time.sleep(0.1)
         
     return full_translation
 
-def translate(method, folder, target_language='简体中文'):
-    if os.path.exists(os.path.join(folder, 'translation.json')):
+
+def _translate_batched(texts, fixed_message, target_language, method, batch_size, max_concurrency, context_size=15,
+                       full_translation=None, on_accept=None):
+    """full_translation 中已有的译文（翻译日志或翻译记忆命中）不再发送；on_accept(i, translation) 同 _translate_line"""
+    if full_translation is None:
+        full_translation = [None] * len(texts)
+    pending = [i for i in range(len(texts)) if full_translation[i] is None]
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    wave_size = max(1, max_concurrency)
+    logger.info(f'批量翻译: {len(texts)} 句, {len(batches)} 批, 并发 {wave_size}')
+    with ThreadPoolExecutor(max_workers=wave_size) as executor:
+        for w in range(0, len(batches), wave_size):
+            wave = batches[w:w + wave_size]
+            done = wave[0][0]
+            history = [(texts[i], full_translation[i]) for i in range(max(0, done - context_size), done)]
+            futures = [executor.submit(_translate_batch, [texts[i] for i in batch], fixed_message, history,
+                                       target_language, method) for batch in wave]
+            for batch, future in zip(wave, futures):
+                for i, translation in zip(batch, future.result()):
+                    full_translation[i] = translation
+                    if translation is not None and on_accept is not None:
+                        on_accept(i, translation)
+
+            # 批量结果中缺失或不合格的句子退回逐句翻译
+            for batch in wave:
+                for i in batch:
+                    if full_translation[i] is not None:
+                        continue
+                    line_history = []
+                    for src, dst in [(texts[j], full_translation[j]) for j in range(max(0, i - context_size), i)]:
+                        if dst is None:
+                            continue
+                        line_history.append({'role': 'user', 'content': f'Translate:"{src}"'})
+                        line_history.append({'role': 'assistant', 'content': f'翻译：“{dst}”'})
+                    full_translation[i] = _translate_line(
+                        texts[i], fixed_message, line_history, target_language, method,
+                        on_accept=None if on_accept is None else lambda translation, i=i: on_accept(i, translation))
+    return full_translation
+
+@profiled('translation')
+def translate(method, folder, target_language='简体中文', batch_size=None, max_concurrency=None):
+    if batch_size is None:
+        batch_size = int(os.getenv('TRANSLATION_BATCH_SIZE', 1))
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv('TRANSLATION_CONCURRENCY', 4))
+    cache_inputs = ['transcript.json']
+    # 换用其他模型，或批量翻译的打包方式（批量大小、共享上下文的并发批次数）变化时都要重新翻译
+    batched = batch_size > 1 and method in BATCH_TRANSLATION_METHODS
+    cache_params = {'method': method, 'target_language': target_language,
+                    'model': get_backend('translation', method).model_name,
+                    'batch_size': batch_size if batched else 1,
+                    'max_concurrency': max_concurrency if batched else None}
+    if is_cached(folder, 'translation', cache_inputs, cache_params, ['translation.json', 'summary.json']):
         logger.info(f'Translation already exists in {folder}')
-        return True
-    
+        record_cached()
+        with open(os.path.join(folder, 'summary.json'), 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        with open(os.path.join(folder, 'translation.json'), 'r', encoding='utf-8') as f:
+            transcript = json.load(f)
+        return summary, transcript
+
     info_path = os.path.join(folder, 'download.info.json')
     # 不一定要download.info.json
     if os.path.exists(info_path):
@@ -336,7 +542,8 @@ def translate(method, folder, target_language='简体中文'):
         transcript = json.load(f)
     
     summary_path = os.path.join(folder, 'summary.json')
-    if os.path.exists(summary_path):
+    summary_params = {k: cache_params[k] for k in ('method', 'target_language', 'model')}
+    if is_cached(folder, 'summary', cache_inputs, summary_params, ['summary.json']):
         summary = json.load(open(summary_path, 'r', encoding='utf-8'))
     else:
         summary = summarize(info, transcript, target_language, method)
@@ -345,21 +552,27 @@ def translate(method, folder, target_language='简体中文'):
             return False
         with open(summary_path, 'w', encoding='utf-8') as f:
             json.dump(summary, f, indent=2, ensure_ascii=False)
+        save_cache(folder, 'summary', cache_inputs, summary_params, ['summary.json'])
 
     translation_path = os.path.join(folder, 'translation.json')
-    translation = _translate(summary, transcript, target_language, method)
+    # 逐句翻译的进度记录在日志中，中途崩溃或重启后从上次的位置继续
+    journal = TranslationJournal(folder)
+    translation = _translate(summary, transcript, target_language, method, batch_size, max_concurrency, journal=journal)
+    record_items(len(translation), 'lines')
     for i, line in enumerate(transcript):
         line['translation'] = translation[i]
     transcript = split_sentences(transcript)
     with open(translation_path, 'w', encoding='utf-8') as f:
         json.dump(transcript, f, indent=2, ensure_ascii=False)
+    save_cache(folder, 'translation', cache_inputs, cache_params, ['translation.json', 'summary.json'])
+    journal.remove()
     return summary, transcript
 
-def translate_all_transcript_under_folder(folder, method, target_language):
+def translate_all_transcript_under_folder(folder, method, target_language, batch_size=None, max_concurrency=None):
     summary_json , translate_json = None, None
     for root, dirs, files in os.walk(folder):
-        if 'transcript.json' in files and 'translation.json' not in files:
-            summary_json , translate_json = translate(method, root, target_language)
+        if 'transcript.json' in files:
+            summary_json , translate_json = translate(method, root, target_language, batch_size, max_concurrency)
         elif 'translation.json' in files:
             summary_json = json.load(open(os.path.join(root, 'summary.json'), 'r', encoding='utf-8'))
             translate_json = json.load(open(os.path.join(root, 'translation.json'), 'r', encoding='utf-8'))
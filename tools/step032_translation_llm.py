@@ -6,6 +6,7 @@ import torch
 from dotenv import load_dotenv
 import time
 from loguru import logger
+from .model_manager import model_manager
 
 load_dotenv()
 
@@ -17,6 +18,8 @@ if 'Qwen' not in model_name:
 
 def init_llm_model(model_name):
     global model, tokenizer
+    if model is not None:
+        return
     if 'Qwen' in model_name:
         from transformers import AutoModelForCausalLM, AutoTokenizer
         model_path = os.path.join('models/LLM', os.path.basename(model_name))
@@ -30,10 +33,16 @@ def init_llm_model(model_name):
         tokenizer = AutoTokenizer.from_pretrained(pretrained_path)
         print('Finish Load model', pretrained_path)
 
+def unload_llm_model():
+    global model, tokenizer
+    model, tokenizer = None, None
+
+model_manager.register('llm', unload_llm_model)
+
 def llm_response(messages, device='auto'):
-    if model is None:
-        init_llm_model(model_name)
-    if 'Qwen' in model_name:
+    if 'Qwen' not in model_name:
+        return ''
+    with model_manager.use('llm', lambda: init_llm_model(model_name)):
         text = tokenizer.apply_chat_template(
             messages,
             tokenize=False,
@@ -53,7 +62,6 @@ def llm_response(messages, device='auto'):
 
         response = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
         return response
-    return ''
 
 if __name__ == '__main__':
     test_message = [{"role": "user", "content": "你好，介绍一下你自己"}]
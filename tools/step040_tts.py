@@ -2,18 +2,19 @@ import json
 import os
 import re
 import librosa
+from concurrent.futures import ThreadPoolExecutor
 
 from loguru import logger
 import numpy as np
 
 from .utils import save_wav, save_wav_norm
-# from .step041_tts_bytedance import tts as bytedance_tts
-from .step042_tts_xtts import tts as xtts_tts
-from .step043_tts_cosyvoice import tts as cosyvoice_tts
-from .step044_tts_edge_tts import tts as edge_tts
-from .step045_tts_f5tts import tts as f5_tts
+from .artifact_cache import is_cached, save_cache
+from .audio_store import load_audio
+from .profiler import profiled, record_cached, record_items
+from .backends import get_backend, list_backends
 from .cn_tx import TextNorm
-from audiostretchy.stretch import stretch_audio
+from .time_stretch import wsola, stretch_many
+from .tts_cache import get_tts_cache, utterance_key
 normalizer = TextNorm()
 def preprocess_text(text):
     text = text.replace('AI', '人工智能')
@@ -24,39 +25,122 @@ def preprocess_text(text):
     return text
     
     
-def adjust_audio_length(wav_path, desired_length, sample_rate = 24000, min_speed_factor = 0.6, max_speed_factor = 1.1):
+def load_line_wav(wav_path, sample_rate = 24000):
     try:
         wav, sample_rate = librosa.load(wav_path, sr=sample_rate)
     except Exception as e:
         if wav_path.endswith('.wav'):
             wav_path = wav_path.replace('.wav', '.mp3')
         wav, sample_rate = librosa.load(wav_path, sr=sample_rate)
+    return wav.astype(np.float32, copy=False)
+
+def get_speed_factor(current_length, desired_length, min_speed_factor = 0.6, max_speed_factor = 1.1):
+    return max(min(desired_length / current_length, max_speed_factor), min_speed_factor)
+
+def adjust_audio_length(wav_path, desired_length, sample_rate = 24000, min_speed_factor = 0.6, max_speed_factor = 1.1):
+    wav = load_line_wav(wav_path, sample_rate)
     current_length = len(wav)/sample_rate
-    speed_factor = max(
-        min(desired_length / current_length, max_speed_factor), min_speed_factor)
+    speed_factor = get_speed_factor(current_length, desired_length, min_speed_factor, max_speed_factor)
     logger.info(f"Speed Factor {speed_factor}")
     desired_length = current_length * speed_factor
-    if wav_path.endswith('.wav'):
-        target_path = wav_path.replace('.wav', f'_adjusted.wav')
-    elif wav_path.endswith('.mp3'):
-        target_path = wav_path.replace('.mp3', f'_adjusted.wav')
-    stretch_audio(wav_path, target_path, ratio=speed_factor, sample_rate=sample_rate)
-    wav, sample_rate = librosa.load(target_path, sr=sample_rate)
+    wav = wsola(wav, speed_factor, sample_rate)
     return wav[:int(desired_length*sample_rate)], desired_length
 
-tts_support_languages = {
-    # XTTS-v2 supports 17 languages: English (en), Spanish (es), French (fr), German (de), Italian (it), Portuguese (pt), Polish (pl), Turkish (tr), Russian (ru), Dutch (nl), Czech (cs), Arabic (ar), Chinese (zh-cn), Japanese (ja), Hungarian (hu), Korean (ko) Hindi (hi).
-    'xtts': ['中文', 'English', 'Japanese', 'Korean', 'French', 'Polish', 'Spanish'],
-    'bytedance': [],
-    'GPTSoVits': [],
-    'EdgeTTS': ['中文', 'English', 'Japanese', 'Korean', 'French', 'Polish', 'Spanish'],
-    # zero_shot usage, <|zh|><|en|><|jp|><|yue|><|ko|> for Chinese/English/Japanese/Cantonese/Korean
-    'cosyvoice': ['中文', '粤语', 'English', 'Japanese', 'Korean', 'French'],
-    'F5-TTS': ['中文', 'English', 'Japanese', 'Korean', 'French', 'Polish', 'Spanish'], 
-}
-
-def generate_wavs(method, folder, target_language='中文', voice = 'zh-CN-XiaoxiaoNeural'):
-    assert method in ['xtts', 'bytedance', 'cosyvoice', 'EdgeTTS','F5-TTS']
+# 各后端支持的语言和同时合成的句子数由 backends 注册表声明：
+# 本地 GPU 模型不是线程安全的，只能串行；在线/远程后端受网络延迟限制，可以并发
+tts_support_languages = {backend.name: backend.languages for backend in list_backends('tts')}
+tts_max_concurrency = {backend.name: backend.max_concurrency for backend in list_backends('tts')}
+
+def synthesize_line(method, text, output_path, speaker_wav, target_language='中文', voice='zh-CN-XiaoxiaoNeural'):
+    # 后端模块在第一次使用时才导入
+    tts = get_backend('tts', method).get('tts')
+    if method in ['xtts', 'cosyvoice']:
+        tts(text, output_path, speaker_wav, target_language = target_language)
+    elif method == 'EdgeTTS':
+        tts(text, output_path, target_language = target_language, voice = voice)
+    elif method in ['F5-TTS', 'bytedance']:
+        tts(text, output_path, speaker_wav)
+
+def synthesize_all_lines(method, folder, transcript, target_language='中文', voice='zh-CN-XiaoxiaoNeural', max_workers=None):
+    """
+    第一阶段：并发合成所有句子的音频，输出到 wavs/0000.wav ...
+    每个后端的重试逻辑保持不变，并发数取 max_workers、TTS_CONCURRENCY 环境变量或后端默认值。
+    已在语音合成缓存中的句子直接链接缓存音频，只合成未命中的句子，合成结果再写回缓存。
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv('TTS_CONCURRENCY', tts_max_concurrency.get(method, 1)))
+    if tts_max_concurrency.get(method, 1) == 1:
+        max_workers = 1
+    output_folder = os.path.join(folder, 'wavs')
+    jobs = []
+    for i, line in enumerate(transcript):
+        text = preprocess_text(line['translation'])
+        output_path = os.path.join(output_folder, f'{str(i).zfill(4)}.wav')
+        speaker_wav = os.path.join(folder, 'SPEAKER', f'{line["speaker"]}.wav')
+        jobs.append((method, text, output_path, speaker_wav, target_language, voice))
+
+    backend = get_backend('tts', method)
+    cache = get_tts_cache()
+    if cache is not None:
+        keys = [utterance_key(backend, text, target_language,
+                              voice=voice if method == 'EdgeTTS' else None,
+                              speaker_wav=None if method == 'EdgeTTS' else speaker_wav)
+                for _, text, _, speaker_wav, _, _ in jobs]
+        pending = [(job, key) for job, key in zip(jobs, keys) if not cache.fetch(key, job[2])]
+        logger.info(f'语音合成缓存命中 {len(jobs) - len(pending)}/{len(jobs)} 句')
+        jobs = [job for job, _ in pending]
+    try:
+        _synthesize_jobs(backend, jobs, target_language, voice, max_workers)
+    finally:
+        if cache is not None:
+            for job, key in pending:
+                cache.store(key, job[2])
+            cache.evict()
+
+def _synthesize_jobs(backend, jobs, target_language, voice, max_workers):
+    if not jobs:
+        return
+    logger.info(f'Synthesizing {len(jobs)} lines with {backend.name}, concurrency {max_workers}')
+    if backend.batching:
+        # EdgeTTS 在同一个事件循环中并发请求，不需要线程池
+        tts_many = backend.get('tts_many')
+        tts_many([(text, output_path) for _, text, output_path, _, _, _ in jobs],
+                 target_language=target_language, voice=voice, max_concurrency=max_workers)
+        return
+    if max_workers <= 1:
+        for job in jobs:
+            synthesize_line(*job)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(synthesize_line, *job) for job in jobs]
+        for future in futures:
+            future.result()
+
+def allocate_timeline(num_samples, folder=None, memmap_threshold=None):
+    """
+    为整条配音时间轴一次性分配 float32 缓冲区。
+    超过 memmap_threshold 个采样点（默认约 1 小时，可用 TIMELINE_MEMMAP_SECONDS 配置）时改用磁盘内存映射，
+    避免长视频把整条音轨常驻内存。
+    """
+    if memmap_threshold is None:
+        memmap_threshold = int(float(os.getenv('TIMELINE_MEMMAP_SECONDS', 3600)) * 24000)
+    if folder is None or num_samples == 0 or num_samples < memmap_threshold:
+        return np.zeros((num_samples, ), dtype=np.float32)
+    path = os.path.join(folder, '.timeline.f32')
+    logger.info(f'Using memory-mapped timeline buffer: {path}')
+    return np.memmap(path, dtype=np.float32, mode='w+', shape=(num_samples, ))
+
+def release_timeline(timeline):
+    """如果时间轴是内存映射缓冲区，删除对应的临时文件"""
+    if isinstance(timeline, np.memmap) and timeline.filename:
+        try:
+            os.remove(timeline.filename)
+        except OSError as e:
+            logger.warning(f'Failed to remove timeline buffer {timeline.filename}: {e}')
+
+@profiled('tts')
+def generate_wavs(method, folder, target_language='中文', voice = 'zh-CN-XiaoxiaoNeural', max_workers=None):
+    get_backend('tts', method)
     transcript_path = os.path.join(folder, 'translation.json')
     output_folder = os.path.join(folder, 'wavs')
     if not os.path.exists(output_folder):
@@ -73,72 +157,96 @@ def generate_wavs(method, folder, target_language='中文', voice = 'zh-CN-Xiaox
     if target_language not in tts_support_languages[method]:
         logger.error(f'{method} does not support {target_language}')
         return f'{method} does not support {target_language}'
+
+    cache_inputs = ['translation.json', 'audio_vocals.wav', 'audio_instruments.wav']
+    cache_params = {'method': method, 'target_language': target_language,
+                    'voice': voice if method == 'EdgeTTS' else None}
+    cache_outputs = ['audio_combined.wav', 'audio_tts.wav', 'translation_tts.json']
+    if is_cached(folder, 'tts', cache_inputs, cache_params, cache_outputs):
+        logger.info(f'Wavs already generated in {folder}')
+        record_cached()
+        return os.path.join(folder, 'audio_combined.wav'), os.path.join(folder, 'audio.wav')
+    # wavs/ 下的逐句音频只按序号命名，译文或音色变化后必须清空，否则会复用旧音频
+    if not is_cached(folder, 'tts_wavs', ['translation.json'], cache_params, ['wavs']):
+        for file in os.listdir(output_folder):
+            os.remove(os.path.join(output_folder, file))
+        save_cache(folder, 'tts_wavs', ['translation.json'], cache_params, ['wavs'])
         
-    full_wav = np.zeros((0, ))
+    record_items(len(transcript), 'lines')
+    # 第一阶段：并发合成所有句子
+    synthesize_all_lines(method, folder, transcript, target_language, voice, max_workers)
+
+    # 第二阶段：按时间轴顺序确定每句的变速比例，再整批变速后拼接
+    sample_rate = 24000
+    wavs = [load_line_wav(os.path.join(output_folder, f'{str(i).zfill(4)}.wav'), sample_rate)
+            for i in range(len(transcript))]
+    speed_factors = []
+    clips = []
+    cursor = 0
     for i, line in enumerate(transcript):
-        speaker = line['speaker']
-        text = preprocess_text(line['translation'])
-        output_path = os.path.join(output_folder, f'{str(i).zfill(4)}.wav')
-        speaker_wav = os.path.join(folder, 'SPEAKER', f'{speaker}.wav')
-        # if num_speakers == 1:
-            # bytedance_tts(text, output_path, speaker_wav, voice_type='BV701_streaming')
-        
-        if method == 'bytedance':
-            bytedance_tts(text, output_path, speaker_wav, target_language = target_language)
-        elif method == 'xtts':
-            xtts_tts(text, output_path, speaker_wav, target_language = target_language)
-        elif method == 'cosyvoice':
-            cosyvoice_tts(text, output_path, speaker_wav, target_language = target_language)
-        elif method == 'EdgeTTS':
-            edge_tts(text, output_path, target_language = target_language, voice = voice)
-        elif method == 'F5-TTS':
-            f5_tts(text, output_path,speaker_wav)
         start = line['start']
         end = line['end']
         length = end-start
-        last_end = len(full_wav)/24000
+        # 只记录时间轴位置，不再逐句 np.concatenate
+        last_end = cursor/sample_rate
         if start > last_end:
-            full_wav = np.concatenate((full_wav, np.zeros((int((start - last_end) * 24000), ))))
-        start = len(full_wav)/24000
+            cursor += int((start - last_end) * sample_rate)
+        start = cursor/sample_rate
         line['start'] = start
         if i < len(transcript) - 1:
             next_line = transcript[i+1]
             next_end = next_line['end']
             end = min(start + length, next_end)
-        wav, length = adjust_audio_length(output_path, end-start)
+        # 变速后的时长只取决于原始时长和比例，不需要等变速完成就能推进时间轴
+        current_length = len(wavs[i])/sample_rate
+        speed_factor = get_speed_factor(current_length, end-start)
+        length = current_length * speed_factor
+        num_samples = int(length*sample_rate)
+        speed_factors.append(speed_factor)
 
-        full_wav = np.concatenate((full_wav, wav))
+        clips.append((cursor, num_samples))
+        cursor += num_samples
         line['end'] = start + length
-        
-    vocal_wav, sr = librosa.load(os.path.join(folder, 'audio_vocals.wav'), sr=24000)
-    full_wav = full_wav / np.max(np.abs(full_wav)) * np.max(np.abs(vocal_wav))
-    save_wav(full_wav, os.path.join(folder, 'audio_tts.wav'))
-    with open(transcript_path, 'w', encoding='utf-8') as f:
+
+    stretched = stretch_many(list(zip(wavs, speed_factors)), sample_rate)
+    del wavs
+    clips = [(offset, wav[:num_samples]) for (offset, num_samples), wav in zip(clips, stretched)]
+    del stretched
+
+    # 配音后的时间轴单独保存，translation.json 保留识别/翻译的原始时间，重新配音时不会累积偏移
+    with open(os.path.join(folder, 'translation_tts.json'), 'w', encoding='utf-8') as f:
         json.dump(transcript, f, indent=2, ensure_ascii=False)
-    
-    instruments_wav, sr = librosa.load(os.path.join(folder, 'audio_instruments.wav'), sr=24000)
-    len_full_wav = len(full_wav)
-    len_instruments_wav = len(instruments_wav)
-    
-    if len_full_wav > len_instruments_wav:
-        # 如果 full_wav 更长，将 instruments_wav 延伸到相同长度
-        instruments_wav = np.pad(
-            instruments_wav, (0, len_full_wav - len_instruments_wav), mode='constant')
-    elif len_instruments_wav > len_full_wav:
-        # 如果 instruments_wav 更长，将 full_wav 延伸到相同长度
-        full_wav = np.pad(
-            full_wav, (0, len_instruments_wav - len_full_wav), mode='constant')
-    combined_wav = full_wav + instruments_wav
-    # combined_wav /= np.max(np.abs(combined_wav))
-    save_wav_norm(combined_wav, os.path.join(folder, 'audio_combined.wav'))
+
+    vocal_wav, sr = load_audio(os.path.join(folder, 'audio_vocals.wav'), sample_rate)
+    instruments_wav, sr = load_audio(os.path.join(folder, 'audio_instruments.wav'), sample_rate)
+    tts_length = cursor
+    timeline = allocate_timeline(max(tts_length, len(instruments_wav)), folder)
+    try:
+        for idx, (offset, wav) in enumerate(clips):
+            timeline[offset:offset + len(wav)] = wav
+            clips[idx] = None
+
+        # 音量对齐到原人声，直接在缓冲区上原地计算
+        full_wav = timeline[:tts_length]
+        tts_peak = np.max(np.abs(full_wav)) if tts_length else 0
+        if tts_peak > 0:
+            full_wav *= np.max(np.abs(vocal_wav)) / tts_peak
+        save_wav(full_wav, os.path.join(folder, 'audio_tts.wav'))
+
+        # 不足部分本来就是 0，无需再 np.pad
+        timeline[:len(instruments_wav)] += instruments_wav
+        save_wav_norm(timeline, os.path.join(folder, 'audio_combined.wav'))
+    finally:
+        release_timeline(timeline)
+    save_cache(folder, 'tts', cache_inputs, cache_params, cache_outputs)
     logger.info(f'Generated {os.path.join(folder, "audio_combined.wav")}')
     return os.path.join(folder, 'audio_combined.wav'), os.path.join(folder, 'audio.wav')
 
-def generate_all_wavs_under_folder(root_folder, method, target_language='中文', voice = 'zh-CN-XiaoxiaoNeural'):
+def generate_all_wavs_under_folder(root_folder, method, target_language='中文', voice = 'zh-CN-XiaoxiaoNeural', max_workers=None):
     wav_combined, wav_ori = None, None
     for root, dirs, files in os.walk(root_folder):
-        if 'translation.json' in files and 'audio_combined.wav' not in files:
-            wav_combined, wav_ori = generate_wavs(method, root, target_language, voice)
+        if 'translation.json' in files:
+            wav_combined, wav_ori = generate_wavs(method, root, target_language, voice, max_workers)
         elif 'audio_combined.wav' in files:
             wav_combined, wav_ori = os.path.join(root, 'audio_combined.wav'), os.path.join(root, 'audio.wav')
             logger.info(f'Wavs already generated in {root}')
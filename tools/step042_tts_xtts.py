@@ -5,13 +5,23 @@ import numpy as np
 import torch
 import time
 from .utils import save_wav
+from .speaker_cache import clear_speaker_cache, get_speaker_conditioning
+from .model_manager import model_manager
 model = None
 
 '''
 Supported languages: Arabic: ar, Brazilian Portuguese: pt , Mandarin Chinese: zh-cn, Czech: cs, Dutch: nl, English: en, French: fr, German: de, Italian: it, Polish: pl, Russian: ru, Spanish: es, Turkish: tr, Japanese: ja, Korean: ko, Hungarian: hu, Hindi: hi
 '''
 def init_TTS():
-    load_model()
+    with model_manager.use('xtts', load_model):
+        pass
+
+def unload_model():
+    global model
+    model = None
+    clear_speaker_cache('xtts')
+
+model_manager.register('xtts', unload_model)
     
 def load_model(model_path="models/TTS/XTTS-v2", device='auto'):
     global model
@@ -55,6 +65,19 @@ language_map = {
     'Hindi': 'hi',
     'Korean': 'ko',
 }
+def compute_conditioning(speaker_wav):
+    """计算 XTTS 的 gpt_cond_latent 和 speaker_embedding"""
+    xtts = model.synthesizer.tts_model
+    config = xtts.config
+    gpt_cond_latent, speaker_embedding = xtts.get_conditioning_latents(
+        audio_path=[speaker_wav],
+        gpt_cond_len=config.gpt_cond_len,
+        gpt_cond_chunk_len=config.gpt_cond_chunk_len,
+        max_ref_length=config.max_ref_len,
+        sound_norm_refs=config.sound_norm_refs,
+    )
+    return {'gpt_cond_latent': gpt_cond_latent, 'speaker_embedding': speaker_embedding}
+
 def tts(text, output_path, speaker_wav, model_name="models/TTS/XTTS-v2", device='auto', target_language='中文'):
     global model
     language = language_map[target_language]
@@ -63,19 +86,31 @@ def tts(text, output_path, speaker_wav, model_name="models/TTS/XTTS-v2", device=
         logger.info(f'TTS {text} 已存在')
         return
     
-    if model is None:
-        load_model(model_name, device)
-    
-    for retry in range(3):
-        try:
-            wav = model.tts(text, speaker_wav=speaker_wav, language=language)
-            wav = np.array(wav)
-            save_wav(wav, output_path)
-            logger.info(f'TTS {text}')
-            break
-        except Exception as e:
-            logger.warning(f'TTS {text} 失败')
-            logger.warning(e)
+    with model_manager.use('xtts', lambda: load_model(model_name, device)):
+        for retry in range(3):
+            try:
+                xtts = model.synthesizer.tts_model
+                config = xtts.config
+                # 同一个参考音频的说话人条件只计算一次
+                conditioning = get_speaker_conditioning(speaker_wav, 'xtts', compute_conditioning, device=xtts.device)
+                out = xtts.inference(
+                    text, language,
+                    conditioning['gpt_cond_latent'], conditioning['speaker_embedding'],
+                    temperature=config.temperature,
+                    length_penalty=config.length_penalty,
+                    repetition_penalty=config.repetition_penalty,
+                    top_k=config.top_k,
+                    top_p=config.top_p,
+                    # 与 Synthesizer.tts 一样按句切分，避免长句超出各语言的字符/token 上限
+                    enable_text_splitting=True,
+                )
+                wav = np.array(out['wav'])
+                save_wav(wav, output_path)
+                logger.info(f'TTS {text}')
+                break
+            except Exception as e:
+                logger.warning(f'TTS {text} 失败')
+                logger.warning(e)
 
 
 if __name__ == '__main__':
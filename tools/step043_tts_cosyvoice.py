@@ -11,13 +11,23 @@ from cosyvoice.cli.cosyvoice import CosyVoice
 from cosyvoice.utils.file_utils import load_wav
 import torchaudio
 from modelscope import snapshot_download
+from .speaker_cache import clear_speaker_cache, get_speaker_conditioning
+from .model_manager import model_manager
 model = None
 
 def download_cosyvoice():
     snapshot_download('iic/CosyVoice2-0.5B', local_dir='models/TTS/CosyVoice2-0.5B')
 
 def init_cosyvoice():
-    load_model()
+    with model_manager.use('cosyvoice', load_model):
+        pass
+
+def unload_model():
+    global model
+    model = None
+    clear_speaker_cache('cosyvoice')
+
+model_manager.register('cosyvoice', unload_model)
     
 def load_model(model_path="models/TTS/CosyVoice2-0.5B", device='auto'):
     global model
@@ -43,6 +53,32 @@ language_map = {
     'Korean': 'ko'
 }
 
+def compute_conditioning(speaker_wav):
+    """提取跨语种合成所需的 prompt speech token/feature 和说话人 embedding"""
+    frontend = model.frontend
+    prompt_speech_16k = load_wav(speaker_wav, 16000)
+    prompt_speech_22050 = torchaudio.transforms.Resample(orig_freq=16000, new_freq=22050)(prompt_speech_16k)
+    speech_feat, speech_feat_len = frontend._extract_speech_feat(prompt_speech_22050)
+    speech_token, speech_token_len = frontend._extract_speech_token(prompt_speech_16k)
+    embedding = frontend._extract_spk_embedding(prompt_speech_16k)
+    return {
+        'flow_prompt_speech_token': speech_token, 'flow_prompt_speech_token_len': speech_token_len,
+        'prompt_speech_feat': speech_feat, 'prompt_speech_feat_len': speech_feat_len,
+        'llm_embedding': embedding, 'flow_embedding': embedding,
+    }
+
+def inference_cross_lingual(tts_text, speaker_wav):
+    """与 CosyVoice.inference_cross_lingual 相同，但说话人条件来自缓存"""
+    frontend = model.frontend
+    conditioning = get_speaker_conditioning(speaker_wav, 'cosyvoice', compute_conditioning, device=frontend.device)
+    tts_speeches = []
+    for i in frontend.text_normalize(tts_text, split=True):
+        tts_text_token, tts_text_token_len = frontend._extract_text_token(i)
+        model_input = {'text': tts_text_token, 'text_len': tts_text_token_len, **conditioning}
+        model_output = model.model.inference(**model_input)
+        tts_speeches.append(model_output['tts_speech'])
+    return {'tts_speech': torch.concat(tts_speeches, dim=1)}
+
 def tts(text, output_path, speaker_wav, model_name="models/TTS/CosyVoice2-0.5B", device='auto', target_language='中文'):
     global model
     
@@ -50,20 +86,17 @@ def tts(text, output_path, speaker_wav, model_name="models/TTS/CosyVoice2-0.5B",
         logger.info(f'TTS {text} 已存在')
         return
     
-    if model is None:
-        load_model(model_name, device)
-    
-    for retry in range(3):
-        try:
-            prompt_speech_16k = load_wav(speaker_wav, 16000)
-            output = model.inference_cross_lingual(f'<|{language_map[target_language]}|>{text}', prompt_speech_16k)
-            torchaudio.save(output_path, output['tts_speech'], 22050)
+    with model_manager.use('cosyvoice', lambda: load_model(model_name, device)):
+        for retry in range(3):
+            try:
+                output = inference_cross_lingual(f'<|{language_map[target_language]}|>{text}', speaker_wav)
+                torchaudio.save(output_path, output['tts_speech'], 22050)
 
-            logger.info(f'TTS {text}')
-            break
-        except Exception as e:
-            logger.warning(f'TTS {text} 失败')
-            logger.warning(e)
+                logger.info(f'TTS {text}')
+                break
+            except Exception as e:
+                logger.warning(f'TTS {text} 失败')
+                logger.warning(e)
 
 
 if __name__ == '__main__':
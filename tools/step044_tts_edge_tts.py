@@ -1,14 +1,13 @@
 import os
+import io
+import asyncio
+import subprocess
+import threading
 from loguru import logger
 import numpy as np
-import torch
-import time
+import librosa
+import edge_tts
 from .utils import save_wav
-import sys
-
-import torchaudio
-model = None
-
 
 
 #  <|zh|><|en|><|jp|><|yue|><|ko|> for Chinese/English/Japanese/Cantonese/Korean
@@ -20,18 +19,99 @@ language_map = {
     'Korean': 'ko-KR-SunHiNeural'
 }
 
-def tts(text, output_path, target_language='中文', voice = 'zh-CN-XiaoxiaoNeural'):
-    if os.path.exists(output_path):
-        logger.info(f'TTS {text} 已存在')
-        return
-    for retry in range(3):
+# 所有 EdgeTTS 请求共用一个后台事件循环，避免每句话启动一次 edge-tts 进程
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name='edge-tts-loop', daemon=True)
+            thread.start()
+        return _loop
+
+
+def decode_audio(data, sample_rate=24000):
+    """把内存中的 mp3 数据直接解码为单声道 float32 数组"""
+    try:
+        wav, _ = librosa.load(io.BytesIO(data), sr=sample_rate)
+        return wav
+    except Exception:
+        # 旧版本 libsndfile 不支持 mp3，改用 ffmpeg 管道解码
+        result = subprocess.run(
+            ['ffmpeg', '-loglevel', 'error', '-i', 'pipe:0', '-f', 'f32le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1'],
+            input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+async def _synthesize(text, voice):
+    communicate = edge_tts.Communicate(text, voice)
+    audio = bytearray()
+    async for chunk in communicate.stream():
+        if chunk['type'] == 'audio':
+            audio.extend(chunk['data'])
+    if not audio:
+        raise Exception('EdgeTTS 没有返回音频')
+    return bytes(audio)
+
+
+async def _tts(text, output_path, voice, semaphore=None, retries=3):
+    error = None
+    for retry in range(retries):
         try:
-            os.system(f'edge-tts --text "{text}" --write-media "{output_path.replace(".wav", ".mp3")}" --voice {voice}')
+            if semaphore is None:
+                data = await _synthesize(text, voice)
+            else:
+                async with semaphore:
+                    data = await _synthesize(text, voice)
+            # 解码是 CPU 计算，放到线程池里执行，不阻塞其它请求
+            wav = await asyncio.get_running_loop().run_in_executor(None, decode_audio, data)
+            save_wav(wav, output_path)
             logger.info(f'TTS {text}')
-            break
+            return True
         except Exception as e:
+            error = e
             logger.warning(f'TTS {text} 失败')
             logger.warning(e)
+            await asyncio.sleep(1)
+    # 重试全部失败时直接报错，而不是留下缺失的 wav 到拼接时才出现难以理解的错误
+    logger.error(f'EdgeTTS 合成失败（已重试 {retries} 次）: {output_path} {text}')
+    raise Exception(f'EdgeTTS 合成失败: {os.path.basename(output_path)} {text}') from error
+
+
+def tts(text, output_path, target_language='中文', voice = 'zh-CN-XiaoxiaoNeural'):
+    if os.path.exists(output_path):
+        logger.info(f'TTS {text} 已存在')
+        return
+    future = asyncio.run_coroutine_threadsafe(_tts(text, output_path, voice), get_event_loop())
+    future.result()
+
+
+def tts_many(jobs, target_language='中文', voice='zh-CN-XiaoxiaoNeural', max_concurrency=16):
+    """
+    在同一个事件循环里并发合成多句。
+    jobs: [(text, output_path)]
+    """
+    async def run_all():
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        tasks = []
+        for text, output_path in jobs:
+            if os.path.exists(output_path):
+                logger.info(f'TTS {text} 已存在')
+                continue
+            tasks.append(_tts(text, output_path, voice, semaphore))
+        # 等所有句子都结束后再报告失败，已合成的句子照常保存（并写入语音合成缓存）
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+        return results
+
+    future = asyncio.run_coroutine_threadsafe(run_all(), get_event_loop())
+    return future.result()
 
 
 if __name__ == '__main__':
@@ -39,4 +119,4 @@ if __name__ == '__main__':
     while True:
         text = input('请输入：')
         tts(text, f'playground/{text}.wav', target_language='中文')
-        
+
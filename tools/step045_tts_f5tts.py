@@ -3,16 +3,26 @@ from loguru import logger
 model = None
 from gradio_client import Client, handle_file
 import shutil
+import threading
 
 # API_KEY = load_key("f5tts.302_api")
 AUDIO_REFERS_DIR = "output/audio/refers"
 UPLOADED_REFER_URL = None
-GRADIO_CLIENT = Client("http://192.168.50.70:7860/")
+# 在第一次合成时才连接 F5-TTS 服务，导入模块时不访问网络
+GRADIO_CLIENT = None
+_client_lock = threading.Lock()
 NORMALIZED_REFERS_CACHE = {}
 
+def get_client():
+    global GRADIO_CLIENT
+    with _client_lock:
+        if GRADIO_CLIENT is None:
+            GRADIO_CLIENT = Client(os.getenv('F5TTS_URL', 'http://192.168.50.70:7860/'))
+        return GRADIO_CLIENT
+
 def _f5_tts(text: str, speaker_wav: str) -> bool:
     try:
-        result = GRADIO_CLIENT.predict(
+        result = get_client().predict(
             ref_audio_input=handle_file(speaker_wav),
             ref_text_input=text,  # 使用相同的文本作为参考
             gen_text_input=text,
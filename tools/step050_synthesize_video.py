@@ -9,6 +9,9 @@ import random
 import traceback
 
 from loguru import logger
+from .artifact_cache import is_cached, save_cache, invalidate
+from .audio_store import clear_audio_store
+from .profiler import profiled, record_cached, record_items
 
 
 def split_text(input_data,
@@ -101,36 +104,162 @@ def convert_resolution(aspect_ratio, resolution='1080p'):
     # return f'{width}x{height}'
     return width, height
     
-def synthesize_video(folder, subtitles=True, speed_up=1.00, fps=30, resolution='1080p', background_music=None, watermark_path=None, bgm_volume=0.5, video_volume=1.0):
+def escape_filter_path(path):
+    """
+    转义 filtergraph 中作为滤镜参数的路径。
+    ffmpeg 会先按 filtergraph 规则、再按滤镜选项规则各反转义一次，所以这里按相反顺序转义两次。
+    """
+    path = os.path.abspath(path).replace('\\', '/')
+    for char in ['\\', ':', "'"]:
+        path = path.replace(char, '\\' + char)
+    for char in ['\\', "'", '[', ']', ',', ';']:
+        path = path.replace(char, '\\' + char)
+    return path
+
+
+def subtitle_filter(srt_path, width):
+    """烧录字幕的 subtitles 滤镜，字号按画面宽度计算"""
+    font_size = int(width/128)
+    outline = int(round(font_size/8))
+    font_dir = escape_filter_path('./font')
+    style = f"FontName=SimHei,FontSize={font_size},PrimaryColour=&HFFFFFF,OutlineColour=&H000000,Outline={outline},WrapStyle=2"
+    return f"subtitles={escape_filter_path(srt_path)}:fontsdir={font_dir}:force_style='{style}'"
+
+
+def build_filter_complex(width, height, speed_up=1.00, srt_path=None, watermark_input=None, bgm_input=None,
+                         bgm_volume=0.5, video_volume=1.0):
+    """
+    构建单次编码所需的 filter_complex：变速、水印、缩放、字幕、背景音乐混音。
+
+    输入约定：0 为原视频，1 为配音音轨，watermark_input / bgm_input 为可选输入的序号。
+    返回 (filter_complex, video_label, audio_label)。
+    """
+    video_filters = [f"[0:v]setpts=PTS/{speed_up}[v0]"]
+    video_label = 'v0'
+    if watermark_input is not None:
+        video_filters.append(f"[{watermark_input}:v]scale=iw*0.15:ih*0.15[wm]")
+        video_filters.append(f"[{video_label}][wm]overlay=W-w-10:H-h-10[vwm]")
+        video_label = 'vwm'
+
+    # 先缩放到目标分辨率，再烧录字幕，保证字号与最终画面匹配
+    scale_and_subtitles = f"scale={width}:{height}"
+    if srt_path:
+        scale_and_subtitles += f",{subtitle_filter(srt_path, width)}"
+    video_filters.append(f"[{video_label}]{scale_and_subtitles}[v]")
+
+    audio_filters = [f"[1:a]atempo={speed_up}[a0]"]
+    audio_label = 'a0'
+    if bgm_input is not None:
+        audio_filters.append(f"[a0]volume={video_volume}[a1]")
+        audio_filters.append(f"[{bgm_input}:a]volume={bgm_volume}[bgm]")
+        audio_filters.append("[a1][bgm]amix=inputs=2:duration=first[a]")
+        audio_label = 'a'
+    return ';'.join(video_filters + audio_filters), 'v', audio_label
+
+
+def synthesize_video_single_pass(input_video, input_audio, final_video, srt_path, width, height,
+                                 speed_up=1.00, fps=30, background_music=None, watermark_path=None,
+                                 bgm_volume=0.5, video_volume=1.0):
+    """
+    单次编码合成视频：变速、背景音乐混音、水印和字幕烧录在同一个 filter_complex 中完成，
+    避免多次 libx264 重编码以及 temp 目录下的临时拷贝。
+    """
+    inputs = ['-i', input_video, '-i', input_audio]
+    watermark_input, bgm_input = None, None
+    next_input = 2
+    if watermark_path:
+        inputs += ['-i', watermark_path]
+        watermark_input = next_input
+        next_input += 1
+    if background_music:
+        inputs += ['-i', background_music]
+        bgm_input = next_input
+        next_input += 1
+
+    def run(srt):
+        filter_complex, video_label, audio_label = build_filter_complex(
+            width, height, speed_up, srt, watermark_input, bgm_input, bgm_volume, video_volume)
+        command = [
+            'ffmpeg',
+            *inputs,
+            '-filter_complex', filter_complex,
+            '-map', f'[{video_label}]',
+            '-map', f'[{audio_label}]',
+            '-r', str(fps),
+            '-c:v', 'libx264',
+            '-c:a', 'aac',
+            final_video,
+            '-y',
+            '-threads', '2',
+        ]
+        logger.info(f"执行FFmpeg命令: {' '.join(command)}")
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            logger.error(f"FFmpeg错误输出: {result.stderr.decode('utf-8', errors='ignore')[-2000:]}")
+        return result.returncode == 0
+
+    t_start = time.time()
+    success = run(srt_path)
+    # 字幕无所谓，字幕滤镜失败时去掉字幕重新合成
+    if not success and srt_path:
+        logger.warning('带字幕合成失败，尝试不带字幕重新合成')
+        success = run(None)
+    if not success:
+        logger.error(f'视频合成失败: {final_video}')
+        return None
+    logger.info(f'视频合成完成，用时 {time.time() - t_start:.2f} 秒: {final_video}')
+    return final_video
+
+
+@profiled('video')
+def synthesize_video(folder, subtitles=True, speed_up=1.00, fps=30, resolution='1080p', background_music=None, watermark_path=None, bgm_volume=0.5, video_volume=1.0, single_pass=True):
     # if os.path.exists(os.path.join(folder, 'video.mp4')):
     #     logger.info(f'Video already synthesized in {folder}')
     #     return
     
-    translation_path = os.path.join(folder, 'translation.json')
+    # 配音视频使用语音合成调整后的时间轴
+    translation_path = os.path.join(folder, 'translation_tts.json')
     input_audio = os.path.join(folder, 'audio_combined.wav')
     input_video = os.path.join(folder, 'download.mp4')
     
     if not os.path.exists(translation_path) or not os.path.exists(input_audio):
         return
     
+    srt_path = os.path.join(folder, 'subtitles.srt')
+    final_video = os.path.join(folder, 'video.mp4')
+    cache_inputs = ['translation_tts.json', 'audio_combined.wav', 'download.mp4']
+    cache_params = {'subtitles': subtitles, 'speed_up': speed_up, 'fps': fps, 'resolution': resolution,
+                    'background_music': background_music, 'watermark_path': watermark_path,
+                    'bgm_volume': bgm_volume, 'video_volume': video_volume}
+    if is_cached(folder, 'video', cache_inputs, cache_params, ['video.mp4'], adopt_existing=False):
+        logger.info(f'Video already synthesized in {folder}')
+        record_cached()
+        return final_video
+
     with open(translation_path, 'r', encoding='utf-8') as f:
         translation = json.load(f)
+    record_items(len(translation), 'subtitles')
         
-    srt_path = os.path.join(folder, 'subtitles.srt')
-    final_video = os.path.join(folder, 'video.mp4')
     generate_srt(translation, srt_path, speed_up)
     srt_path = srt_path.replace('\\', '/')
     aspect_ratio = get_aspect_ratio(input_video)
     width, height = convert_resolution(aspect_ratio, resolution)
     resolution = f'{width}x{height}'
-    font_size = int(width/128)
-    outline = int(round(font_size/8))
+
+    if single_pass:
+        output_video = synthesize_video_single_pass(
+            input_video, input_audio, final_video, srt_path if subtitles else None,
+            width, height, speed_up=speed_up, fps=fps, background_music=background_music,
+            watermark_path=watermark_path, bgm_volume=bgm_volume, video_volume=video_volume)
+        if output_video:
+            invalidate(folder, 'subtitle_video')
+            save_cache(folder, 'video', cache_inputs, cache_params, ['video.mp4'])
+            # 视频已输出，解码缓存不再需要（重新配音时会自动重新解码）
+            clear_audio_store(folder)
+        return output_video
+
     video_speed_filter = f"setpts=PTS/{speed_up}"
     audio_speed_filter = f"atempo={speed_up}"
-    font_path = "./font/SimHei.ttf"
-    subtitle_filter = f"subtitles={srt_path}:fontsdir={os.path.dirname(font_path)}:force_style='FontName=SimHei,FontSize={font_size},PrimaryColour=&HFFFFFF,OutlineColour=&H000000,Outline={outline},WrapStyle=2'"
-    # subtitle_filter = f"subtitles={srt_path}:force_style='FontName=Arial,FontSize={font_size},PrimaryColour=&HFFFFFF,OutlineColour=&H000000,Outline={outline},WrapStyle=2'"
-
     filter_complex = f"[0:v]{video_speed_filter}[v];[1:a]{audio_speed_filter}[a]"
         
     # Add watermark if specified
@@ -195,7 +324,7 @@ def synthesize_video(folder, subtitles=True, speed_up=1.00, fps=30, resolution='
     try:
         if subtitles:
             final_video_with_subtitles = final_video.replace('.mp4', '_subtitles.mp4')
-            add_subtitles(final_video, srt_path, final_video_with_subtitles, subtitle_filter, 'ffmpeg')
+            add_subtitles(final_video, srt_path, final_video_with_subtitles, subtitle_filter(srt_path, width), 'ffmpeg')
             # os.remove(final_video)
             if os.path.exists(final_video):
                 os.remove(final_video)
@@ -205,6 +334,75 @@ def synthesize_video(folder, subtitles=True, speed_up=1.00, fps=30, resolution='
         logger.info(f"An error occurred: {e}")
         traceback.format_exc()
 
+    invalidate(folder, 'subtitle_video')
+    save_cache(folder, 'video', cache_inputs, cache_params, ['video.mp4'])
+    clear_audio_store(folder)
+    return final_video
+
+
+# 只加字幕时的输出方式：soft 封装字幕轨，burn 烧录进画面
+SUBTITLE_MODES = ['soft', 'burn']
+
+
+@profiled('subtitle_video')
+def synthesize_subtitled_video(folder, subtitle_mode='soft', resolution='1080p', fps=30):
+    """
+    只加字幕、不配音：生成 subtitles.srt / subtitles.ass 并输出 video.mp4。
+    soft 把字幕以 mov_text 字幕轨封装进原视频，音视频流直接复制，不重新编码；
+    burn 把字幕烧录进画面，只重新编码视频，音频直接复制。
+    """
+    if subtitle_mode not in SUBTITLE_MODES:
+        raise ValueError(f'未知的 subtitle_mode: {subtitle_mode}，可选 {SUBTITLE_MODES}')
+    translation_path = os.path.join(folder, 'translation.json')
+    input_video = os.path.join(folder, 'download.mp4')
+    if not os.path.exists(translation_path) or not os.path.exists(input_video):
+        return
+
+    srt_path = os.path.join(folder, 'subtitles.srt')
+    ass_path = os.path.join(folder, 'subtitles.ass')
+    final_video = os.path.join(folder, 'video.mp4')
+    cache_inputs = ['translation.json', 'download.mp4']
+    cache_params = {'subtitle_mode': subtitle_mode}
+    if subtitle_mode == 'burn':
+        cache_params.update({'resolution': resolution, 'fps': fps})
+    if is_cached(folder, 'subtitle_video', cache_inputs, cache_params, ['video.mp4', 'subtitles.srt'],
+                 adopt_existing=False):
+        logger.info(f'Video already subtitled in {folder}')
+        record_cached()
+        return final_video
+
+    with open(translation_path, 'r', encoding='utf-8') as f:
+        translation = json.load(f)
+    record_items(len(translation), 'subtitles')
+    generate_srt(translation, srt_path)
+    # ASS 版本方便在播放器或剪辑软件里调整样式，转换失败不影响视频输出
+    result = subprocess.run(['ffmpeg', '-loglevel', 'error', '-i', srt_path, ass_path, '-y'],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        logger.warning(f"生成 ASS 字幕失败: {result.stderr.decode('utf-8', errors='ignore')[-500:]}")
+
+    if subtitle_mode == 'burn':
+        width, height = convert_resolution(get_aspect_ratio(input_video), resolution)
+        command = ['ffmpeg', '-i', input_video,
+                   '-vf', f'scale={width}:{height},{subtitle_filter(srt_path, width)}',
+                   '-map', '0:v', '-map', '0:a?', '-r', str(fps),
+                   '-c:v', 'libx264', '-c:a', 'copy', final_video, '-y']
+    else:
+        command = ['ffmpeg', '-i', input_video, '-i', srt_path,
+                   '-map', '0:v', '-map', '0:a?', '-map', '1:0',
+                   '-c', 'copy', '-c:s', 'mov_text', final_video, '-y']
+    logger.info(f"执行FFmpeg命令: {' '.join(command)}")
+    t_start = time.time()
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        logger.error(f"FFmpeg错误输出: {result.stderr.decode('utf-8', errors='ignore')[-2000:]}")
+        logger.error(f'字幕视频合成失败: {final_video}')
+        return None
+    logger.info(f'字幕视频合成完成（{subtitle_mode}），用时 {time.time() - t_start:.2f} 秒: {final_video}')
+    # video.mp4 已被覆盖，配音版本的缓存记录不再有效
+    invalidate(folder, 'video')
+    save_cache(folder, 'subtitle_video', cache_inputs, cache_params, ['video.mp4', 'subtitles.srt'])
+    clear_audio_store(folder)
     return final_video
 
 
@@ -364,7 +562,7 @@ def add_subtitles(video_path, srt_path, output_path, subtitle_filter=None, metho
                 except Exception as e:
                     logger.debug(f"无法删除临时文件 {temp_file}: {e}")
 
-def synthesize_all_video_under_folder(folder, subtitles=True, speed_up=1.00, fps=30, background_music=None, bgm_volume=0.5, video_volume=1.0, resolution='1080p', watermark_path="f_logo.png"):
+def synthesize_all_video_under_folder(folder, subtitles=True, speed_up=1.00, fps=30, background_music=None, bgm_volume=0.5, video_volume=1.0, resolution='1080p', watermark_path="f_logo.png", single_pass=True):
     watermark_path = None if not os.path.exists(watermark_path) else watermark_path
     output_video = None
     for root, dirs, files in os.walk(folder):
@@ -372,7 +570,8 @@ def synthesize_all_video_under_folder(folder, subtitles=True, speed_up=1.00, fps
             output_video = synthesize_video(root, subtitles=subtitles,
                             speed_up=speed_up, fps=fps, resolution=resolution,
                             background_music=background_music,
-                            watermark_path=watermark_path, bgm_volume=bgm_volume, video_volume=video_volume)
+                            watermark_path=watermark_path, bgm_volume=bgm_volume, video_volume=video_volume,
+                            single_pass=single_pass)
         # if 'download.mp4' in files and 'video.mp4' not in files:
         #     output_video = synthesize_video(root, subtitles=subtitles,
         #                      speed_up=speed_up, fps=fps, resolution=resolution,
@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 常驻进程池，在多个视频之间复用，避免每次都重新启动子进程
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+# 一批总时长低于该值时直接在当前进程处理，进程间传输数据反而更慢
+MIN_PARALLEL_SECONDS = 20
+
+
+def wsola(wav, ratio, sample_rate=24000, frame_seconds=0.03):
+    """
+    WSOLA 变速不变调，完全在内存中处理。
+    ratio 为输出时长与输入时长之比（>1 变慢，<1 变快），与 audiostretchy 的 ratio 含义相同。
+    每一帧在容差范围内搜索与上一帧自然延续最相似的位置，互相关用一次矩阵向量乘法算完。
+    """
+    wav = np.asarray(wav, dtype=np.float32)
+    out_length = int(round(len(wav) * ratio))
+    if abs(ratio - 1) < 1e-3 or len(wav) == 0:
+        return wav[:out_length].copy()
+
+    frame = max(2, int(sample_rate * frame_seconds) // 2 * 2)
+    synthesis_hop = frame // 2
+    tolerance = synthesis_hop // 2
+    analysis_hop = synthesis_hop / ratio
+    # 周期 Hann 窗在 50% 重叠时各帧权重之和恒为 1
+    window = np.hanning(frame + 1)[:-1].astype(np.float32)
+
+    num_frames = int(np.ceil((out_length + frame // 2) / synthesis_hop)) + 1
+    # 前面补半帧让第一帧以 0 时刻为中心，后面补足最后一帧及其搜索范围
+    left = frame // 2 + tolerance
+    right = int(np.ceil(num_frames * analysis_hop)) + 2 * frame + 2 * tolerance - len(wav)
+    padded = np.pad(wav, (left, max(right, frame)))
+
+    output = np.zeros(num_frames * synthesis_hop + frame, dtype=np.float32)
+    weights = np.zeros_like(output)
+    delta = 0
+    for k in range(num_frames):
+        position = int(k * analysis_hop) + tolerance + delta
+        output[k * synthesis_hop:k * synthesis_hop + frame] += padded[position:position + frame] * window
+        weights[k * synthesis_hop:k * synthesis_hop + frame] += window
+
+        natural = padded[position + synthesis_hop:position + synthesis_hop + frame]
+        nominal = int((k + 1) * analysis_hop)
+        candidates = sliding_window_view(padded[nominal:nominal + frame + 2 * tolerance], frame)
+        delta = int(np.argmax(candidates @ natural)) - tolerance
+
+    output /= np.maximum(weights, 1e-3)
+    return output[frame // 2:frame // 2 + out_length]
+
+
+def _stretch_job(job):
+    wav, ratio, sample_rate = job
+    return wsola(wav, ratio, sample_rate)
+
+
+def get_executor(max_workers):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # 主进程里已有 torch/CUDA、EdgeTTS 事件循环、预热和流水线线程，fork 会继承它们持有的锁而可能死锁，
+            # 这里用 spawn；子进程只导入本模块（仅依赖 numpy）来执行 _stretch_job，进程池常驻，启动开销只有一次
+            _executor = ProcessPoolExecutor(max_workers=max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _executor_workers = max_workers
+        return _executor
+
+
+def stretch_many(jobs, sample_rate=24000, max_workers=None):
+    """
+    批量变速：jobs 为 [(wav, ratio)]，按顺序返回变速后的数组。
+    进程数取 max_workers、TIME_STRETCH_WORKERS 环境变量或 CPU 核数（最多 8 个）。
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv('TIME_STRETCH_WORKERS', min(8, os.cpu_count() or 1)))
+    total_seconds = sum(len(wav) for wav, _ in jobs) / sample_rate
+    tasks = [(wav, ratio, sample_rate) for wav, ratio in jobs]
+    if max_workers <= 1 or len(jobs) < 2 or total_seconds < MIN_PARALLEL_SECONDS:
+        return [_stretch_job(task) for task in tasks]
+    chunksize = max(1, len(tasks) // (max_workers * 4))
+    return list(get_executor(max_workers).map(_stretch_job, tasks, chunksize=chunksize))
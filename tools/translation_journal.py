@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import threading
+
+from loguru import logger
+
+JOURNAL_NAME = 'translation.journal.jsonl'
+
+
+def prompt_hash(text, prompt, target_language, method, model=''):
+    """同一句原文在相同提示词、目标语言、方法和模型下的哈希，任何一项变化后旧记录都不再使用"""
+    return hashlib.sha256(json.dumps([text, prompt, target_language, method, model],
+                                     ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class TranslationJournal:
+    """
+    逐句翻译的追加式日志（每个视频文件夹一个 JSONL 文件）。
+    每句译文通过 valid_translation 校验后立即写入并落盘，翻译中途崩溃或重启后从日志继续，
+    已经完成的请求不会再发送一次。整个翻译完成、translation.json 写入后删除日志。
+    """
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, JOURNAL_NAME)
+        self.lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        self._truncate_partial_line()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    entries[record['index']] = record
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return entries
+
+    def _truncate_partial_line(self):
+        """崩溃时可能只写了半行，截断到最后一个换行符，否则之后追加的记录会接在半行后面而无法解析"""
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+                logger.warning(f'翻译日志末尾有不完整的记录，已截断: {self.path}')
+
+    def resume(self, texts, hashes):
+        """返回与 texts 对应的已完成译文，原文或提示词哈希不一致的记录视为无效"""
+        translations = [None] * len(texts)
+        for i, (text, digest) in enumerate(zip(texts, hashes)):
+            record = self.entries.get(i)
+            if record and record.get('text') == text and record.get('prompt_hash') == digest:
+                translations[i] = record['translation']
+        resumed = sum(translation is not None for translation in translations)
+        if resumed:
+            logger.info(f'从翻译日志恢复 {resumed}/{len(texts)} 句: {self.path}')
+        return translations
+
+    def record(self, index, text, translation, digest):
+        record = {'index': index, 'text': text, 'translation': translation, 'prompt_hash': digest}
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[index] = record
+
+    def remove(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.entries = {}
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from loguru import logger
+
+# 跨视频共享的翻译记忆：同一频道的片头、片尾、口播广告和口头禅在每一期都会出现，
+# 命中时直接复用之前的译文，不再请求翻译后端
+
+
+def normalize_text(text):
+    """宽松匹配用的归一化：统一全/半角和大小写，去掉标点，合并空白（ASR 对同一句话的断句和标点常常不一致）"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = ''.join(' ' if unicodedata.category(char).startswith('P') else char for char in text)
+    return ' '.join(text.split())
+
+
+def _hash(*parts):
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    """
+    以 (原文, 目标语言, 翻译方法, 模型) 为键的 SQLite 翻译记忆。
+    先按原文精确匹配，未命中时再按归一化后的原文匹配（可关闭）；条目超过 max_entries 时按最近使用时间淘汰。
+    """
+
+    def __init__(self, db_path='translation_memory.db', max_entries=100000, normalized=True):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.normalized = normalized
+        self.lock = threading.Lock()
+        self.counters = {'lookups': 0, 'exact_hits': 0, 'normalized_hits': 0, 'misses': 0,
+                         'stores': 0, 'evictions': 0}
+        self._stores_since_evict = 0
+        folder = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(folder, exist_ok=True)
+        # 网页界面和 API 服务可能同时使用同一个数据库
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS memory (
+                    key TEXT PRIMARY KEY,
+                    norm_key TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    target_language TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    hits INTEGER DEFAULT 0,
+                    created REAL,
+                    last_used REAL
+                )''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_memory_norm_key ON memory (norm_key)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_memory_last_used ON memory (last_used)')
+
+    @staticmethod
+    def _keys(text, target_language, method, model):
+        return (_hash(text, target_language, method, model),
+                _hash(normalize_text(text), target_language, method, model))
+
+    def lookup_many(self, texts, target_language, method, model='', normalized=None):
+        """返回与 texts 对应的译文列表，未命中的位置为 None"""
+        if normalized is None:
+            normalized = self.normalized
+        results = [None] * len(texts)
+        now = time.time()
+        with self.lock, self.conn:
+            for i, text in enumerate(texts):
+                if not text or not text.strip():
+                    continue
+                self.counters['lookups'] += 1
+                key, norm_key = self._keys(text, target_language, method, model)
+                row = self.conn.execute('SELECT key, translation FROM memory WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self.counters['exact_hits'] += 1
+                elif normalized:
+                    row = self.conn.execute(
+                        'SELECT key, translation FROM memory WHERE norm_key = ? ORDER BY hits DESC LIMIT 1',
+                        (norm_key,)).fetchone()
+                    if row is not None:
+                        self.counters['normalized_hits'] += 1
+                if row is None:
+                    self.counters['misses'] += 1
+                    continue
+                self.conn.execute('UPDATE memory SET hits = hits + 1, last_used = ? WHERE key = ?', (now, row[0]))
+                results[i] = row[1]
+        return results
+
+    def lookup(self, text, target_language, method, model='', normalized=None):
+        return self.lookup_many([text], target_language, method, model, normalized)[0]
+
+    def store(self, text, translation, target_language, method, model=''):
+        if not text or not text.strip() or not translation:
+            return
+        key, norm_key = self._keys(text, target_language, method, model)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute('''
+                INSERT INTO memory (key, norm_key, source, translation, target_language, method, model, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET translation = excluded.translation, last_used = excluded.last_used''',
+                              (key, norm_key, text, translation, target_language, method, model, now, now))
+            self.counters['stores'] += 1
+            self._stores_since_evict += 1
+            # 每写入一批检查一次容量，避免每条都统计行数
+            if self._stores_since_evict >= 100:
+                self._stores_since_evict = 0
+                self._evict()
+
+    def _evict(self):
+        count = self.conn.execute('SELECT COUNT(*) FROM memory').fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        self.conn.execute('DELETE FROM memory WHERE key IN (SELECT key FROM memory ORDER BY last_used ASC LIMIT ?)',
+                          (excess,))
+        self.counters['evictions'] += excess
+        logger.info(f'翻译记忆超过 {self.max_entries} 条，淘汰了 {excess} 条最久未使用的记录')
+
+    def stats(self):
+        with self.lock:
+            entries, total_hits = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM memory').fetchone()
+            counters = dict(self.counters)
+        hits = counters['exact_hits'] + counters['normalized_hits']
+        return {
+            'db_path': self.db_path,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'total_hits': total_hits,
+            'hit_rate': round(hits / counters['lookups'], 3) if counters['lookups'] else 0.0,
+            **counters,
+        }
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_translation_memory():
+    """
+    进程内共享的翻译记忆，第一次使用时才创建数据库。
+    TRANSLATION_MEMORY_PATH 设为空时关闭，返回 None。
+    """
+    global _memory
+    path = os.getenv('TRANSLATION_MEMORY_PATH', 'translation_memory.db')
+    if not path:
+        return None
+    with _memory_lock:
+        if _memory is None:
+            _memory = TranslationMemory(path,
+                                        max_entries=int(os.getenv('TRANSLATION_MEMORY_MAX_ENTRIES', 100000)),
+                                        normalized=os.getenv('TRANSLATION_MEMORY_NORMALIZED', '1') != '0')
+        return _memory
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from loguru import logger
+
+from .speaker_cache import reference_hash
+
+# 逐句合成音频的内容寻址缓存，在所有视频之间共享：
+# 键由归一化文本、后端、音色（EdgeTTS 的 voice 或参考音频的哈希）、语言和后端参数组成，
+# 译文修改后只有改动的句子需要重新合成，相同的句子（片头、口头禅等）也只合成一次
+
+
+def utterance_key(backend, text, target_language, voice=None, speaker_wav=None):
+    reference = reference_hash(speaker_wav) if speaker_wav and os.path.exists(speaker_wav) else None
+    params = {'model': backend.model_name, 'sample_rate': backend.sample_rate}
+    payload = [' '.join(text.split()), backend.name, voice, reference, target_language, params]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """
+    缓存目录下按 <键前两位>/<键>.wav 保存音频。取出时尽量用硬链接，不额外占用磁盘；
+    总大小超过 max_bytes 时按最近使用时间（命中时会更新修改时间）淘汰。
+    """
+
+    def __init__(self, folder='tts_cache', max_bytes=5 * 1024 ** 3):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def path(self, key):
+        return os.path.join(self.folder, key[:2], f'{key}.wav')
+
+    @staticmethod
+    def _link(source, target):
+        try:
+            os.link(source, target)
+        except OSError:
+            # 跨文件系统或不支持硬链接时退回复制
+            shutil.copy2(source, target)
+
+    def fetch(self, key, output_path):
+        """命中时把缓存音频放到 output_path 并返回 True"""
+        path = self.path(key)
+        if not os.path.exists(path):
+            with self.lock:
+                self.counters['misses'] += 1
+            return False
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        self._link(path, output_path)
+        os.utime(path)
+        with self.lock:
+            self.counters['hits'] += 1
+        return True
+
+    def store(self, key, output_path):
+        if not os.path.exists(output_path):
+            return
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        self._link(output_path, tmp_path)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.counters['stores'] += 1
+
+    def _files(self):
+        for root, dirs, files in os.walk(self.folder):
+            for file in files:
+                if file.endswith('.wav'):
+                    path = os.path.join(root, file)
+                    stat = os.stat(path)
+                    yield path, stat.st_size, stat.st_mtime
+
+    def evict(self):
+        if not os.path.exists(self.folder):
+            return
+        files = sorted(self._files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for path, size, _ in files:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        if removed:
+            with self.lock:
+                self.counters['evictions'] += removed
+            logger.info(f'语音合成缓存超过 {self.max_bytes / 1024 ** 3:.1f} GB，淘汰了 {removed} 条最久未使用的音频')
+
+    def stats(self):
+        files = list(self._files()) if os.path.exists(self.folder) else []
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'folder': self.folder,
+            'entries': len(files),
+            'size_mb': round(sum(size for _, size, _ in files) / 1024 ** 2, 1),
+            'max_mb': round(self.max_bytes / 1024 ** 2, 1),
+            'hit_rate': round(counters['hits'] / lookups, 3) if lookups else 0.0,
+            **counters,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """进程内共享的语音合成缓存；TTS_CACHE_DIR 设为空时关闭，返回 None"""
+    global _cache
+    folder = os.getenv('TTS_CACHE_DIR', 'tts_cache')
+    if not folder:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = TTSCache(folder, max_bytes=int(float(os.getenv('TTS_CACHE_MAX_GB', 5)) * 1024 ** 3))
+        return _cache
@@ -1,8 +1,12 @@
 import re
 import string
+import wave
 import numpy as np
 from scipy.io import wavfile
 
+# 写 wav 时每次换算的采样点数，避免为整条音轨再生成 float64 和 int16 两份副本
+WAV_WRITE_CHUNK = 1 << 20
+
 def sanitize_filename(filename: str) -> str:
     # Define a set of valid characters
     valid_chars = "-_.() %s%s" % (string.ascii_letters, string.digits)
@@ -22,8 +26,16 @@ def save_wav(wav: np.ndarray, output_path: str, sample_rate=24000):
     wavfile.write(output_path, sample_rate, wav_norm.astype(np.int16))
 
 def save_wav_norm(wav: np.ndarray, output_path: str, sample_rate=24000):
-    wav_norm = wav * (32767 / max(0.01, np.max(np.abs(wav))))
-    wavfile.write(output_path, sample_rate, wav_norm.astype(np.int16))
+    scale = 32767 / max(0.01, np.max(np.abs(wav)))
+    channels = 1 if wav.ndim == 1 else wav.shape[1]
+    with wave.open(output_path, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        # 分块缩放并转换为 int16，峰值归一化的结果与整段计算相同
+        for start in range(0, len(wav), WAV_WRITE_CHUNK):
+            chunk = wav[start:start + WAV_WRITE_CHUNK] * scale
+            f.writeframes(chunk.astype('<i2').tobytes())
     
 def normalize_wav(wav_path: str) -> None:
     sample_rate, wav = wavfile.read(wav_path)